@@ -0,0 +1,200 @@
+import hashlib
+import json
+import random
+import re
+import threading
+from types import SimpleNamespace
+
+EMBEDDING_DIMENSIONS = 1024
+
+THEMES = ["Pacte Dutreil", "DMTG", "Location meublée", "Revenus fonciers", "Plus-values"]
+CATEGORIES = [
+    "Instruction fiscale", "Réponse ministérielle", "Article de code", "Jurisprudence", "Texte législatif"
+]
+
+
+class _Query:
+    """Sous-ensemble du constructeur de requêtes postgrest utilisé par les collecteurs"""
+
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.filters = []
+        self.operation = 'select'
+        self.payload = None
+        self._limit = None
+        self._order = None
+
+    def select(self, *columns, **kwargs):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column, desc=False):
+        self._order = (column, desc)
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def insert(self, rows):
+        self.operation = 'insert'
+        self.payload = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, on_conflict=None, ignore_duplicates=False):
+        self.operation = 'upsert'
+        self.payload = (rows if isinstance(rows, list) else [rows], on_conflict, ignore_duplicates)
+        return self
+
+    def update(self, values):
+        self.operation = 'update'
+        self.payload = values
+        return self
+
+    def delete(self):
+        self.operation = 'delete'
+        return self
+
+    def execute(self):
+        return SimpleNamespace(data=self.db.execute(self))
+
+
+class FakeSupabase:
+    """Client Supabase en mémoire qui compte les allers-retours"""
+
+    def __init__(self):
+        self.round_trips = 0
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self.tables = {
+            'fiscal_themes': [{'id': i, 'name': name} for i, name in enumerate(THEMES, 1)],
+            'document_categories': [{'id': i, 'name': name} for i, name in enumerate(CATEGORIES, 1)],
+            'documents': []
+        }
+
+    def table(self, name):
+        return _Query(self, name)
+
+    def execute(self, query):
+        with self._lock:
+            self.round_trips += 1
+            rows = self.tables.setdefault(query.table, [])
+
+            if query.operation == 'insert':
+                return [self._insert(rows, row) for row in query.payload]
+
+            if query.operation == 'upsert':
+                new_rows, key, ignore_duplicates = query.payload
+                columns = key.split(',') if key else []
+                result = []
+                for row in new_rows:
+                    existing = next(
+                        (r for r in rows if columns and all(r.get(c) == row.get(c) for c in columns)),
+                        None
+                    )
+                    if existing is not None:
+                        if not ignore_duplicates:
+                            existing.update(row)
+                            result.append(dict(existing))
+                    else:
+                        result.append(self._insert(rows, row))
+                return result
+
+            matched = [row for row in rows if all(f(row) for f in query.filters)]
+            if query.operation == 'update':
+                for row in matched:
+                    row.update(query.payload)
+            elif query.operation == 'delete':
+                self.tables[query.table] = [row for row in rows if row not in matched]
+            if query._order:
+                column, desc = query._order
+                matched.sort(key=lambda row: row.get(column) or 0, reverse=desc)
+            if query._limit is not None:
+                matched = matched[:query._limit]
+            return [dict(row) for row in matched]
+
+    def _insert(self, rows, row):
+        row = dict(row)
+        row.setdefault('id', self._next_id)
+        self._next_id += 1
+        rows.append(row)
+        return dict(row)
+
+
+class _ChatCompletions:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, model, messages, **kwargs):
+        prompt = messages[-1]['content']
+        count = len(re.findall(r'^Texte \d+ :', prompt, re.M)) or 1
+        answer = json.dumps([THEMES[i % len(THEMES)] for i in range(count)], ensure_ascii=False)
+        usage = SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=len(answer) // 4,
+                                total_tokens=(len(prompt) + len(answer)) // 4)
+        with self.owner._lock:
+            self.owner.chat_calls += 1
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=answer))],
+            usage=usage
+        )
+
+
+def fake_embedding(text, dimensions=EMBEDDING_DIMENSIONS):
+    """Vecteur déterministe dérivé du texte"""
+    rng = random.Random(hashlib.sha256(text.encode()).digest())
+    return [round(rng.uniform(-1, 1), 6) for _ in range(dimensions)]
+
+
+def embeddings_payload(model, texts):
+    """Réponse au format de l'API /v1/embeddings"""
+    return {
+        'object': 'list',
+        'model': model,
+        'data': [{'object': 'embedding', 'index': i, 'embedding': fake_embedding(text)}
+                 for i, text in enumerate(texts)],
+        'usage': {'prompt_tokens': sum(len(text) // 4 for text in texts),
+                  'total_tokens': sum(len(text) // 4 for text in texts)}
+    }
+
+
+class _Embeddings:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, model, input, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input)
+        payload = embeddings_payload(model, texts)
+        with self.owner._lock:
+            self.owner.embedding_calls += 1
+        return SimpleNamespace(
+            data=[SimpleNamespace(**item) for item in payload['data']],
+            usage=SimpleNamespace(**payload['usage'])
+        )
+
+
+class FakeOpenAI:
+    """Client compatible OpenAI qui répond sans appel réseau"""
+
+    def __init__(self):
+        self.chat_calls = 0
+        self.embedding_calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=_ChatCompletions(self))
+        self.embeddings = _Embeddings(self)
+
+    @property
+    def round_trips(self):
+        return self.chat_calls + self.embedding_calls
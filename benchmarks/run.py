@@ -0,0 +1,331 @@
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'scripts')
+sys.path.insert(0, SCRIPTS_DIR)
+
+# Le serveur local ne doit pas être bridé par les budgets prévus pour les sites publics
+os.environ.setdefault('COLLECTOR_RATE_LIMITS', 'default=10000')
+
+from fakes import FakeOpenAI, FakeSupabase  # noqa: E402
+from server import FixtureServer  # noqa: E402
+
+from openai import OpenAI  # noqa: E402
+
+from collector import LegalDataCollector  # noqa: E402
+from embeddings import EmbeddingPipeline  # noqa: E402
+from judilibre import JudilibreClient  # noqa: E402
+from legifrance import LegifranceSearch  # noqa: E402
+from metrics import get_metrics  # noqa: E402
+from piste_client import PisteClient  # noqa: E402
+from test_collector import CGICollector  # noqa: E402
+from test_legifrance import HybridCollector  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values, pct):
+    """Percentile par rang le plus proche"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+class StageTimer:
+    """Chronomètre les étapes d'une itération"""
+
+    def __init__(self):
+        self.durations = {}
+
+    def run(self, stage, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.durations[stage] = self.durations.get(stage, 0.0) + time.perf_counter() - started
+
+
+# --- Scénarios ------------------------------------------------------------
+
+def legal_data_collector(server, options):
+    supabase, client = FakeSupabase(), FakeOpenAI()
+    collector = LegalDataCollector(
+        fetch_mode=options.fetch_mode,
+        write_mode=options.write_mode,
+        parser=options.parser,
+        supabase=supabase,
+        client=client
+    )
+    collector.bofip_urls = {
+        theme: [f"{server.url}/bofip/{t}{i:03d}-PGP" for i in range(options.pages_per_theme)]
+        for t, theme in enumerate(collector.bofip_urls)
+    }
+    collector.parliament_urls = {
+        source: f"{server.url}/rss/{source}.rss" for source in collector.parliament_urls
+    }
+    if options.embeddings:
+        # Vecteurs calculés par la route /v1/embeddings du serveur local, via le vrai client
+        collector.embeddings = EmbeddingPipeline(
+            OpenAI(base_url=f"{server.url}/v1", api_key='benchmark', max_retries=0),
+            supabase,
+            batch_size=options.embed_batch,
+            concurrency=options.embed_concurrency
+        )
+        collector.writer.on_written = collector.documents_written
+
+    timer = StageTimer()
+    timer.run('bofip', collector.collect_bofip)
+    timer.run('parliament', collector.collect_parliament_questions)
+    timer.run('finish', collector.finish)
+    return {
+        'documents': len(supabase.tables['documents']),
+        'stages': timer.durations,
+        'round_trips': supabase.round_trips + client.round_trips
+    }
+
+
+def judilibre_collector(server, options):
+    """Export Judilibre en flux : ``--judilibre-days`` jours de décisions"""
+    supabase, client = FakeSupabase(), FakeOpenAI()
+    collector = LegalDataCollector(supabase=supabase, client=client, full=True)
+    collector.judilibre = JudilibreClient(
+        PisteClient('benchmark', 'benchmark', base_url=f"{server.url}/judilibre",
+                    oauth_url=f"{server.url}/oauth"),
+        batch_size=options.judilibre_batch
+    )
+    collector.judilibre_days = options.judilibre_days - 1
+    timer = StageTimer()
+    timer.run('jurisprudence', collector.collect_jurisprudence)
+    timer.run('finish', collector.finish)
+    return {
+        'documents': len(supabase.tables['documents']),
+        'stages': timer.durations,
+        'round_trips': supabase.round_trips + client.round_trips
+    }
+
+
+def legifrance_collector(server, options):
+    """Recherches thématiques paginées puis récupération parallèle des articles"""
+    supabase, client = FakeSupabase(), FakeOpenAI()
+    collector = LegalDataCollector(supabase=supabase, client=client, full=True)
+    collector.legifrance = LegifranceSearch(
+        PisteClient('benchmark', 'benchmark', base_url=f"{server.url}/piste",
+                    oauth_url=f"{server.url}/oauth"),
+        page_size=options.legifrance_page_size,
+        concurrency=options.legifrance_concurrency
+    )
+    timer = StageTimer()
+    timer.run('legifrance', collector.collect_legifrance)
+    timer.run('finish', collector.finish)
+    return {
+        'documents': len(supabase.tables['documents']),
+        'stages': timer.durations,
+        'round_trips': supabase.round_trips + client.round_trips
+    }
+
+
+def reprocess_collector(server, options):
+    """Collecte BOFIP, flux, Judilibre et Légifrance, puis retraitement depuis les
+    seuls instantanés : aucune requête ne doit atteindre le serveur au retraitement"""
+    timer = StageTimer()
+    for scenario in (legal_data_collector, judilibre_collector, legifrance_collector):
+        timer.run('collect', scenario, server, options)
+    server.reset_counters()
+    supabase, client = FakeSupabase(), FakeOpenAI()
+    collector = LegalDataCollector(supabase=supabase, client=client, parser=options.parser)
+    timer.run('reprocess', collector.reprocess)
+    return {
+        'documents': len(supabase.tables['documents']),
+        'stages': timer.durations,
+        'round_trips': supabase.round_trips + client.round_trips
+    }
+
+
+def cgi_collector(mode, warm=False):
+    """Collecte du plan CGI ; avec ``warm``, une seconde exécution servie par le cache d'articles"""
+    def scenario(server, options):
+        def collector():
+            client = PisteClient('benchmark', 'benchmark', base_url=f"{server.url}/piste",
+                                 oauth_url=f"{server.url}/oauth")
+            return CGICollector(mode=mode, client=client, full=not warm)
+
+        timer = StageTimer()
+        cold = collector()
+        articles = timer.run('resolve', cold.collect)
+        cold.close()
+        if warm:
+            server.reset_counters()
+            cached = collector()
+            articles = timer.run('warm', cached.collect)
+            cached.close()
+        return {'documents': len(articles), 'stages': timer.durations, 'round_trips': 0}
+    return scenario
+
+
+def hybrid_collector(server, options):
+    client = PisteClient('benchmark', 'benchmark', base_url=f"{server.url}/piste",
+                         oauth_url=f"{server.url}/oauth")
+    collector = HybridCollector(client=client)
+    collector.legifrance_web = f"{server.url}/legifrance"
+    timer = StageTimer()
+    timer.run('cold', collector.test_collection)
+    timer.run('indexed', collector.test_collection)
+    client.close()
+    return {'documents': 6, 'stages': timer.durations, 'round_trips': 0}
+
+
+SCENARIOS = {
+    'legal_data_collector': legal_data_collector,
+    'cgi_toc': cgi_collector('toc'),
+    'cgi_search': cgi_collector('search'),
+    'cgi_single': cgi_collector('single'),
+    'cgi_single_cached': cgi_collector('single', warm=True),
+    'hybrid_collector': hybrid_collector,
+    'judilibre_collector': judilibre_collector,
+    'legifrance_collector': legifrance_collector,
+    'reprocess_collector': reprocess_collector
+}
+
+
+def run_iteration(name, server, options, trace_memory=False):
+    """Une exécution du scénario, caches vides"""
+    with tempfile.TemporaryDirectory() as cache:
+        os.environ['COLLECTOR_CACHE_DIR'] = cache
+        os.environ['COLLECTOR_METRICS_DIR'] = os.path.join(cache, 'metrics')
+        get_metrics().reset()
+        server.reset_counters()
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        result = SCENARIOS[name](server, options)
+        result['wall_time'] = time.perf_counter() - started
+        if trace_memory:
+            result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        result['http_requests'] = dict(server.requests)
+        result['round_trips'] += server.total_requests()
+        result['bytes_downloaded'] = server.bytes_sent
+        result['metrics'] = get_metrics().to_dict()['metrics']
+        return result
+
+
+def run_scenario(name, server, options):
+    """Exécute un scénario plusieurs fois ; la mémoire est mesurée sur une passe
+    séparée, tracemalloc ralentissant fortement l'analyse HTML"""
+    iterations = [run_iteration(name, server, options) for _ in range(options.iterations)]
+    peak_memory = run_iteration(name, server, options, trace_memory=True)['peak_memory']
+
+    documents = iterations[-1]['documents']
+    stages = sorted({stage for it in iterations for stage in it['stages']})
+    return {
+        'iterations': len(iterations),
+        'documents': documents,
+        'documents_per_sec': percentile(
+            [it['documents'] / it['wall_time'] for it in iterations if it['wall_time']], 50
+        ),
+        'wall_time': {'p50': percentile([it['wall_time'] for it in iterations], 50),
+                      'p95': percentile([it['wall_time'] for it in iterations], 95)},
+        'stage_latency': {
+            stage: {
+                'p50': percentile([it['stages'].get(stage, 0.0) for it in iterations], 50),
+                'p95': percentile([it['stages'].get(stage, 0.0) for it in iterations], 95)
+            }
+            for stage in stages
+        },
+        'peak_memory_bytes': peak_memory,
+        'round_trips_per_document': (
+            iterations[-1]['round_trips'] / documents if documents else None
+        ),
+        'http_requests': iterations[-1]['http_requests'],
+        'bytes_downloaded': iterations[-1]['bytes_downloaded'],
+        'metrics': iterations[-1]['metrics']
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Affiche l'évolution du débit et de la latence par rapport à une référence"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous or not previous.get('documents_per_sec') or not current.get('documents_per_sec'):
+            continue
+        speedup = current['documents_per_sec'] / previous['documents_per_sec']
+        print(f"{name}: {speedup:.2f}x documents/s "
+              f"({previous['documents_per_sec']:.1f} -> {current['documents_per_sec']:.1f}, "
+              f"référence {baseline.get('commit')})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai hors ligne des collecteurs")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help="Scénario à exécuter (répétable ; tous par défaut)")
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help="Latence simulée par requête HTTP (s)")
+    parser.add_argument('--pages-per-theme', type=int, default=10)
+    parser.add_argument('--fetch-mode', choices=('async', 'sequential'), default='async')
+    parser.add_argument('--write-mode', choices=('batch', 'single'), default='batch')
+    parser.add_argument('--parser', choices=('bs4', 'fast'), default='bs4')
+    parser.add_argument('--embeddings', action='store_true',
+                        help="Calcule les vecteurs des passages (serveur d'embeddings local)")
+    parser.add_argument('--embed-batch', type=int, default=64)
+    parser.add_argument('--embed-concurrency', type=int, default=4)
+    parser.add_argument('--judilibre-days', type=int, default=7,
+                        help="Jours de décisions exportés par le serveur Judilibre local")
+    parser.add_argument('--judilibre-batch', type=int, default=100)
+    parser.add_argument('--decisions-per-day', type=int, default=40)
+    parser.add_argument('--legifrance-page-size', type=int, default=100)
+    parser.add_argument('--legifrance-concurrency', type=int, default=8)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help="Fichier de résultats de référence")
+    options = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {
+        'commit': current_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'options': vars(options),
+        'scenarios': {}
+    }
+    with FixtureServer(latency=options.latency, decisions_per_day=options.decisions_per_day) as server:
+        for name in options.scenario or sorted(SCENARIOS):
+            results['scenarios'][name] = run_scenario(name, server, options)
+            summary = results['scenarios'][name]
+            print(f"{name}: {summary['documents']} documents, "
+                  f"{summary['documents_per_sec']:.1f} documents/s, "
+                  f"p50 {summary['wall_time']['p50']:.3f}s, "
+                  f"{summary['round_trips_per_document'] or 0:.2f} allers-retours/document")
+
+    with open(options.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Résultats écrits dans {options.output}")
+
+    if options.compare:
+        compare(results, options.compare)
+
+
+if __name__ == "__main__":
+    main()
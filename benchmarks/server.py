@@ -0,0 +1,217 @@
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from fakes import embeddings_payload
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+        return f.read()
+
+
+class FixtureServer:
+    """Serveur de rejeu démarré dans un thread d'arrière-plan"""
+
+    def __init__(self, latency=0.0, host='127.0.0.1', port=0, decisions_per_day=40):
+        self.latency = latency
+        self.decisions_per_day = decisions_per_day
+        self.requests = Counter()
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._fixtures = {
+            name: load_fixture(name)
+            for name in os.listdir(FIXTURES_DIR)
+            if os.path.isfile(os.path.join(FIXTURES_DIR, name))
+        }
+        self._search = json.loads(self._fixtures['piste_search.json'])
+        self._decisions = [
+            json.dumps(decision) for decision in
+            json.loads(self._fixtures['judilibre_decisions.json'])['decisions']
+        ]
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def total_requests(self):
+        with self._lock:
+            return sum(self.requests.values())
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests.clear()
+            self.bytes_sent = 0
+
+    # --- Routage ----------------------------------------------------------
+
+    def route(self, method, path, query, body):
+        """Retourne (route, statut, type de contenu, corps)"""
+        if method == 'GET' and path.startswith('/bofip/'):
+            doc_id = path.rsplit('/', 1)[-1]
+            page = self._fixtures['bofip_page.html'].replace(b'{doc_id}', doc_id.encode())
+            return 'bofip', 200, 'text/html; charset=utf-8', page
+
+        match = re.match(r'^/rss/(\w+)\.rss$', path)
+        if method == 'GET' and match:
+            feed = self._fixtures['questions.rss'].replace(b'{source}', match.group(1).encode())
+            return 'rss', 200, 'application/rss+xml; charset=utf-8', feed
+
+        if method == 'GET' and path == '/legifrance/search/code':
+            article = query.get('query', [''])[0].replace('article ', '')
+            page = self._fixtures['legifrance_search.html'].replace(b'{query}', article.encode())
+            return 'legifrance_web', 200, 'text/html; charset=utf-8', page
+
+        if method == 'POST' and path == '/v1/embeddings':
+            payload = json.loads(body or b'{}')
+            texts = payload.get('input') or []
+            texts = [texts] if isinstance(texts, str) else texts
+            response = embeddings_payload(payload.get('model'), texts)
+            return 'embeddings', 200, 'application/json', json.dumps(response).encode()
+
+        if method == 'GET' and path == '/judilibre/export':
+            return 'judilibre', 200, 'application/json', self._export_page(query)
+
+        if method == 'POST' and path == '/oauth':
+            return 'oauth', 200, 'application/json', self._fixtures['piste_oauth_token.json']
+
+        if method == 'POST' and path.startswith('/piste/'):
+            payload = json.loads(body or b'{}')
+            endpoint = path[len('/piste'):]
+            if endpoint == '/consult/legi/tableMatieres':
+                return 'piste', 200, 'application/json', self._fixtures['piste_table_matieres.json']
+            if endpoint == '/consult/getArticle':
+                article_id = payload.get('id') or payload.get('textId') or ''
+                article = self._fixtures['piste_get_article.json'].replace(
+                    b'{article_id}', article_id.encode()
+                )
+                return 'piste', 200, 'application/json', article
+            if endpoint in ('/search', '/consult/code'):
+                return 'piste', 200, 'application/json', self._search_page(payload)
+
+        return 'unknown', 404, 'text/plain', b'not found'
+
+    def _search_page(self, payload):
+        recherche = payload.get('recherche', {})
+        results = self._search['results']
+        for champ in recherche.get('champs', []):
+            if champ.get('typeChamp') == 'NUM_ARTICLE':
+                wanted = champ['criteres'][0]['valeur']
+                results = [r for r in results if r['sections'][0]['extracts'][0]['num'] == wanted]
+        page = recherche.get('pageNumber', 1)
+        size = recherche.get('pageSize', 10)
+        return json.dumps({
+            'totalResultNumber': len(results),
+            'results': results[(page - 1) * size:page * size]
+        }).encode()
+
+    def _export_page(self, query):
+        """Lot de l'export Judilibre : ``decisions_per_day`` décisions générées par
+        jour de la période, une sur deux en matière fiscale"""
+        start = date.fromisoformat(query['date_start'][0])
+        end = date.fromisoformat(query['date_end'][0])
+        batch = int(query.get('batch', ['0'])[0])
+        size = int(query.get('batch_size', ['10'])[0])
+        total = ((end - start).days + 1) * self.decisions_per_day
+
+        results = []
+        for index in range(batch * size, min(total, (batch + 1) * size)):
+            day = start + timedelta(days=index // self.decisions_per_day)
+            number = index % self.decisions_per_day
+            decision = self._decisions[number % len(self._decisions)] \
+                .replace('{id}', f"{day:%Y%m%d}{number:04d}") \
+                .replace('{number}', f"{day:%y}-{day:%j}.{number:03d}") \
+                .replace('{year}', str(day.year)) \
+                .replace('{date}', day.isoformat())
+            results.append(json.loads(decision))
+        next_batch = None
+        if (batch + 1) * size < total:
+            next_batch = (f"?batch={batch + 1}&batch_size={size}"
+                          f"&date_start={start}&date_end={end}")
+        return json.dumps({
+            'batch': batch,
+            'batch_size': size,
+            'total': total,
+            'previous_batch': None,
+            'next_batch': next_batch,
+            'results': results
+        }).encode()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _serve(self, method):
+                parts = urlsplit(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                route, status, content_type, payload = server.route(
+                    method, parts.path, parse_qs(parts.query), body
+                )
+                if server.latency:
+                    time.sleep(server.latency)
+                with server._lock:
+                    server.requests[route] += 1
+                    server.bytes_sent += len(payload)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._serve('GET')
+
+            def do_POST(self):
+                self._serve('POST')
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serveur local de rejeu des sources")
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--latency', type=float, default=0.05, help="Latence ajoutée par requête (s)")
+    args = parser.parse_args()
+
+    server = FixtureServer(latency=args.latency, port=args.port)
+    print(f"Serveur de rejeu sur {server.url}")
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
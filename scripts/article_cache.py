@@ -0,0 +1,184 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+import metrics
+from article_plan import canonical_article
+from http_cache import cache_dir
+
+logger = logging.getLogger(__name__)
+
+# Légifrance marque la fin d'une version toujours en vigueur par une date en
+# 2999 (32472144000000 ms) : au-delà de cette borne, la fin est inconnue
+OPEN_END = 32000000000000
+
+
+def version_date(day=None):
+    """Valeur de DATE_VERSION : minuit UTC du jour, en millisecondes.
+
+    Toutes les requêtes d'une même journée portent ainsi la même date et
+    désignent la même version des articles.
+    """
+    day = day or datetime.now(timezone.utc).date()
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def first_extract(result):
+    """Premier article d'une réponse de recherche, ou None"""
+    for item in (result or {}).get('results', []):
+        for section in item.get('sections', []):
+            for extract in section.get('extracts', []):
+                return extract
+    return None
+
+
+class ArticleCache:
+    """Cache local des articles Légifrance, par identifiant et période de validité.
+
+    Deux sortes d'entrées : le contenu d'un article, par identifiant LEGIARTI
+    (une version donnée ne change pas, il est servi sans revalidation), et le
+    résultat d'une recherche par numéro d'article, avec la période de
+    validité (``dateDebut``, ``dateFin``) de la version trouvée.
+
+    Un résultat de recherche est resservi tant que la date demandée tombe
+    dans cette période. Une version dont la fin est connue n'est jamais
+    revalidée avant cette date ; une version sans date de fin (en vigueur
+    jusqu'à nouvel ordre) l'est après ``max_age`` secondes. Les entrées les
+    moins récemment utilisées sont évincées au-delà de ``max_bytes``.
+    """
+
+    def __init__(self, path=None, max_bytes=50 * 1024 * 1024, max_age=7 * 24 * 3600):
+        self.path = path or os.path.join(cache_dir(), 'legifrance_articles.sqlite3')
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                article_id TEXT,
+                date_debut INTEGER,
+                date_fin INTEGER,
+                body TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                checked_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    # --- Contenu des articles -----------------------------------------------
+
+    def get_article(self, article_id):
+        """Réponse getArticle en cache pour un identifiant, ou None"""
+        entry = self._get(f"article:{article_id}")
+        self._count('article', entry is not None)
+        return entry and entry['body']
+
+    def store_article(self, article_id, response):
+        article = response.get('article') or {}
+        self._store(f"article:{article_id}", article_id, article.get('dateDebut'),
+                    article.get('dateFin'), response)
+
+    # --- Recherches par numéro ------------------------------------------------
+
+    def get_search(self, num, version=None):
+        """Résultat de recherche encore valable à la date ``version`` (ms), ou None"""
+        version = version or version_date()
+        entry = self._get(f"search:{canonical_article(num)}")
+        if entry is not None and not self._is_fresh(entry, version):
+            self.revalidations += 1
+            metrics.article_cache().inc(kind='search', outcome='revalidate')
+            return None
+        self._count('search', entry is not None)
+        return entry and entry['body']
+
+    def store_search(self, num, result):
+        extract = first_extract(result)
+        if extract is None:
+            return
+        self._store(f"search:{canonical_article(num)}", extract.get('id'), extract.get('dateDebut'),
+                    extract.get('dateFin'), result)
+
+    def _is_fresh(self, entry, version):
+        if entry['date_debut'] is not None and version < entry['date_debut']:
+            return False
+        if entry['date_fin'] is not None and entry['date_fin'] < OPEN_END:
+            return version < entry['date_fin']
+        return time.time() - entry['checked_at'] <= self.max_age
+
+    # --- Stockage -------------------------------------------------------------
+
+    def _get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT date_debut, date_fin, body, checked_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        date_debut, date_fin, body, checked_at = row
+        return {'date_debut': date_debut, 'date_fin': date_fin, 'body': json.loads(body),
+                'checked_at': checked_at}
+
+    def _store(self, key, article_id, date_debut, date_fin, body):
+        body = json.dumps(body, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO entries
+                    (key, article_id, date_debut, date_fin, body, size, checked_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key, article_id, date_debut, date_fin, body, len(body.encode()), now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM entries ORDER BY last_access ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def _count(self, kind, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.article_cache().inc(kind=kind, outcome='hit' if hit else 'miss')
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidations': self.revalidations,
+            'evictions': self.evictions,
+            'entries': entries,
+            'bytes': size
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,148 @@
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from article_plan import canonical_article
+from http_cache import cache_dir
+from piste_client import PisteClient
+
+# Identifiant du Code général des impôts
+CGI_TEXT_ID = "LEGITEXT000006069577"
+
+
+def fetch_cgi_toc(client, date=None):
+    """Récupère le sommaire du CGI à une date donnée (par défaut aujourd'hui)"""
+    payload = {
+        "textId": CGI_TEXT_ID,
+        "date": (date or datetime.now()).strftime("%Y-%m-%d"),
+        "nature": "CODE"
+    }
+    response = client.post("/consult/legi/tableMatieres", json=payload)
+    if response.status_code == 200:
+        return response.json()
+    logging.error(f"Erreur lors de la récupération du sommaire du CGI: {response.text}")
+    return None
+
+
+def iter_toc_articles(toc):
+    """Parcourt tous les articles d'un sommaire, sections imbriquées comprises"""
+    sections = list(toc.get('sections', []))
+    while sections:
+        section = sections.pop()
+        sections.extend(section.get('sections', []))
+        yield from section.get('articles', [])
+
+
+class ArticleIndex:
+    """Index local numéro d'article CGI -> identifiant LEGIARTI.
+
+    Une entrée est périmée quand la version indexée a cessé d'être en vigueur
+    (``date_fin`` dépassée) ou quand elle n'a pas été vérifiée depuis
+    ``max_age`` secondes.
+    """
+
+    def __init__(self, path=None, max_age=30 * 24 * 3600):
+        self.path = path or os.path.join(cache_dir(), 'article_index.sqlite3')
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS articles (
+                num TEXT PRIMARY KEY,
+                legiarti_id TEXT NOT NULL,
+                date_debut INTEGER,
+                date_fin INTEGER,
+                checked_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def lookup(self, num):
+        """Identifiant LEGIARTI à jour pour un numéro, ou None (absent ou périmé)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT legiarti_id, date_fin, checked_at FROM articles WHERE num = ?",
+                (canonical_article(num),)
+            ).fetchone()
+        if row is None:
+            return None
+        legiarti_id, date_fin, checked_at = row
+        if date_fin is not None and date_fin <= time.time() * 1000:
+            return None
+        if time.time() - checked_at > self.max_age:
+            return None
+        return legiarti_id
+
+    def store(self, num, legiarti_id, date_debut=None, date_fin=None):
+        self.store_many([(num, legiarti_id, date_debut, date_fin)])
+
+    def store_many(self, entries):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                """
+                INSERT OR REPLACE INTO articles (num, legiarti_id, date_debut, date_fin, checked_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                [
+                    (canonical_article(num), legiarti_id, date_debut, date_fin, now)
+                    for num, legiarti_id, date_debut, date_fin in entries
+                ]
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def rebuild(self, client):
+        """Remplit l'index en un seul passage sur le sommaire du CGI"""
+        toc = fetch_cgi_toc(client)
+        if toc is None:
+            return 0
+
+        valid = []
+        for article in iter_toc_articles(toc):
+            num, legiarti_id = article.get('num'), article.get('id')
+            if not num or not legiarti_id or article.get('etat', 'VIGUEUR') != 'VIGUEUR':
+                continue
+            try:
+                canonical_article(num)
+            except ValueError:
+                logging.warning(f"Numéro d'article ignoré : {num!r}")
+                continue
+            valid.append((num, legiarti_id, article.get('dateDebut'), article.get('dateFin')))
+
+        with self._lock:
+            self._conn.execute("DELETE FROM articles")
+            self._conn.commit()
+        self.store_many(valid)
+        logging.info(f"Index des articles reconstruit : {len(valid)} articles")
+        return len(valid)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Index local des identifiants LEGIARTI du CGI")
+    parser.add_argument('command', choices=('rebuild', 'lookup'))
+    parser.add_argument('article', nargs='?', help="Numéro d'article (commande lookup)")
+    args = parser.parse_args()
+
+    index = ArticleIndex()
+    if args.command == 'rebuild':
+        client = PisteClient()
+        if client.authenticate():
+            index.rebuild(client)
+    else:
+        logging.info(f"{args.article} -> {index.lookup(args.article)}")
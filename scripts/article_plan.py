@@ -0,0 +1,120 @@
+import re
+
+# Adverbes latins utilisés comme suffixes de numéros d'articles, dans l'ordre
+LATIN_SUFFIXES = [
+    'bis', 'ter', 'quater', 'quinquies', 'sexies', 'septies', 'octies', 'nonies',
+    'decies', 'undecies', 'duodecies', 'terdecies', 'quaterdecies', 'quindecies',
+    'sexdecies', 'septdecies', 'octodecies', 'novodecies', 'vicies'
+]
+_LATIN_RANK = {suffix: rank for rank, suffix in enumerate(LATIN_SUFFIXES)}
+
+_NUMBER_RE = re.compile(r'^(\d+)(?:-(\d+))?\s*(.*)$')
+
+# Rang des articles sans sous-numéro mais avec suffixe (« 150 A ») : après « 150-0 X »
+_SUFFIX_ONLY = 10 ** 6
+
+
+def canonical_article(num):
+    """Forme canonique d'un numéro d'article : « 150 a  BIS » -> « 150 A bis »"""
+    num = re.sub(r'\s+', ' ', str(num).strip())
+    match = _NUMBER_RE.match(num)
+    if not match:
+        raise ValueError(f"Numéro d'article invalide : {num!r}")
+    base, sub, rest = match.groups()
+    tokens = [t.lower() if t.lower() in _LATIN_RANK else t.upper() for t in rest.split()]
+    head = f"{int(base)}-{int(sub)}" if sub is not None else str(int(base))
+    return ' '.join([head] + tokens)
+
+
+def article_sort_key(num):
+    """Clé de tri suivant l'ordre du code : 150 < 150-0 A < 150 A < 150 A bis < 150 B"""
+    base, sub, rest = _NUMBER_RE.match(canonical_article(num)).groups()
+    tokens = tuple(
+        (0, _LATIN_RANK[t], '') if t in _LATIN_RANK else (1, 0, t)
+        for t in rest.split()
+    )
+    if sub is not None:
+        sub_key = int(sub)
+    elif tokens:
+        sub_key = _SUFFIX_ONLY
+    else:
+        sub_key = -1
+    return (int(base), sub_key, tokens)
+
+
+class ArticlePlan:
+    """Plan de collecte compilé : intervalles fusionnés et articles isolés.
+
+    ``identifiers()`` énumère les numéros connus sans consulter l'API (articles
+    isolés, bornes de toutes les spécifications, suffixes compris, et entiers
+    compris dans les intervalles) ; ``contains()`` permet de filtrer le
+    sommaire du code, qui contient aussi les autres numéros suffixés.
+    """
+
+    def __init__(self, intervals, singles, bounds=()):
+        self.intervals = intervals
+        self.singles = singles
+        # Bornes d'origine, y compris celles absorbées par la fusion des intervalles
+        self.bounds = set(bounds)
+
+    def contains(self, num):
+        try:
+            key = article_sort_key(num)
+        except ValueError:
+            return False
+        if canonical_article(num) in self.singles:
+            return True
+        return any(start[0] <= key <= end[0] for start, end in self.intervals)
+
+    def identifiers(self):
+        seen = set(self.singles) | self.bounds
+        for start, end in self.intervals:
+            seen.add(start[1])
+            seen.add(end[1])
+            for base in range(start[0][0], end[0][0] + 1):
+                if start[0] <= article_sort_key(str(base)) <= end[0]:
+                    seen.add(str(base))
+        return sorted(seen, key=article_sort_key)
+
+    def __len__(self):
+        return len(self.identifiers())
+
+
+def compile_plan(specs):
+    """Compile une liste de spécifications en plan dédoublonné.
+
+    Chaque spécification est un numéro (« 787 B »), un couple de bornes
+    incluses (« 750 ter », « 808 ») ou un ``range`` d'entiers.
+    """
+    intervals = []
+    singles = set()
+    bounds = set()
+    for spec in specs:
+        if isinstance(spec, range):
+            if len(spec):
+                spec = (str(spec[0]), str(spec[-1]))
+            else:
+                continue
+        if isinstance(spec, (tuple, list)) and len(spec) == 2:
+            start, end = canonical_article(spec[0]), canonical_article(spec[1])
+            start_key, end_key = article_sort_key(start), article_sort_key(end)
+            if start_key > end_key:
+                raise ValueError(f"Intervalle d'articles vide : {spec!r}")
+            intervals.append(((start_key, start), (end_key, end)))
+            bounds.update((start, end))
+        else:
+            singles.add(canonical_article(spec))
+
+    # Fusion des intervalles qui se chevauchent
+    intervals.sort()
+    merged = []
+    for start, end in intervals:
+        if merged and start[0] <= merged[-1][1][0]:
+            if end[0] > merged[-1][1][0]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+
+    # Les articles isolés compris dans un intervalle restent demandés un par un :
+    # identifiers() n'énumère que les entiers à l'intérieur des intervalles
+    return ArticlePlan(merged, singles, bounds)
@@ -0,0 +1,70 @@
+import hashlib
+import re
+import unicodedata
+from dataclasses import dataclass
+
+# Paragraphes sans valeur juridique, ignorés pour le calcul des empreintes :
+# numéros de paragraphe BOFIP (renumérotés à chaque mise à jour), mentions de
+# navigation et métadonnées de publication
+BOILERPLATE_PATTERNS = [
+    re.compile(r'^\d{1,4}$'),
+    re.compile(r'^(imprimer|partager|télécharger|permalien|haut de page|retour en haut)\b', re.I),
+    re.compile(r'^(date de publication|identifiant juridique|actualité liée)\s*:', re.I)
+]
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+@dataclass
+class Chunk:
+    position: int
+    hash: str
+    content: str
+
+
+def normalize_paragraph(text):
+    """Forme canonique d'un paragraphe : Unicode NFKC, espaces réduits"""
+    text = unicodedata.normalize('NFKC', text or '')
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def is_boilerplate(text):
+    return any(pattern.match(text) for pattern in BOILERPLATE_PATTERNS)
+
+
+def split_paragraphs(content):
+    """Découpe un texte brut (description RSS, texte d'article) en paragraphes"""
+    return [part for part in re.split(r'\n\s*\n|\r?\n', content or '') if part.strip()]
+
+
+def chunk_document(paragraphs):
+    """Paragraphes normalisés et empreints, hors mentions récurrentes"""
+    chunks = []
+    for paragraph in paragraphs:
+        text = normalize_paragraph(paragraph)
+        if not text or is_boilerplate(text):
+            continue
+        chunks.append(Chunk(
+            position=len(chunks),
+            hash=hashlib.sha256(text.encode()).hexdigest(),
+            content=text
+        ))
+    return chunks
+
+
+def chunks_hash(chunk_hashes):
+    """Empreinte du document normalisé : insensible aux espaces et aux mentions récurrentes"""
+    return hashlib.sha256('\n'.join(chunk_hashes).encode()).hexdigest()
+
+
+def diff_chunks(previous_hashes, chunks):
+    """Retourne (paragraphes nouveaux, empreintes disparues) par rapport à la version précédente"""
+    previous = set(previous_hashes)
+    current = {chunk.hash for chunk in chunks}
+    added, seen = [], set()
+    for chunk in chunks:
+        if chunk.hash not in previous and chunk.hash not in seen:
+            added.append(chunk)
+            seen.add(chunk.hash)
+    removed = [h for h in dict.fromkeys(previous_hashes) if h not in current]
+    return added, removed
@@ -0,0 +1,262 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import metrics
+from http_cache import cache_dir
+from rate_limiter import get_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+THEMES = ["Pacte Dutreil", "DMTG", "Location meublée", "Revenus fonciers", "Plus-values"]
+
+# Lexique pondéré par thème (texte normalisé : minuscules, sans accents).
+# Les expressions de plusieurs mots sont plus discriminantes et pèsent plus.
+THEME_KEYWORDS = {
+    "Pacte Dutreil": [
+        "dutreil", "787 b", "787 c", "engagement collectif de conservation",
+        "engagement individuel de conservation", "transmission d'entreprise",
+        "holding animatrice", "entreprise familiale"
+    ],
+    "DMTG": [
+        "droits de mutation a titre gratuit", "dmtg", "succession", "donation",
+        "donation-partage", "droits de succession", "heritier", "legs", "abattement personnel"
+    ],
+    "Location meublée": [
+        "location meublee", "locations meublees", "lmnp", "lmp", "loueur en meuble",
+        "loueurs en meuble", "meuble de tourisme", "meubles de tourisme", "para-hotelier"
+    ],
+    "Revenus fonciers": [
+        "revenus fonciers", "revenu foncier", "micro-foncier", "deficit foncier",
+        "location nue", "proprietaire bailleur", "proprietaires bailleurs", "loyers"
+    ],
+    "Plus-values": [
+        "plus-value", "plus-values", "plus value", "plus values",
+        "abattement pour duree de detention", "valeurs mobilieres", "150 u", "150-0 a",
+        "prix d'acquisition"
+    ]
+}
+
+
+def normalize_text(text):
+    """Minuscules, sans accents, espaces compactés"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = text.replace('’', "'")
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+
+def classification_key(title, description):
+    """Clé de cache : empreinte du texte réellement envoyé au classifieur"""
+    text = f"{title}\n\n{(description or '')[:500]}"
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class KeywordClassifier:
+    """Classifieur local par mots-clés pondérés sur les cinq thèmes fiscaux"""
+
+    def __init__(self, keywords=None, min_score=2.0):
+        self.min_score = min_score
+        self._patterns = {
+            theme: [
+                (re.compile(r'(?<!\w)' + re.escape(normalize_text(kw)) + r'(?!\w)'),
+                 2.0 if ' ' in kw else 1.0)
+                for kw in kws
+            ]
+            for theme, kws in (keywords or THEME_KEYWORDS).items()
+        }
+
+    def scores(self, text):
+        text = normalize_text(text)
+        return {
+            theme: sum(weight * len(pattern.findall(text)) for pattern, weight in patterns)
+            for theme, patterns in self._patterns.items()
+        }
+
+    def predict(self, text):
+        """Retourne (thème, confiance) ; confiance = part du meilleur score"""
+        scores = self.scores(text)
+        total = sum(scores.values())
+        theme = max(scores, key=scores.get)
+        if scores[theme] < self.min_score:
+            return None, 0.0
+        return theme, scores[theme] / total
+
+    def is_relevant(self, text):
+        return any(score > 0 for score in self.scores(text).values())
+
+
+class ClassificationCache:
+    """Cache persistant des thèmes attribués, indexé par empreinte du contenu"""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(cache_dir(), 'classifications.sqlite3')
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS classifications (
+                content_hash TEXT PRIMARY KEY,
+                theme TEXT NOT NULL,
+                source TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT content_hash, theme FROM classifications "
+                f"WHERE content_hash IN ({','.join('?' * len(keys))})",
+                list(keys)
+            ).fetchall()
+        return dict(rows)
+
+    def put_many(self, entries, source):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO classifications (content_hash, theme, source) VALUES (?, ?, ?)",
+                [(key, theme, source) for key, theme in entries.items()]
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ThemeClassifier:
+    """Classification des documents : cache, puis mots-clés, puis LLM par lots.
+
+    Le modèle n'est appelé que pour les textes absents du cache et pour
+    lesquels le classifieur local n'atteint pas ``confidence_threshold`` ;
+    ces textes sont envoyés par lots de ``batch_size`` dans une seule requête.
+    """
+
+    def __init__(self, client, model="mistral-medium", batch_size=10, confidence_threshold=0.6,
+                 cache=None, local=None, limiter=None):
+        self.client = client
+        self.model = model
+        self.batch_size = batch_size
+        self.confidence_threshold = confidence_threshold
+        self.cache = cache or ClassificationCache()
+        self.local = local or KeywordClassifier()
+        self.limiter = limiter or get_rate_limiter()
+        self.stats = {'cache': 0, 'local': 0, 'llm': 0, 'llm_calls': 0}
+
+    def classify(self, title, description):
+        return self.classify_batch([(title, description)])[0]
+
+    def close(self):
+        self.cache.close()
+
+    def classify_batch(self, items):
+        """Classe une liste de (titre, description) ; retourne les thèmes dans l'ordre"""
+        keys = [classification_key(title, description) for title, description in items]
+        results = self.cache.get_many(set(keys))
+        cached = sum(1 for key in keys if key in results)
+        self.stats['cache'] += cached
+        metrics.classifications().inc(cached, origin='cache')
+
+        local_results = {}
+        pending = {}
+        for key, (title, description) in zip(keys, items):
+            if key in results or key in local_results or key in pending:
+                continue
+            theme, confidence = self.local.predict(f"{title}\n{description}")
+            if theme and confidence >= self.confidence_threshold:
+                local_results[key] = theme
+            else:
+                pending[key] = (title, description)
+        self.stats['local'] += len(local_results)
+        metrics.classifications().inc(len(local_results), origin='local')
+        if local_results:
+            self.cache.put_many(local_results, 'local')
+            results.update(local_results)
+
+        pending_keys = list(pending)
+        for start in range(0, len(pending_keys), self.batch_size):
+            batch_keys = pending_keys[start:start + self.batch_size]
+            themes = self._classify_with_llm([pending[key] for key in batch_keys])
+            llm_results = {key: theme for key, theme in zip(batch_keys, themes) if theme}
+            self.stats['llm'] += len(llm_results)
+            metrics.classifications().inc(len(llm_results), origin='llm')
+            if llm_results:
+                self.cache.put_many(llm_results, 'llm')
+                results.update(llm_results)
+
+        return [results.get(key) for key in keys]
+
+    def _classify_with_llm(self, items):
+        texts = "\n\n".join(
+            f"Texte {i} : {title}\n\n{(description or '')[:500]}"
+            for i, (title, description) in enumerate(items, 1)
+        )
+        messages = [
+            {"role": "system", "content": "Vous êtes un expert en classification fiscale."},
+            {"role": "user", "content": (
+                f"Classez chacun des {len(items)} textes suivants dans un des thèmes suivants : "
+                f"{', '.join(THEMES)}. Répondez uniquement par une liste JSON contenant "
+                f"le thème de chaque texte, dans l'ordre.\n\n{texts}"
+            )}
+        ]
+        attempt = 0
+        while True:
+            self.limiter.acquire('mistral')
+            started = time.monotonic()
+            try:
+                self.stats['llm_calls'] += 1
+                chat_completion = self.client.chat.completions.create(model=self.model, messages=messages)
+            except Exception as e:
+                # Les erreurs du client OpenAI portent le statut HTTP (429, 503...)
+                status = getattr(e, 'status_code', 0)
+                headers = getattr(getattr(e, 'response', None), 'headers', None)
+                delay = self.limiter.record('mistral', status, time.monotonic() - started, headers, attempt)
+                metrics.llm_calls().inc(model=self.model, outcome='error')
+                if delay is None:
+                    logger.error(f"Erreur classification : {str(e)}")
+                    return [None] * len(items)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            latency = time.monotonic() - started
+            self.limiter.record('mistral', 200, latency)
+            self._observe_completion(chat_completion, latency)
+            answer = chat_completion.choices[0].message.content
+            return self._parse_answer(answer, len(items))
+
+    def _observe_completion(self, completion, latency):
+        metrics.llm_calls().inc(model=self.model, outcome='ok')
+        metrics.llm_latency().observe(latency, model=self.model)
+        usage = getattr(completion, 'usage', None)
+        for kind in ('prompt_tokens', 'completion_tokens'):
+            tokens = getattr(usage, kind, None)
+            if tokens:
+                metrics.llm_tokens().inc(tokens, model=self.model, kind=kind.split('_')[0])
+
+    def _parse_answer(self, answer, expected):
+        match = re.search(r'\[.*\]', answer or '', re.S)
+        try:
+            labels = json.loads(match.group(0)) if match else []
+        except ValueError:
+            labels = []
+        if len(labels) != expected:
+            logger.warning(f"Réponse de classification inattendue : {answer!r}")
+            return [None] * expected
+        return [match_theme(label) for label in labels]
+
+
+def match_theme(label):
+    """Ramène une réponse libre du modèle à l'un des thèmes connus"""
+    label = normalize_text(str(label))
+    for theme in THEMES:
+        if normalize_text(theme) in label:
+            return theme
+    return None
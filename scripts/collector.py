@@ -1,12 +1,34 @@
 from supabase import create_client
 from openai import OpenAI
-import requests
-from bs4 import BeautifulSoup
+import argparse
 import os
 import json
 import logging
-from datetime import datetime, timedelta
+import threading
+from datetime import date, datetime, timedelta
 import hashlib
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import metrics
+import parsing
+from article_cache import ArticleCache
+from fetcher import Fetcher
+from http_cache import HttpCache
+from judilibre import ExportCursor, JudilibreClient, decision_content, decision_title, decision_url
+from legifrance import FONDS, THEME_QUERIES, LegifranceSearch, article_title, article_url
+from supabase_writer import DocumentWriter, document_hash
+from classifier import KeywordClassifier, ThemeClassifier
+from embeddings import EMBEDDING_MODEL, EmbeddingPipeline
+from search_index import SearchIndex
+from sharding import Shard, shard_from_env
+from snapshots import SnapshotStore, load_snapshot
+from journal import ProgressJournal
+from near_duplicates import DEFAULT_THRESHOLD, NearDuplicateIndex
+from pipeline import DEFAULT_QUEUE_SIZE, Pipeline, Stage, workers_from_env
+from scheduler import DEFAULT_BUDGET, SourceScheduler, budgets_from_env, check_cancelled, write_report
+from watermarks import WatermarkStore, parse_pub_date
 
 # Configuration du logging
 logging.basicConfig(
@@ -15,16 +37,119 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Longueur du début de décision examiné pour le filtrage et la classification
+JURISPRUDENCE_EXCERPT = 3000
+
 class LegalDataCollector:
-    def __init__(self):
-        self.supabase = create_client(
+    def __init__(self, fetch_mode=None, write_mode=None, full=False, parser=None,
+                 supabase=None, client=None, shard=None):
+        self.supabase = supabase or create_client(
             os.environ.get("SUPABASE_URL"),
             os.environ.get("SUPABASE_KEY")
         )
-        self.client = OpenAI(
+        # Nouveaux essais confiés au limiteur partagé (classification, vecteurs) :
+        # ceux du client OpenAI s'y ajouteraient
+        self.client = client or OpenAI(
             base_url="https://api.mistral.ai/v1",
-            api_key=os.environ.get("MISTRAL_API_KEY")
+            api_key=os.environ.get("MISTRAL_API_KEY"),
+            max_retries=0
+        )
+
+        # Couche de récupération HTTP partagée par toutes les sources,
+        # avec cache conditionnel persistant entre deux exécutions ; une page
+        # n'est tenue pour inchangée qu'une fois ses documents écrits (validate)
+        self.http_cache = HttpCache(
+            max_bytes=int(os.environ.get("COLLECTOR_HTTP_CACHE_MAX_MB", "200")) * 1024 * 1024,
+            deferred=True
+        )
+        self.fetcher = Fetcher(
+            mode=fetch_mode or os.environ.get("COLLECTOR_FETCH_MODE", "async"),
+            per_host_limit=int(os.environ.get("COLLECTOR_PER_HOST_LIMIT", "4")),
+            cache=self.http_cache
+        )
+
+        # Réponses brutes compressées, pour réextraire sans retélécharger (--reprocess),
+        # bornées en taille et en durée de conservation
+        self.snapshots = None
+        if os.environ.get("COLLECTOR_SNAPSHOTS", "1") == "1":
+            self.snapshots = SnapshotStore(
+                max_bytes=int(os.environ.get("COLLECTOR_SNAPSHOTS_MAX_MB", "500")) * 1024 * 1024,
+                max_age=float(os.environ.get("COLLECTOR_SNAPSHOTS_DAYS", "30")) * 24 * 3600
+            )
+
+        # Vecteurs des passages pour le chatbot, calculés après l'écriture des documents
+        self.embeddings = None
+        if os.environ.get("COLLECTOR_EMBEDDINGS") == "1":
+            self.embeddings = EmbeddingPipeline(
+                self.client,
+                self.supabase,
+                model=os.environ.get("COLLECTOR_EMBED_MODEL", EMBEDDING_MODEL),
+                batch_size=int(os.environ.get("COLLECTOR_EMBED_BATCH", "64")),
+                concurrency=int(os.environ.get("COLLECTOR_EMBED_CONCURRENCY", "4"))
+            )
+
+        # Index plein texte local (BM25) des documents écrits, pour la recherche hors ligne
+        self.search_index = SearchIndex() if os.environ.get("COLLECTOR_SEARCH_INDEX") == "1" else None
+
+        # Écriture Supabase : 'batch' (par lots) ou 'single' (document par document, pour le débogage)
+        self.write_mode = write_mode or os.environ.get("COLLECTOR_WRITE_MODE", "batch")
+        self.writer = DocumentWriter(
+            self.supabase,
+            batch_size=int(os.environ.get("COLLECTOR_BATCH_SIZE", "50")),
+            upsert=os.environ.get("COLLECTOR_UPSERT") == "1",
+            # Stockage différentiel par paragraphes (tables document_chunks et document_versions)
+            versioning=os.environ.get("COLLECTOR_DELTA_STORAGE") == "1",
+            on_written=self.documents_written if self.embeddings or self.search_index is not None else None
+        )
+
+        # Classification : cache persistant, mots-clés locaux, puis LLM par lots
+        self.classifier = ThemeClassifier(
+            self.client,
+            batch_size=int(os.environ.get("COLLECTOR_CLASSIFY_BATCH", "10")),
+            confidence_threshold=float(os.environ.get("COLLECTOR_LOCAL_CONFIDENCE", "0.6"))
         )
+
+        # Quasi-doublons entre flux parlementaires (MinHash/LSH), écartés avant classification
+        self.near_duplicates = None
+        if os.environ.get("COLLECTOR_NEAR_DUPLICATES", "1") == "1":
+            self.near_duplicates = NearDuplicateIndex(
+                threshold=float(os.environ.get("COLLECTOR_NEAR_DUP_THRESHOLD", DEFAULT_THRESHOLD))
+            )
+
+        # Collecte répartie (--shard i/N, COLLECTOR_SHARD) : seules les unités de
+        # travail dont l'empreinte de la clé revient à ce fragment sont traitées
+        self.shard = shard or shard_from_env()
+
+        # Marques de niveau haut par source ; full=True force une collecte complète
+        self.full = full
+        self.watermarks = WatermarkStore(full=full)
+
+        # Journaux d'avancement, un par source : une exécution interrompue reprend après
+        # la dernière unité validée (page, article, élément de flux) sans la récupérer ni
+        # l'écrire à nouveau ; chaque journal est clos dès que sa source a abouti
+        self.journals = {}
+        if os.environ.get("COLLECTOR_JOURNAL", "1") == "1":
+            self.journals = {
+                source: ProgressJournal(f"collector_{source}", run={'full': full, 'shard': str(self.shard)})
+                for source in ('bofip', 'legifrance', 'parliament')
+            }
+
+        # Analyse HTML/RSS : 'bs4' (BeautifulSoup) ou 'fast' (lxml, lecture RSS en flux),
+        # éventuellement répartie sur un pool de processus
+        self.fast_parser = (parser or os.environ.get("COLLECTOR_PARSER", "bs4")) == "fast"
+        self.parse_workers = int(os.environ.get("COLLECTOR_PARSE_WORKERS", "0"))
+        self._parse_pool = None
+        self._lock = threading.Lock()
+        # Par URL de flux : éléments pas encore écrits et date du plus récent élément lu
+        self._feed_pending = {}
+        # Par représentant en cours d'écriture : quasi-doublons (source, flux, guid) à
+        # marquer comme vus une fois le représentant écrit
+        self._cluster_variants = {}
+
+        # Étapes de collecte (récupération, extraction, classification, écriture) reliées
+        # par des files bornées : threads par étape (COLLECTOR_STAGE_WORKERS) et capacité
+        self.stage_workers = workers_from_env({'fetch': 8, 'extract': 2, 'classify': 1, 'persist': 1})
+        self.queue_size = int(os.environ.get("COLLECTOR_QUEUE_SIZE", DEFAULT_QUEUE_SIZE))
         
         # URLs des sources BOFIP par thème
         self.bofip_urls = {
@@ -58,119 +183,537 @@ class LegalDataCollector:
             "conseil_etat": "https://www.conseil-etat.fr/decisions-de-justice"
         }
 
+        # Export Judilibre (Cour de cassation), créé à la première collecte ;
+        # première exécution : décisions des COLLECTOR_JUDILIBRE_DAYS derniers jours
+        self.judilibre = None
+
+        # Recherche Légifrance (API PISTE), créée à la première collecte, et cache
+        # des articles par identifiant de version
+        self.legifrance = None
+        self.article_cache = None
+        self.judilibre_days = int(os.environ.get("COLLECTOR_JUDILIBRE_DAYS", "30"))
+
     def collect_all(self):
-        """Collecte les données de toutes les sources"""
+        """Collecte les données de toutes les sources, en parallèle.
+
+        Chaque source a son propre budget de temps (COLLECTOR_SOURCE_BUDGETS,
+        sinon COLLECTOR_SOURCE_BUDGET) ; une source lente ou en échec
+        n'empêche pas les autres d'aboutir. Retourne le rapport d'exécution.
+        """
+        logger.info("Début de la collecte complète")
+        scheduler = SourceScheduler(
+            budgets=budgets_from_env(),
+            default_budget=float(os.environ.get("COLLECTOR_SOURCE_BUDGET", DEFAULT_BUDGET))
+        )
         try:
-            logger.info("Début de la collecte complète")
-            
-            # BOFIP
-            self.collect_bofip()
-            
-            # Légifrance (nécessite une API key)
-            self.collect_legifrance()
-            
-            # Questions parlementaires
-            self.collect_parliament_questions()
-            
-            # Jurisprudence
-            self.collect_jurisprudence()
-            
+            report = scheduler.run([
+                # BOFIP
+                ('bofip', self.collect_bofip),
+                # Légifrance (nécessite une API key)
+                ('legifrance', self.collect_legifrance),
+                # Questions parlementaires
+                ('parliament', self.collect_parliament_questions),
+                # Jurisprudence
+                ('jurisprudence', self.collect_jurisprudence)
+            ])
             logger.info("Fin de la collecte complète")
-            
-        except Exception as e:
-            logger.error(f"Erreur lors de la collecte : {str(e)}")
+        finally:
+            # Une source abandonnée utilise encore l'écriture, les caches et les sessions
+            scheduler.join()
+            self.finish()
+
+        for source in report['sources']:
+            journal = self.journals.get(source['source'])
+            if journal is not None and source['status'] == 'ok':
+                journal.complete()
+        report['writer'] = self.writer.stats()
+        if self.shard.count > 1:
+            report['shard'] = str(self.shard)
+        try:
+            write_report(report)
+        except OSError as e:
+            logger.error(f"Erreur écriture du rapport : {str(e)}")
+        return report
+
+    def documents_written(self, documents):
+        """Transmet les documents écrits aux étapes suivantes (vecteurs, index de recherche)"""
+        if self.embeddings:
+            self.embeddings.add_documents(documents)
+        if self.search_index is not None:
+            try:
+                self.search_index.add_documents(documents)
+            except OSError as e:
+                logger.error(f"Erreur indexation plein texte : {str(e)}")
+
+    def finish(self):
+        """Écrit les documents en attente, enregistre les marques et libère les ressources"""
+        with metrics.source_duration().time(source='finish'):
+            self.writer.flush()
+        logger.info(f"Écriture Supabase : {self.writer.stats()}")
+        if self.embeddings:
+            with metrics.source_duration().time(source='embeddings'):
+                self.embeddings.flush()
+            logger.info(f"Vecteurs : {self.embeddings.stats}")
+            self.embeddings.close()
+        if self.search_index is not None:
+            self.search_index.optimize()
+            logger.info(f"Index de recherche : {len(self.search_index)} documents")
+            self.search_index.close()
+        self.watermarks.save()
+        for journal in self.journals.values():
+            journal.close()
+        if self.near_duplicates is not None:
+            self.near_duplicates.close()
+        self.fetcher.close()
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown()
+        if self.snapshots is not None:
+            self.snapshots.close()
+        if self.judilibre is not None:
+            self.judilibre.close()
+        if self.legifrance is not None:
+            self.legifrance.client.close()
+        if self.article_cache is not None:
+            logger.info(f"Cache des articles : {self.article_cache.stats()}")
+            self.article_cache.close()
+        logger.info(f"Cache HTTP : {self.http_cache.stats()}")
+        logger.info(f"Classification : {self.classifier.stats}")
+        self.classifier.close()
+        self.http_cache.close()
+        try:
+            metrics.get_metrics().write()
+        except OSError as e:
+            logger.error(f"Erreur écriture des métriques : {str(e)}")
 
     def collect_bofip(self):
-        """Collecte les documents du BOFIP"""
+        """Collecte les documents du BOFIP : récupération → extraction → écriture"""
         try:
-            for theme, urls in self.bofip_urls.items():
-                for url in urls:
-                    logger.info(f"Collecte BOFIP pour {theme} : {url}")
-                    response = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'})
-                    
-                    if response.status_code == 200:
-                        soup = BeautifulSoup(response.content, 'html.parser')
-                        
-                        # Extraction contenu
-                        content = self.extract_content(soup)
-                        if content:
-                            self.save_document(
-                                title=soup.find('h1').text.strip() if soup.find('h1') else url,
-                                content=content,
-                                source_url=url,
-                                theme=theme,
-                                doc_type='Instruction fiscale'
-                            )
+            targets = [
+                (theme, url) for theme, urls in self.bofip_urls.items() for url in urls
+                if self.shard.owns(url)
+            ]
+            self.pipeline('bofip', [
+                Stage('fetch', self._fetch_bofip, workers=self.stage_workers['fetch']),
+                Stage('extract', self._extract_bofip, workers=self.stage_workers['extract']),
+                Stage('persist', partial(self._persist, 'bofip'), workers=self.stage_workers['persist'])
+            ]).run(targets)
         except Exception as e:
             logger.error(f"Erreur BOFIP : {str(e)}")
+            raise
+
+    def _fetch_bofip(self, target):
+        theme, url = target
+        if self.resumed('bofip', url):
+            logger.info(f"Page BOFIP déjà écrite avant l'interruption, ignorée : {url}")
+            return None
+        logger.info(f"Collecte BOFIP pour {theme} : {url}")
+        response = self.fetcher.fetch(url)
+        if not response.ok:
+            return None
+        # Tampon de publication connu avant analyse : en-tête Last-Modified
+        stamp = parse_pub_date(response.headers.get('Last-Modified'))
+        self.snapshot('bofip', url, response.content, {'theme': theme, 'stamp': stamp})
+        if response.unchanged and not self.full:
+            logger.info(f"Page BOFIP inchangée, ignorée : {url}")
+            return None
+        if not self.watermarks.is_new(f"bofip:{url}", stamp):
+            logger.info(f"Page BOFIP déjà traitée ({stamp}), ignorée : {url}")
+            self.http_cache.validate(url)
+            return None
+        return theme, url, stamp, response.content
+
+    def _extract_bofip(self, fetched):
+        theme, url, stamp, content = fetched
+        with metrics.parse_time().time(source='bofip'):
+            page = self.extract_page(content)
+        stamp = stamp or page.stamp
+        if not self.watermarks.is_new(f"bofip:{url}", stamp):
+            logger.info(f"Page BOFIP déjà traitée ({stamp}), ignorée : {url}")
+            self.http_cache.validate(url)
+            return None
+        if not page.content:
+            self._bofip_written(url, stamp)
+            return None
+        document = {
+            'title': page.title or url,
+            'content': page.content,
+            'source_url': url,
+            'theme': theme,
+            'doc_type': 'Instruction fiscale',
+            'paragraphs': page.paragraphs
+        }
+        return document, partial(self._bofip_written, url, stamp)
+
+    def _bofip_written(self, url, stamp):
+        self.watermarks.mark(f"bofip:{url}", stamp)
+        self.http_cache.validate(url)
 
     def collect_legifrance(self):
-        """Collecte depuis Légifrance"""
-        # Implémentation avec l'API Légifrance
-        pass
+        """Collecte depuis Légifrance les articles en vigueur liés aux thèmes suivis.
+
+        Toutes les requêtes thématiques sont d'abord parcourues page par page
+        et leurs résultats dédoublonnés ; seuls les articles dont la version
+        n'a pas encore été traitée sont ensuite récupérés, en parallèle.
+        """
+        try:
+            if self.legifrance is None:
+                self.legifrance = LegifranceSearch(
+                    page_size=int(os.environ.get("COLLECTOR_LEGIFRANCE_PAGE_SIZE", "100")),
+                    concurrency=int(os.environ.get("COLLECTOR_LEGIFRANCE_CONCURRENCY", "8"))
+                )
+            self.legifrance.snapshots = self.snapshots
+            if self.article_cache is None:
+                self.article_cache = ArticleCache(
+                    max_bytes=int(os.environ.get("COLLECTOR_ARTICLE_CACHE_MAX_MB", "50")) * 1024 * 1024,
+                    max_age=float(os.environ.get("COLLECTOR_ARTICLE_CACHE_DAYS", "7")) * 24 * 3600
+                )
+            self.legifrance.article_cache = self.article_cache
+            if not self.legifrance.client.client_id:
+                logger.warning("Identifiants PISTE absents, Légifrance non collecté")
+                return
+
+            # Résultats de recherche journalisés : une reprise ne relance pas les recherches
+            journal = self.journals.get('legifrance')
+            articles = journal.result('legifrance:search') if journal is not None else None
+            if articles is None:
+                # Chaque fragment lance ses propres requêtes thématiques : un article
+                # trouvé par les requêtes de deux fragments est écrit deux fois, sans
+                # doublon en base (empreinte du contenu)
+                articles = self.legifrance.search({
+                    theme: [query for query in queries if self.shard.owns(query)]
+                    for theme, queries in THEME_QUERIES.items()
+                })
+                if journal is not None:
+                    journal.commit('legifrance:search', articles)
+            check_cancelled()
+            pending = [
+                article for article in articles.values()
+                if self.watermarks.is_new(f"legifrance:{article['id']}", article.get('dateDebut'))
+                and not self.resumed('legifrance', article_url(article))
+            ]
+            logger.info(f"Légifrance : {len(pending)} articles à récupérer sur {len(articles)}")
+
+            self.pipeline('legifrance', [
+                Stage('fetch', self._fetch_legifrance_article, workers=self.legifrance.concurrency),
+                Stage('persist', partial(self._persist, 'legifrance'), workers=self.stage_workers['persist'])
+            ]).run(pending)
+            logger.info(f"Légifrance : {self.legifrance.stats}")
+        except Exception as e:
+            logger.error(f"Erreur Légifrance : {str(e)}")
+            raise
+
+    def _fetch_legifrance_article(self, article):
+        content = self.legifrance.get_article(article['id'], meta=article)
+        if content is None:
+            return None
+        document = {
+            'title': article_title(article),
+            'content': content['texte'],
+            'source_url': article_url(article),
+            'theme': article['theme'],
+            'doc_type': FONDS[article['fond']]
+        }
+        return document, lambda: self.watermarks.mark(f"legifrance:{article['id']}", article.get('dateDebut'))
 
     def collect_parliament_questions(self):
-        """Collecte les questions parlementaires"""
+        """Collecte les questions parlementaires : récupération → lecture des flux →
+        classification par lots → écriture"""
         try:
-            for source, url in self.parliament_urls.items():
-                response = requests.get(url)
-                if response.status_code == 200:
-                    soup = BeautifulSoup(response.content, 'xml')
-                    items = soup.find_all('item')
-                    
-                    for item in items:
-                        if self.is_relevant_question(item):
-                            self.save_document(
-                                title=item.title.text,
-                                content=item.description.text,
-                                source_url=item.link.text,
-                                theme=self.determine_theme(item),
-                                doc_type='Réponse ministérielle'
-                            )
+            # Flux entiers répartis entre fragments : chacun ne lit que les siens
+            feeds = [(source, url) for source, url in self.parliament_urls.items() if self.shard.owns(url)]
+            self.pipeline('parliament', [
+                Stage('fetch', self._fetch_feed, workers=self.stage_workers['fetch']),
+                Stage('extract', self._extract_feed_items, workers=self.stage_workers['extract'],
+                      fan_out=True),
+                Stage('classify', self._classify_documents, workers=self.stage_workers['classify'],
+                      batch_size=self.classifier.batch_size),
+                Stage('persist', partial(self._persist, 'parliament'), workers=self.stage_workers['persist'])
+            ]).run(feeds)
         except Exception as e:
             logger.error(f"Erreur questions parlementaires : {str(e)}")
+            raise
+
+    def _fetch_feed(self, feed):
+        source, url = feed
+        response = self.fetcher.fetch(url)
+        if not response.ok:
+            return None
+        self.snapshot('rss', url, response.content, {'source': source})
+        if response.unchanged and not self.full:
+            logger.info(f"Flux {source} inchangé, ignoré")
+            return None
+        return source, url, response.content
+
+    def _extract_feed_items(self, feed):
+        """Éléments nouveaux et pertinents d'un flux ; les éléments déjà vus sont
+        écartés avant toute classification"""
+        source, url, content = feed
+        with metrics.parse_time().time(source=source):
+            feed_items = (
+                parsing.iter_feed_items(content) if self.fast_parser
+                else parsing.parse_feed(content)
+            )
+            new_items = [
+                item for item in feed_items
+                if not self.watermarks.seen_rss(source, self.item_guid(item), item.pub_date)
+                and not self.resumed('parliament', item.link)
+            ]
+        entries, variants = [], []
+        for item in new_items:
+            guid = self.item_guid(item)
+            if not self.is_relevant_question(item):
+                self.watermarks.mark_rss(source, guid)
+                continue
+            # Même réponse publiée par l'autre assemblée ou reformulée : ni classée ni écrite
+            original = self.near_duplicate_of(guid, item)
+            if original is not None:
+                logger.info(f"Quasi-doublon de {original}, ignoré : {item.title[:100]}")
+                variants.append((original, guid))
+                continue
+            document = {
+                'title': item.title,
+                'content': item.description,
+                'source_url': item.link,
+                'theme': None,
+                'doc_type': 'Réponse ministérielle'
+            }
+            entries.append((document, partial(self._feed_item_written, source, url, guid, document)))
+
+        # Le flux n'est tenu pour traité (cache HTTP, date de dernière publication)
+        # qu'une fois tous ses éléments retenus écrits
+        latest = max(filter(None, (parse_pub_date(item.pub_date) for item in new_items)), default=None)
+        with self._lock:
+            # Un quasi-doublon n'est vu qu'une fois son représentant écrit : si celui-ci
+            # échoue, la variante est relue à l'exécution suivante
+            deferred = 0
+            for original, guid in variants:
+                if self.near_duplicates.is_stored(original):
+                    self.watermarks.mark_rss(source, guid)
+                else:
+                    self._cluster_variants.setdefault(original, []).append((source, url, guid))
+                    deferred += 1
+            self._feed_pending[url] = [len(entries) + deferred, latest]
+        if not entries and not deferred:
+            self._feed_done(source, url)
+        yield from entries
+
+    def near_duplicate_of(self, guid, item):
+        """Représentant de la grappe de quasi-doublons de l'élément, ou None"""
+        if self.near_duplicates is None or not guid:
+            return None
+        return self.near_duplicates.check(guid, f"{item.title}\n{item.description}")
+
+    def _feed_item_written(self, source, url, guid, document):
+        self.watermarks.mark_rss(source, guid)
+        variants = []
+        if self.near_duplicates is not None and guid:
+            # Le thème du représentant vaut pour toute la grappe
+            self.near_duplicates.stored(guid, document['theme'])
+            with self._lock:
+                variants = self._cluster_variants.pop(guid, [])
+        for variant_source, variant_url, variant_guid in variants:
+            self.watermarks.mark_rss(variant_source, variant_guid)
+            self._feed_item_settled(variant_source, variant_url)
+        self._feed_item_settled(source, url)
+
+    def _feed_item_settled(self, source, url):
+        """Un élément retenu du flux est traité ; le dernier termine le flux"""
+        with self._lock:
+            self._feed_pending[url][0] -= 1
+            complete = self._feed_pending[url][0] == 0
+        if complete:
+            self._feed_done(source, url)
+
+    def _feed_done(self, source, url):
+        """Tous les éléments retenus du flux sont écrits : la date de dernière
+        publication avance et la réponse en cache est validée"""
+        with self._lock:
+            _, latest = self._feed_pending.pop(url)
+        self.watermarks.mark_rss(source, None, latest)
+        self.http_cache.validate(url)
+
+    def _classify_documents(self, batch):
+        """Classe par lots les documents dont le thème n'est pas connu"""
+        pending = [document for document, _ in batch if document['theme'] is None]
+        themes = self.classifier.classify_batch(
+            [(document['title'], document['content'][:JURISPRUDENCE_EXCERPT]) for document in pending]
+        )
+        for document, theme in zip(pending, themes):
+            document['theme'] = theme
+        return batch
+
+    def _persist(self, source, entry):
+        """Dernière étape : écriture du document ; l'unité est validée une fois son lot écrit"""
+        document, mark = entry
+        self.save_document(**document, committed=partial(self.commit_unit, source, document, mark))
+        return entry
+
+    def commit_unit(self, source, document, mark=None):
+        """Document écrit : l'unité est journalisée, puis sa marque mise à jour"""
+        journal = self.journals.get(source)
+        if journal is not None:
+            journal.commit(document['source_url'], document_hash(document['content']))
+        if mark:
+            mark()
+
+    def resumed(self, source, unit):
+        """Vrai si l'unité a été validée avant l'interruption d'une exécution précédente"""
+        journal = self.journals.get(source)
+        return journal is not None and journal.done(unit)
 
     def collect_jurisprudence(self):
-        """Collecte la jurisprudence"""
-        # Implémentation pour chaque source de jurisprudence
-        pass
+        """Collecte la jurisprudence de la Cour de cassation (export Judilibre).
+
+        Les décisions sont lues en flux, lot par lot, et enregistrées au fur et
+        à mesure. Après chaque lot, les documents en attente sont écrits puis
+        le curseur (journée, lot) est enregistré : une collecte interrompue
+        reprend au lot suivant. Le Conseil d'État ne propose pas d'API
+        équivalente (seulement des archives ouvertes) et n'est pas collecté ici.
+        """
+        source = "judilibre:cassation"
+        try:
+            if self.judilibre is None:
+                self.judilibre = JudilibreClient(
+                    batch_size=int(os.environ.get("COLLECTOR_JUDILIBRE_BATCH", "100"))
+                )
+            self.judilibre.snapshots = self.snapshots
+            if not self.judilibre.piste.client_id:
+                logger.warning("Identifiants PISTE absents, jurisprudence non collectée")
+                return
+            start = date.today() - timedelta(days=self.judilibre_days)
+            cursor = ExportCursor.from_mark({} if self.full else self.watermarks.get(source), start)
+            logger.info(f"Collecte Judilibre à partir du {cursor.day} (lot {cursor.batch})")
+
+            # Répartition par journée de création : un fragment ne lit que ses journées
+            for page in self.judilibre.iter_pages(cursor, owns_day=lambda day: self.shard.owns(f"judilibre:{day}")):
+                check_cancelled()
+                # Sommaire et début des motifs suffisent pour le filtrage et la classification
+                decisions = [
+                    (decision, decision_title(decision), decision_content(decision))
+                    for decision in page.decisions
+                ]
+                decisions = [
+                    entry for entry in decisions
+                    if self.classifier.local.is_relevant(entry[2][:JURISPRUDENCE_EXCERPT])
+                ]
+                themes = self.classifier.classify_batch(
+                    [(title, content[:JURISPRUDENCE_EXCERPT]) for _, title, content in decisions]
+                )
+                for (decision, title, content), theme in zip(decisions, themes):
+                    self.save_document(
+                        title=title,
+                        content=content,
+                        source_url=decision_url(decision),
+                        theme=theme,
+                        doc_type='Jurisprudence'
+                    )
+                # Le curseur n'avance qu'une fois les décisions du lot écrites
+                if not self.writer.flush():
+                    raise RuntimeError("Écriture du lot Judilibre en échec, curseur conservé")
+                self.watermarks.update(source, **page.cursor.to_mark())
+                self.watermarks.save()
+                logger.info(f"Judilibre : {len(page.decisions)} décisions lues, "
+                            f"{len(decisions)} retenues (curseur {page.cursor.day}, lot {page.cursor.batch})")
+        except Exception as e:
+            logger.error(f"Erreur jurisprudence : {str(e)}")
+            raise
+
+    def snapshot(self, kind, url, content, meta=None):
+        if self.snapshots is not None:
+            try:
+                self.snapshots.put(kind, url, content, meta)
+            except (OSError, sqlite3.Error) as e:
+                logger.error(f"Erreur enregistrement de l'instantané {url} : {str(e)}")
+
+    def reprocess(self, kinds=None):
+        """Rejoue extraction, classification et écriture depuis les instantanés.
+
+        Aucune requête n'est envoyée aux sources : la dernière réponse brute
+        de chaque URL est relue depuis le stockage local et extraite sur un
+        pool de processus (COLLECTOR_PARSE_WORKERS, sinon un par cœur).
+        """
+        if self.snapshots is None:
+            raise RuntimeError("Instantanés désactivés (COLLECTOR_SNAPSHOTS=0)")
+        snapshots = self.snapshots.latest(kinds)
+        logger.info(f"Retraitement de {len(snapshots)} instantanés")
+        if self.journals:
+            for journal in self.journals.values():
+                journal.close()
+            self.journals = {'reprocess': ProgressJournal('reprocess', run={'kinds': sorted(kinds or [])})}
+        workers = self.parse_workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            def extract(snapshot):
+                documents = pool.submit(extract_snapshot, self.snapshots.path, snapshot,
+                                        self.fast_parser).result()
+                return [(document, None) for document in documents
+                        if not self.resumed('reprocess', document['source_url'])]
+
+            try:
+                self.pipeline('reprocess', [
+                    Stage('extract', extract, workers=workers, fan_out=True),
+                    Stage('classify', self._classify_documents, workers=self.stage_workers['classify'],
+                          batch_size=self.classifier.batch_size),
+                    Stage('persist', partial(self._persist, 'reprocess'), workers=self.stage_workers['persist'])
+                ]).run(snapshots)
+            finally:
+                self.finish()
+        if 'reprocess' in self.journals:
+            self.journals['reprocess'].complete()
+
+    def pipeline(self, name, stages):
+        return Pipeline(name, stages, queue_size=self.queue_size)
+
+    def extract_page(self, content):
+        """Extrait une page HTML, sur le pool de processus si COLLECTOR_PARSE_WORKERS est défini"""
+        if not self.parse_workers:
+            return parsing.extract_page(content, self.fast_parser)
+        with self._lock:
+            if self._parse_pool is None:
+                self._parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+        return self._parse_pool.submit(parsing.extract_page, content, self.fast_parser).result()
 
     def extract_content(self, soup):
         """Extrait le contenu d'une page"""
-        for selector in ['div.article_content', 'div.corps_texte', 'div#main-content']:
-            element = soup.select_one(selector)
-            if element:
-                return element.get_text(strip=True)
-        return soup.get_text(strip=True)
+        return parsing.extract_content(soup)
+
+    def item_guid(self, item):
+        """Identifiant stable d'un élément RSS (guid, sinon lien)"""
+        return item.guid or item.link.strip() or None
+
+    def is_relevant_question(self, item):
+        """Filtre les questions touchant au moins un des thèmes fiscaux suivis"""
+        return self.classifier.local.is_relevant(f"{item.title}\n{item.description}")
 
     def determine_theme(self, item):
         """Détermine le thème d'un document"""
-        try:
-            chat_completion = self.client.chat.completions.create(
-                model="mistral-medium",
-                messages=[
-                    {"role": "system", "content": "Vous êtes un expert en classification fiscale."},
-                    {"role": "user", "content": f"Classez ce texte dans un des thèmes suivants : Pacte Dutreil, DMTG, Location meublée, Revenus fonciers, Plus-values. Texte : {item.title.text}\n\n{item.description.text[:500]}"}
-                ]
-            )
-            return chat_completion.choices[0].message.content.strip()
-        except Exception as e:
-            logger.error(f"Erreur classification : {str(e)}")
-            return None
+        return self.classifier.classify(item.title, item.description)
+
+    def save_document(self, title, content, source_url, theme, doc_type, paragraphs=None,
+                      committed=None):
+        """Sauvegarde un document dans Supabase ; ``committed`` est appelé une fois l'écriture faite"""
+        metrics.documents_saved().inc(doc_type=doc_type)
+        if self.write_mode == 'batch':
+            self.writer.add(title, content, source_url, theme, doc_type, paragraphs, committed)
+        elif self.save_document_single(title, content, source_url, theme, doc_type) and committed:
+            committed()
 
-    def save_document(self, title, content, source_url, theme, doc_type):
-        """Sauvegarde un document dans Supabase"""
+    def save_document_single(self, title, content, source_url, theme, doc_type):
+        """Sauvegarde un document avec une requête par étape (débogage)"""
         try:
             # Génération du hash
             doc_hash = hashlib.sha256(content.encode()).hexdigest()
             
             # Vérification des doublons
             existing = self.supabase.table('documents').select('id').eq('document_hash', doc_hash).execute()
+            metrics.supabase_round_trips().inc(operation='select')
             
-            if not existing.data:
+            if existing.data:
+                metrics.duplicates_skipped().inc(reason='document_hash')
+            else:
                 # Récupération des IDs
                 theme_result = self.supabase.table('fiscal_themes').select('id').eq('name', theme).execute()
                 category_result = self.supabase.table('document_categories').select('id').eq('name', doc_type).execute()
+                metrics.supabase_round_trips().inc(2, operation='select')
                 
                 if theme_result.data and category_result.data:
                     document = {
@@ -184,14 +727,123 @@ class LegalDataCollector:
                     }
                     
                     self.supabase.table('documents').insert(document).execute()
+                    metrics.supabase_round_trips().inc(operation='insert')
                     logger.info(f"Document ajouté : {title[:100]}...")
+                else:
+                    # Non validé : le document sera repris à la prochaine exécution
+                    logger.warning(f"Thème ou catégorie inconnu ({theme} / {doc_type}) : {title[:100]}")
+                    return False
+            return True
                     
         except Exception as e:
             logger.error(f"Erreur sauvegarde : {str(e)}")
+            return False
+
+def extract_snapshot(root, snapshot, fast_parser=False):
+    """Documents d'un instantané (exécuté dans un processus de travail, sans réseau).
+
+    Le thème des éléments de flux et des décisions reste à None : ils sont
+    classés ensuite, par lots, dans le processus principal.
+    """
+    content = load_snapshot(root, snapshot['content_hash'])
+    kind, meta = snapshot['kind'], snapshot['meta']
+    relevant = KeywordClassifier().is_relevant
+
+    if kind == 'bofip':
+        page = parsing.extract_page(content, fast_parser)
+        if not page.content:
+            return []
+        return [{
+            'title': page.title or snapshot['url'],
+            'content': page.content,
+            'source_url': snapshot['url'],
+            'theme': meta.get('theme'),
+            'doc_type': 'Instruction fiscale',
+            'paragraphs': page.paragraphs
+        }]
+
+    if kind == 'rss':
+        items = parsing.iter_feed_items(content) if fast_parser else parsing.parse_feed(content)
+        return [
+            {'title': item.title, 'content': item.description, 'source_url': item.link,
+             'theme': None, 'doc_type': 'Réponse ministérielle'}
+            for item in items if relevant(f"{item.title}\n{item.description}")
+        ]
+
+    if kind == 'legifrance':
+        article = json.loads(content).get('article') or {}
+        if not article.get('texte') or not meta.get('fond'):
+            return []
+        return [{
+            'title': article_title(meta),
+            'content': article['texte'],
+            'source_url': article_url(meta),
+            'theme': meta.get('theme'),
+            'doc_type': FONDS[meta['fond']]
+        }]
+
+    if kind == 'judilibre':
+        documents = []
+        for decision in json.loads(content).get('results') or []:
+            text = decision_content(decision)
+            if relevant(text[:JURISPRUDENCE_EXCERPT]):
+                documents.append({'title': decision_title(decision), 'content': text,
+                                  'source_url': decision_url(decision), 'theme': None,
+                                  'doc_type': 'Jurisprudence'})
+        return documents
+
+    return []
+
 
 def main():
-    collector = LegalDataCollector()
-    collector.collect_all()
+    parser = argparse.ArgumentParser(description="Collecte des documents juridiques")
+    parser.add_argument(
+        '--fetch-mode',
+        choices=Fetcher.MODES,
+        help="Mode de récupération HTTP (par défaut : COLLECTOR_FETCH_MODE ou async)"
+    )
+    parser.add_argument(
+        '--write-mode',
+        choices=('batch', 'single'),
+        help="Mode d'écriture Supabase (par défaut : COLLECTOR_WRITE_MODE ou batch)"
+    )
+    parser.add_argument(
+        '--full',
+        action='store_true',
+        help="Ignore les marques de collecte et force une collecte complète"
+    )
+    parser.add_argument(
+        '--parser',
+        choices=('bs4', 'fast'),
+        help="Analyse HTML/RSS (par défaut : COLLECTOR_PARSER ou bs4)"
+    )
+    parser.add_argument(
+        '--reprocess',
+        nargs='*',
+        choices=('bofip', 'rss', 'legifrance', 'judilibre'),
+        metavar='SOURCE',
+        help="Réextrait et réenregistre les documents depuis les instantanés locaux, "
+             "sans téléchargement (toutes les sources par défaut)"
+    )
+    parser.add_argument(
+        '--shard',
+        type=Shard.parse,
+        metavar='I/N',
+        help="Ne traite que le fragment I (à partir de 0) sur N (par défaut : COLLECTOR_SHARD)"
+    )
+    args = parser.parse_args()
+
+    collector = LegalDataCollector(
+        fetch_mode=args.fetch_mode,
+        write_mode=args.write_mode,
+        full=args.full,
+        parser=args.parser,
+        shard=args.shard
+    )
+    if args.reprocess is not None:
+        collector.reprocess(args.reprocess or None)
+    else:
+        collector.collect_all()
 
 if __name__ == "__main__":
     main()
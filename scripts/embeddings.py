@@ -0,0 +1,254 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from chunks import Chunk, chunk_document, split_paragraphs
+from http_cache import cache_dir
+from rate_limiter import get_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "mistral-embed"
+
+# Taille cible d'un passage envoyé au modèle (caractères)
+MAX_PASSAGE_CHARS = 1500
+
+
+def pack_chunks(chunks, max_chars=MAX_PASSAGE_CHARS):
+    """Regroupe des paragraphes consécutifs en passages d'au plus ``max_chars``.
+
+    Chaque passage est adressé par l'empreinte de son texte : un passage
+    inchangé garde la même empreinte d'une version du document à l'autre.
+    """
+    passages, current = [], []
+
+    def flush():
+        if current:
+            text = '\n'.join(current)
+            passages.append(Chunk(
+                position=len(passages),
+                hash=hashlib.sha256(text.encode()).hexdigest(),
+                content=text
+            ))
+            current.clear()
+
+    for chunk in chunks:
+        if current and sum(len(text) + 1 for text in current) + len(chunk.content) > max_chars:
+            flush()
+        current.append(chunk.content)
+    flush()
+    return passages
+
+
+class EmbeddingCache:
+    """Cache persistant des vecteurs, indexé par modèle et empreinte du passage"""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(cache_dir(), 'embeddings.sqlite3')
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, chunk_hash)
+            )
+        """)
+        self._conn.commit()
+
+    def get_many(self, model, hashes):
+        hashes = list(hashes)
+        result = {}
+        # Limite SQLite sur le nombre de paramètres d'une requête
+        for start in range(0, len(hashes), 500):
+            part = hashes[start:start + 500]
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT chunk_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND chunk_hash IN ({','.join('?' * len(part))})",
+                    [model, *part]
+                ).fetchall()
+            result.update((key, array('f', blob).tolist()) for key, blob in rows)
+        return result
+
+    def put_many(self, model, vectors):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, chunk_hash, vector) VALUES (?, ?, ?)",
+                [(model, key, array('f', vector).tobytes()) for key, vector in vectors.items()]
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class EmbeddingPipeline:
+    """Calcul et stockage des vecteurs des documents écrits dans Supabase.
+
+    Les documents sont découpés en passages (paragraphes regroupés) adressés
+    par empreinte. Un passage déjà présent dans ``document_embeddings`` pour
+    le document, ou dans le cache local, n'est jamais renvoyé au modèle ; les
+    autres partent par lots de ``batch_size``, avec au plus ``concurrency``
+    requêtes simultanées sous le contrôle du limiteur de débit.
+
+    ``add_documents`` ne fait que mettre les passages en attente : le calcul
+    part sur un fil dédié dès qu'un lot complet est prêt, sans bloquer
+    l'écriture des documents. ``flush`` attend ce fil puis traite le reste.
+    """
+
+    def __init__(self, client, supabase, model=EMBEDDING_MODEL, batch_size=64, concurrency=4,
+                 cache=None, limiter=None):
+        self.client = client
+        self.supabase = supabase
+        self.model = model
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.cache = cache or EmbeddingCache()
+        self.limiter = limiter or get_rate_limiter()
+        self.stats = {'stored': 0, 'cache': 0, 'api': 0, 'api_calls': 0, 'failed': 0}
+        self._pending = []
+        self._lock = threading.Lock()
+        self._worker = ThreadPoolExecutor(max_workers=1)
+        self._background = None
+
+    def add_documents(self, documents):
+        """Met en attente des documents écrits par ``DocumentWriter``"""
+        with self._lock:
+            for doc in documents:
+                chunks = doc.get('chunks')
+                if chunks is None:
+                    chunks = chunk_document(split_paragraphs(doc['content']))
+                for passage in pack_chunks(chunks):
+                    self._pending.append((doc['id'], passage))
+            full = len(self._pending) >= self.batch_size * self.concurrency
+            if full and (self._background is None or self._background.done()):
+                self._background = self._worker.submit(self._flush_pending)
+
+    def flush(self):
+        """Attend le calcul en cours puis traite les passages encore en attente"""
+        with self._lock:
+            background = self._background
+        if background is not None:
+            background.result()
+        self._flush_pending()
+
+    def _flush_pending(self):
+        """Calcule les vecteurs manquants et les écrit dans ``document_embeddings``"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        try:
+            pending = self._skip_stored(pending)
+            passages = {passage.hash: passage.content for _, passage in pending}
+            vectors = self.cache.get_many(self.model, passages)
+            self.stats['cache'] += len(vectors)
+            metrics.embeddings().inc(len(vectors), origin='cache')
+
+            missing = [key for key in passages if key not in vectors]
+            batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            with ThreadPoolExecutor(max_workers=max(1, self.concurrency)) as pool:
+                for batch, batch_vectors in zip(batches, pool.map(
+                        lambda keys: self._embed([passages[key] for key in keys]), batches)):
+                    if batch_vectors is None:
+                        self.stats['failed'] += len(batch)
+                        continue
+                    computed = dict(zip(batch, batch_vectors))
+                    self.cache.put_many(self.model, computed)
+                    vectors.update(computed)
+                    self.stats['api'] += len(computed)
+                    metrics.embeddings().inc(len(computed), origin='api')
+
+            rows = [
+                {'document_id': document_id, 'chunk_hash': passage.hash, 'position': passage.position,
+                 'content': passage.content, 'model': self.model, 'embedding': vectors[passage.hash]}
+                for document_id, passage in pending if passage.hash in vectors
+            ]
+            for start in range(0, len(rows), self.batch_size):
+                self.supabase.table('document_embeddings') \
+                    .upsert(rows[start:start + self.batch_size],
+                            on_conflict='document_id,chunk_hash', ignore_duplicates=True) \
+                    .execute()
+                metrics.supabase_round_trips().inc(operation='upsert')
+            self.stats['stored'] += len(rows)
+            logger.info(f"Vecteurs enregistrés : {len(rows)} passages")
+        except Exception as e:
+            logger.error(f"Erreur calcul des vecteurs : {str(e)}")
+
+    def close(self):
+        self._worker.shutdown(wait=True)
+        self.cache.close()
+
+    def _skip_stored(self, pending):
+        """Écarte les passages déjà vectorisés pour leur document ; supprime
+        ceux qui ne figurent plus dans sa version courante"""
+        current = {}
+        for document_id, passage in pending:
+            current.setdefault(document_id, set()).add(passage.hash)
+        existing = self.supabase.table('document_embeddings') \
+            .select('document_id, chunk_hash, model') \
+            .in_('document_id', list(current)) \
+            .execute()
+        metrics.supabase_round_trips().inc(operation='select')
+
+        # Passages disparus ou vectorisés par un autre modèle : à remplacer
+        stored, stale = set(), {}
+        for row in existing.data:
+            document_id, chunk_hash = row['document_id'], row['chunk_hash']
+            if chunk_hash in current[document_id] and row['model'] == self.model:
+                stored.add((document_id, chunk_hash))
+            else:
+                stale.setdefault(document_id, []).append(chunk_hash)
+        for document_id, hashes in stale.items():
+            self.supabase.table('document_embeddings') \
+                .delete() \
+                .eq('document_id', document_id) \
+                .in_('chunk_hash', hashes) \
+                .execute()
+            metrics.supabase_round_trips().inc(operation='delete')
+
+        remaining = [(document_id, passage) for document_id, passage in pending
+                     if (document_id, passage.hash) not in stored]
+        metrics.duplicates_skipped().inc(len(pending) - len(remaining), reason='embedding_stored')
+        return remaining
+
+    def _embed(self, texts):
+        """Vecteurs d'un lot de textes, ou None en cas d'échec définitif"""
+        attempt = 0
+        while True:
+            self.limiter.acquire('mistral')
+            started = time.monotonic()
+            try:
+                response = self.client.embeddings.create(model=self.model, input=texts)
+            except Exception as e:
+                status = getattr(e, 'status_code', 0)
+                headers = getattr(getattr(e, 'response', None), 'headers', None)
+                delay = self.limiter.record('mistral', status, time.monotonic() - started, headers, attempt)
+                metrics.llm_calls().inc(model=self.model, outcome='error')
+                if delay is None:
+                    logger.error(f"Erreur calcul des vecteurs : {str(e)}")
+                    return None
+                time.sleep(delay)
+                attempt += 1
+                continue
+            latency = time.monotonic() - started
+            self.limiter.record('mistral', 200, latency)
+            with self._lock:
+                self.stats['api_calls'] += 1
+            metrics.llm_calls().inc(model=self.model, outcome='ok')
+            metrics.llm_latency().observe(latency, model=self.model)
+            tokens = getattr(getattr(response, 'usage', None), 'prompt_tokens', None)
+            if tokens:
+                metrics.llm_tokens().inc(tokens, model=self.model, kind='prompt')
+            data = sorted(response.data, key=lambda item: item.index)
+            return [item.embedding for item in data]
@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+
+import metrics
+from rate_limiter import get_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {'User-Agent': 'Mozilla/5.0'}
+
+
+@dataclass
+class FetchResult:
+    """Résultat d'une requête HTTP, indépendant du client utilisé"""
+    url: str
+    status: int
+    content: bytes = b''
+    headers: dict = field(default_factory=dict)
+    error: str = None
+    # Vrai si le serveur a répondu 304 ou renvoyé un corps identique au cache
+    unchanged: bool = False
+
+    @property
+    def ok(self):
+        return self.status == 200
+
+
+class Fetcher:
+    """Récupère des pages HTTP en parallèle avec une limite par hôte.
+
+    En mode ``async``, les requêtes passent par aiohttp sur une boucle
+    d'événements dédiée (thread d'arrière-plan) qui partage un seul pool de
+    connexions ; un sémaphore par hôte garde la collecte polie envers chaque
+    domaine. En mode ``sequential``, les URL sont récupérées une par une avec
+    requests, ce qui permet de comparer les résultats des deux modes.
+
+    Si un ``HttpCache`` est fourni, les requêtes deviennent conditionnelles et
+    les réponses inchangées sont signalées par ``FetchResult.unchanged`` (en
+    mode différé, seulement si l'entrée a été validée après son traitement).
+    Chaque requête passe par le ``RateLimiter`` partagé, qui fixe le débit par
+    service et gère les nouveaux essais (429, Retry-After, erreurs serveur).
+    """
+
+    MODES = ('async', 'sequential')
+
+    def __init__(self, mode='async', per_host_limit=4, total_limit=20, timeout=30, headers=None,
+                 cache=None, limiter=None):
+        if mode not in self.MODES:
+            raise ValueError(f"Mode de récupération inconnu : {mode}")
+        self.mode = mode
+        self.per_host_limit = per_host_limit
+        self.total_limit = total_limit
+        self.timeout = timeout
+        self.headers = dict(headers or DEFAULT_HEADERS)
+        self.cache = cache
+        self.limiter = limiter or get_rate_limiter()
+
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._host_semaphores = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, url, headers=None):
+        """Récupère une seule URL"""
+        return self.fetch_many([url], headers=headers)[0]
+
+    def fetch_many(self, urls, headers=None):
+        """Récupère une liste d'URL ; les résultats suivent l'ordre des URL"""
+        urls = list(urls)
+        if not urls:
+            return []
+        merged_headers = {**self.headers, **(headers or {})}
+
+        if self.mode == 'sequential':
+            return [self._fetch_sync(url, merged_headers) for url in urls]
+
+        future = asyncio.run_coroutine_threadsafe(
+            self._fetch_all(urls, merged_headers),
+            self._ensure_loop()
+        )
+        return future.result()
+
+    def close(self):
+        """Ferme le pool de connexions et arrête la boucle d'événements"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = None
+            self._thread = None
+        if loop is None:
+            return
+        if self._session is not None:
+            asyncio.run_coroutine_threadsafe(self._session.close(), loop).result()
+            self._session = None
+        self._host_semaphores = {}
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Cache conditionnel ----------------------------------------------
+
+    def _prepare(self, url, headers):
+        """Ajoute les en-têtes conditionnels ; retourne (entrée en cache, en-têtes)"""
+        if self.cache is None:
+            return None, headers
+        entry = self.cache.get(url)
+        return entry, {**headers, **self.cache.conditional_headers(entry)}
+
+    def _observe(self, url, status, latency, size):
+        """Alimente les métriques de récupération (durée, octets, statut)"""
+        service = self.limiter.bucket(url).name
+        metrics.fetch_latency().observe(latency, service=service)
+        metrics.fetch_requests().inc(service=service, status=status)
+        if size:
+            metrics.fetch_bytes().inc(size, service=service)
+
+    def _finish(self, url, entry, status, content, headers):
+        if self.cache is not None:
+            if status == 304 and entry is not None:
+                self.cache.record_hit(url)
+                # Corps jamais validé (écriture en échec) : la page est traitée de nouveau
+                unchanged = entry['validated'] or not self.cache.deferred
+                if unchanged:
+                    metrics.duplicates_skipped().inc(reason='http_not_modified')
+                return FetchResult(url=url, status=200, content=entry['body'],
+                                   headers=headers, unchanged=unchanged)
+            if status == 200:
+                unchanged = self.cache.store(url, content, headers)
+                if unchanged:
+                    metrics.duplicates_skipped().inc(reason='http_same_body')
+                return FetchResult(url=url, status=status, content=content,
+                                   headers=headers, unchanged=unchanged)
+        return FetchResult(url=url, status=status, content=content, headers=headers)
+
+    # --- Mode séquentiel -------------------------------------------------
+
+    def _fetch_sync(self, url, headers):
+        entry, headers = self._prepare(url, headers)
+        attempt = 0
+        while True:
+            self.limiter.acquire(url)
+            started = time.monotonic()
+            try:
+                response = requests.get(url, headers=headers, timeout=self.timeout)
+                status, error = response.status_code, None
+            except Exception as e:
+                status, error = 0, str(e)
+            latency = time.monotonic() - started
+            self._observe(url, status, latency, len(response.content) if not error else 0)
+            delay = self.limiter.record(url, status, latency,
+                                        response.headers if not error else None, attempt)
+            if delay is None:
+                break
+            time.sleep(delay)
+            attempt += 1
+
+        if error:
+            logger.error(f"Erreur de récupération {url} : {error}")
+            return FetchResult(url=url, status=0, error=error)
+        return self._finish(url, entry, status, response.content, dict(response.headers))
+
+    # --- Mode asynchrone -------------------------------------------------
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name='fetcher-loop',
+                    daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    def _get_session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.total_limit,
+                limit_per_host=self.per_host_limit
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    def _host_semaphore(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_semaphores[host]
+
+    async def _fetch_all(self, urls, headers):
+        return await asyncio.gather(*(self._fetch_async(url, headers) for url in urls))
+
+    async def _fetch_async(self, url, headers):
+        session = self._get_session()
+        entry, headers = self._prepare(url, headers)
+        async with self._host_semaphore(url):
+            attempt = 0
+            while True:
+                await self.limiter.acquire_async(url)
+                started = time.monotonic()
+                status, content, response_headers, error = 0, b'', {}, None
+                try:
+                    async with session.get(url, headers=headers) as response:
+                        content = await response.read()
+                        status, response_headers = response.status, dict(response.headers)
+                except Exception as e:
+                    error = str(e)
+                latency = time.monotonic() - started
+                self._observe(url, status, latency, len(content))
+                delay = self.limiter.record(url, status, latency, response_headers, attempt)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+                attempt += 1
+
+        if error:
+            logger.error(f"Erreur de récupération {url} : {error}")
+            return FetchResult(url=url, status=0, error=error)
+        return self._finish(url, entry, status, content, response_headers)
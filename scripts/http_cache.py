@@ -0,0 +1,177 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = '.cache'
+
+
+def cache_dir():
+    """Répertoire des caches persistants (COLLECTOR_CACHE_DIR)"""
+    path = os.environ.get('COLLECTOR_CACHE_DIR', DEFAULT_CACHE_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class HttpCache:
+    """Cache HTTP sur disque pour les requêtes conditionnelles.
+
+    Chaque entrée conserve l'ETag, le Last-Modified et le corps de la dernière
+    réponse 200 d'une URL. Les entrées les moins récemment utilisées sont
+    évincées dès que la taille totale des corps dépasse ``max_bytes``.
+
+    Avec ``deferred=True``, un corps nouveau n'est tenu pour traité qu'après
+    ``validate`` (document écrit) : tant qu'il ne l'est pas, la réponse n'est
+    jamais signalée comme inchangée et la page est analysée de nouveau.
+    """
+
+    def __init__(self, path=None, max_bytes=200 * 1024 * 1024, deferred=False):
+        self.path = path or os.path.join(cache_dir(), 'http_cache.sqlite3')
+        self.max_bytes = max_bytes
+        self.deferred = deferred
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body BLOB NOT NULL,
+                body_hash TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                validated INTEGER NOT NULL DEFAULT 1
+            )
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(responses)")}
+        if 'validated' not in columns:
+            self._conn.execute("ALTER TABLE responses ADD COLUMN validated INTEGER NOT NULL DEFAULT 1")
+        self._conn.commit()
+
+    def get(self, url):
+        """Retourne l'entrée en cache d'une URL, ou None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, body, body_hash, validated FROM responses WHERE url = ?",
+                (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, body, body_hash, validated = row
+        return {'etag': etag, 'last_modified': last_modified, 'body': body, 'body_hash': body_hash,
+                'validated': bool(validated)}
+
+    def conditional_headers(self, entry):
+        """En-têtes If-None-Match / If-Modified-Since pour une entrée"""
+        headers = {}
+        if entry:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def record_hit(self, url):
+        """Comptabilise un 304 ou un corps identique et rafraîchit l'entrée"""
+        with self._lock:
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE url = ?",
+                (time.time(), url)
+            )
+            self._conn.commit()
+
+    def store(self, url, body, headers):
+        """Enregistre une réponse 200 ; retourne True si le corps est inchangé
+        (et, en mode différé, déjà validé)"""
+        body_hash = hashlib.sha256(body).hexdigest()
+        previous = self.get(url)
+        unchanged = (
+            previous is not None and previous['body_hash'] == body_hash
+            and (previous['validated'] or not self.deferred)
+        )
+
+        with self._lock:
+            if unchanged:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO responses
+                    (url, etag, last_modified, body, body_hash, size, last_access, validated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    url,
+                    get_header(headers, 'ETag'),
+                    get_header(headers, 'Last-Modified'),
+                    body,
+                    body_hash,
+                    len(body),
+                    time.time(),
+                    int(unchanged or not self.deferred)
+                )
+            )
+            self._evict()
+            self._conn.commit()
+        return unchanged
+
+    def validate(self, url):
+        """La dernière réponse de l'URL est traitée : elle pourra être signalée inchangée"""
+        with self._lock:
+            self._conn.execute("UPDATE responses SET validated = 1 WHERE url = ?", (url,))
+            self._conn.commit()
+
+    def invalidate(self, url):
+        """Supprime l'entrée d'une URL"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self._conn.commit()
+
+    def stats(self):
+        """Compteurs de succès/échecs et taille actuelle du cache"""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': entries,
+            'bytes': size
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT url, size FROM responses ORDER BY last_access ASC"
+        ).fetchall()
+        for url, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+            total -= size
+            self.evictions += 1
+
+
+def get_header(headers, name):
+    """Valeur d'un en-tête HTTP, sans tenir compte de la casse"""
+    for key, value in headers.items():
+        if key.lower() == name.lower():
+            return value
+    return None
@@ -0,0 +1,140 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import metrics
+from http_cache import cache_dir
+
+logger = logging.getLogger(__name__)
+
+# Âge maximal (heures) d'un journal interrompu encore repris par l'exécution suivante
+DEFAULT_MAX_AGE = 7 * 24
+
+
+class ProgressJournal:
+    """Journal d'avancement d'une exécution longue, en écriture anticipée (JSONL).
+
+    La première ligne décrit l'exécution (``run``) ; chaque ligne suivante
+    enregistre une unité de travail terminée (page, article, élément de flux)
+    et sa clé de résultat. Chaque ligne est écrite et synchronisée sur disque
+    avant que l'unité soit considérée comme faite : après une interruption
+    (jeton expiré, coupure réseau, délai du runner), l'exécution suivante
+    relit le journal et saute les unités déjà validées.
+
+    Le journal est ignoré s'il décrit une autre exécution (mode, plan...) ou
+    s'il a plus de ``max_age`` heures ; ``complete`` le supprime une fois
+    l'exécution terminée sans erreur.
+    """
+
+    def __init__(self, name, run=None, path=None, max_age=None):
+        self.name = name
+        self.path = path or os.path.join(cache_dir(), 'journals', f"{name}.jsonl")
+        # Description normalisée (aller-retour JSON) : comparable à celle relue
+        self.run = json.loads(json.dumps(run or {}, sort_keys=True))
+        self.max_age = max_age if max_age is not None else float(
+            os.environ.get('COLLECTOR_JOURNAL_MAX_AGE', DEFAULT_MAX_AGE))
+        self.skipped = 0
+        self._units = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = self._open()
+
+    def _open(self):
+        header, offset = self._load()
+        if header is None:
+            self._units = {}
+            f = open(self.path, 'wb')
+            self._append(f, {'run': self.run, 'started_at': time.time()})
+            return f
+
+        logger.info(f"Journal {self.name} : reprise, {len(self._units)} unités déjà terminées")
+        f = open(self.path, 'r+b')
+        # Une ligne tronquée par l'interruption est retirée avant de reprendre l'écriture
+        f.seek(offset)
+        f.truncate()
+        return f
+
+    def _load(self):
+        """Relit un journal existant ; retourne (en-tête, taille valide) ou (None, 0)"""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return None, 0
+        header, offset = None, 0
+        with f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if header is None:
+                    header = entry
+                else:
+                    self._units[entry['unit']] = entry.get('result')
+                offset += len(line)
+
+        if header is None:
+            return None, 0
+        if header.get('run') != self.run:
+            logger.info(f"Journal {self.name} d'une autre exécution, ignoré")
+            return None, 0
+        if time.time() - header.get('started_at', 0) > self.max_age * 3600:
+            logger.info(f"Journal {self.name} trop ancien, ignoré")
+            return None, 0
+        return header, offset
+
+    @staticmethod
+    def _append(f, entry):
+        f.write((json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8'))
+        f.flush()
+        os.fsync(f.fileno())
+
+    def done(self, unit):
+        """Vrai si l'unité a été validée par une exécution précédente (ou celle-ci)"""
+        with self._lock:
+            done = unit in self._units
+            if done:
+                self.skipped += 1
+        if done:
+            metrics.duplicates_skipped().inc(reason='journal')
+        return done
+
+    def result(self, unit, default=None):
+        with self._lock:
+            return self._units.get(unit, default)
+
+    def commit(self, unit, result=None):
+        """Valide une unité : la ligne est sur disque au retour de l'appel"""
+        with self._lock:
+            if self._file is None:
+                return
+            self._append(self._file, {'unit': unit, 'result': result})
+            self._units[unit] = result
+
+    def complete(self):
+        """Exécution terminée : le journal n'a plus à être repris"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+        logger.info(f"Journal {self.name} : exécution terminée ({len(self._units)} unités)")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if self.skipped:
+            logger.info(f"Journal {self.name} : {self.skipped} unités reprises sans nouveau traitement")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._units)
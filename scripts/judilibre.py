@@ -0,0 +1,166 @@
+import logging
+from dataclasses import dataclass
+from datetime import date, timedelta
+from urllib.parse import parse_qs, urlsplit
+
+from piste_client import PisteClient
+
+logger = logging.getLogger(__name__)
+
+JUDILIBRE_BASE_URL = "https://api.piste.gouv.fr/cassation/judilibre/v1.0"
+
+# L'API d'export refuse les pages au-delà de 10 000 décisions pour une même
+# requête : la collecte avance donc par fenêtres d'une journée
+EXPORT_MAX_RESULTS = 10000
+EXPORT_MAX_BATCH_SIZE = 1000
+
+CHAMBERS = {
+    'pl': 'assemblée plénière',
+    'mi': 'chambre mixte',
+    'civ1': 'première chambre civile',
+    'civ2': 'deuxième chambre civile',
+    'civ3': 'troisième chambre civile',
+    'comm': 'chambre commerciale',
+    'soc': 'chambre sociale',
+    'cr': 'chambre criminelle'
+}
+
+
+@dataclass
+class ExportCursor:
+    """Position dans l'export : journée en cours et prochain lot à lire"""
+    day: str
+    batch: int = 0
+
+    @classmethod
+    def from_mark(cls, mark, default_day):
+        if not mark.get('day'):
+            return cls(default_day.isoformat())
+        return cls(mark['day'], int(mark.get('batch', 0)))
+
+    def to_mark(self):
+        return {'day': self.day, 'batch': self.batch}
+
+
+@dataclass
+class ExportPage:
+    """Lot de décisions et position à enregistrer une fois ce lot traité"""
+    decisions: list
+    cursor: ExportCursor
+    total: int
+
+
+class JudilibreClient:
+    """Lecture en flux de l'API d'export Judilibre (Cour de cassation).
+
+    Les décisions sont lues lot par lot (``batch_size`` par requête), une
+    journée de création après l'autre, et rendues par un générateur : la
+    mémoire utilisée ne dépend que de la taille d'un lot, pas du volume
+    exporté. Chaque lot est accompagné du curseur à enregistrer une fois
+    ses décisions traitées, ce qui permet de reprendre une collecte
+    interrompue au lot suivant.
+    """
+
+    def __init__(self, piste=None, batch_size=100, jurisdiction='cc', snapshots=None):
+        self.piste = piste or PisteClient(base_url=JUDILIBRE_BASE_URL)
+        # Lots bruts conservés pour réextraction (``SnapshotStore``)
+        self.snapshots = snapshots
+        self.batch_size = max(1, min(batch_size, EXPORT_MAX_BATCH_SIZE))
+        self.jurisdiction = jurisdiction
+
+    def iter_pages(self, cursor, until=None, owns_day=None, **filters):
+        """Lots de décisions depuis ``cursor`` jusqu'à ``until`` (inclus, aujourd'hui par défaut).
+
+        ``owns_day`` (collecte répartie) : les journées pour lesquelles il
+        retourne faux sont sautées sans requête.
+        """
+        today = date.today()
+        until = min(until or today, today)
+        day, batch = date.fromisoformat(cursor.day), cursor.batch
+        while day <= until:
+            if owns_day is not None and not owns_day(day.isoformat()):
+                day, batch = day + timedelta(days=1), 0
+                continue
+            while True:
+                payload = self.export(day, batch, **filters)
+                decisions = payload.get('results') or []
+                total = payload.get('total', 0)
+                if total > EXPORT_MAX_RESULTS and batch == 0:
+                    logger.warning(f"Judilibre : plus de {EXPORT_MAX_RESULTS} décisions le {day}, "
+                                   f"export tronqué")
+                next_batch = next_batch_index(payload.get('next_batch'), batch + 1)
+                more = bool(payload.get('next_batch') and decisions) \
+                    and next_batch * self.batch_size < EXPORT_MAX_RESULTS
+                if more:
+                    next_cursor = ExportCursor(day.isoformat(), next_batch)
+                elif day >= today:
+                    # Journée en cours : le dernier lot sera relu à la prochaine collecte
+                    next_cursor = ExportCursor(day.isoformat(), batch)
+                else:
+                    next_cursor = ExportCursor((day + timedelta(days=1)).isoformat())
+                yield ExportPage(decisions, next_cursor, total)
+                if not more:
+                    break
+                batch = next_batch
+            day, batch = day + timedelta(days=1), 0
+
+    def iter_decisions(self, cursor, until=None, **filters):
+        """Décisions une à une, sans conserver plus d'un lot en mémoire"""
+        for page in self.iter_pages(cursor, until, **filters):
+            yield from page.decisions
+
+    def export(self, day, batch=0, **filters):
+        """Un lot de l'export pour les décisions créées le jour ``day``"""
+        params = {
+            'jurisdiction': self.jurisdiction,
+            'date_type': 'creation',
+            'date_start': day.isoformat(),
+            'date_end': day.isoformat(),
+            'batch': batch,
+            'batch_size': self.batch_size,
+            **filters
+        }
+        response = self.piste.get('/export', params=params)
+        if response.status_code != 200:
+            raise RuntimeError(f"Export Judilibre refusé ({response.status_code}) : {response.text[:200]}")
+        if self.snapshots is not None:
+            self.snapshots.put('judilibre', f"{self.piste.base_url}/export?date={day}&batch={batch}",
+                               response.content, {'day': day.isoformat(), 'batch': batch})
+        return response.json()
+
+    def close(self):
+        self.piste.close()
+
+
+def next_batch_index(next_batch, default):
+    """Numéro de lot annoncé par ``next_batch`` (chaîne de requête ``?batch=…``)"""
+    if not next_batch:
+        return default
+    values = parse_qs(urlsplit(next_batch).query).get('batch')
+    try:
+        return int(values[0]) if values else default
+    except ValueError:
+        return default
+
+
+def decision_title(decision):
+    """Intitulé usuel : « Cour de cassation, chambre commerciale, 2023-01-11, 21-12.345 »"""
+    parts = ['Cour de cassation']
+    chamber = decision.get('chamber')
+    if chamber:
+        parts.append(CHAMBERS.get(chamber, chamber))
+    if decision.get('decision_date'):
+        parts.append(decision['decision_date'])
+    if decision.get('number'):
+        parts.append(decision['number'])
+    return ', '.join(parts)
+
+
+def decision_url(decision):
+    return f"https://www.courdecassation.fr/decision/{decision['id']}"
+
+
+def decision_content(decision):
+    """Sommaire (s'il existe) suivi du texte intégral"""
+    parts = [decision.get('summary'), decision.get('text')]
+    return '\n\n'.join(part.strip() for part in parts if part and part.strip())
@@ -0,0 +1,184 @@
+import logging
+import threading
+
+from article_cache import version_date
+from piste_client import PisteClient
+
+logger = logging.getLogger(__name__)
+
+# Expressions recherchées dans Légifrance pour chaque thème fiscal suivi
+THEME_QUERIES = {
+    "Pacte Dutreil": ["pacte Dutreil", "engagement collectif de conservation"],
+    "DMTG": ["droits de mutation à titre gratuit", "donation-partage", "abattement succession"],
+    "Location meublée": ["location meublée", "loueur en meublé professionnel"],
+    "Revenus fonciers": ["revenus fonciers", "déficit foncier"],
+    "Plus-values": ["plus-values mobilières", "plus-values immobilières"]
+}
+
+# Fonds interrogés : codes et textes non codifiés (lois, décrets...), en version
+# courante ; la catégorie du document dépend du fond
+FONDS = {
+    'CODE_DATE': 'Article de code',
+    'LODA_DATE': 'Texte législatif'
+}
+
+# Taille de page maximale acceptée par l'API de recherche
+MAX_PAGE_SIZE = 100
+
+ARTICLE_URLS = {
+    'CODE_DATE': "https://www.legifrance.gouv.fr/codes/article_lc/{id}",
+    'LODA_DATE': "https://www.legifrance.gouv.fr/loda/article_lc/{id}"
+}
+
+
+def search_payload(query, fond, page, page_size):
+    """Recherche plein texte d'articles en vigueur, paginée par article"""
+    return {
+        "recherche": {
+            "champs": [
+                {
+                    "typeChamp": "ALL",
+                    "criteres": [
+                        {
+                            "typeRecherche": "TOUS_LES_MOTS_DANS_UN_CHAMP",
+                            "valeur": query,
+                            "operateur": "ET"
+                        }
+                    ],
+                    "operateur": "ET"
+                }
+            ],
+            "filtres": [
+                {
+                    "facette": "DATE_VERSION",
+                    "singleDate": version_date()
+                }
+            ],
+            "pageNumber": page,
+            "pageSize": page_size,
+            "operateur": "ET",
+            "sort": "PERTINENCE",
+            "typePagination": "ARTICLE"
+        },
+        "fond": fond
+    }
+
+
+class LegifranceSearch:
+    """Recherche thématique et récupération des articles Légifrance.
+
+    ``search`` parcourt toutes les pages de chaque requête (``page_size``
+    résultats par appel) et dédoublonne les articles entre requêtes, fonds et
+    thèmes avant toute récupération de contenu : un article trouvé par
+    plusieurs thèmes est rattaché au premier. Les contenus sont ensuite
+    récupérés par ``get_article`` depuis ``concurrency`` threads, le débit
+    restant réglé par le limiteur du client PISTE.
+
+    Avec un ``ArticleCache``, un article déjà récupéré est resservi sans
+    appel : l'identifiant LEGIARTI désigne une version, dont le contenu ne
+    change pas, y compris lors d'une collecte complète.
+    """
+
+    def __init__(self, client=None, page_size=MAX_PAGE_SIZE, concurrency=8, snapshots=None,
+                 article_cache=None):
+        self.client = client or PisteClient()
+        # Réponses brutes conservées pour réextraction (``SnapshotStore``)
+        self.snapshots = snapshots
+        self.article_cache = article_cache
+        self.page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+        self.concurrency = concurrency
+        self.stats = {'search_calls': 0, 'hits': 0, 'articles': 0, 'fetched': 0, 'cached': 0, 'failed': 0}
+        self._lock = threading.Lock()
+
+    def search(self, theme_queries=None, fonds=FONDS):
+        """Articles en vigueur trouvés par les requêtes : {id: article}, sans doublon"""
+        articles = {}
+        for theme, queries in (THEME_QUERIES if theme_queries is None else theme_queries).items():
+            for query in queries:
+                for fond in fonds:
+                    for hit in self.iter_search(query, fond):
+                        self.stats['hits'] += 1
+                        if hit['id'] not in articles:
+                            articles[hit['id']] = dict(hit, theme=theme, fond=fond)
+        self.stats['articles'] = len(articles)
+        logger.info(f"Recherche Légifrance : {self.stats['hits']} résultats, "
+                    f"{len(articles)} articles distincts")
+        return articles
+
+    def iter_search(self, query, fond):
+        """Toutes les pages d'une requête ; rend les articles en vigueur"""
+        page = 1
+        while True:
+            response = self.client.post("/search", json=search_payload(query, fond, page, self.page_size))
+            self.stats['search_calls'] += 1
+            if response.status_code != 200:
+                logger.error(f"Erreur recherche Légifrance « {query} » ({fond}, page {page}) : "
+                             f"{response.text[:200]}")
+                return
+            result = response.json()
+            yield from extract_hits(result)
+
+            if page * self.page_size >= result.get('totalResultNumber', 0) or not result.get('results'):
+                return
+            page += 1
+
+    def get_article(self, article_id, meta=None):
+        """Contenu d'un article, ou None en cas d'échec ; appelable depuis plusieurs threads.
+
+        ``meta`` (résultat de recherche) accompagne l'instantané de la réponse.
+        """
+        if self.article_cache is not None:
+            cached = self.article_cache.get_article(article_id)
+            if cached is not None and (cached.get('article') or {}).get('texte'):
+                with self._lock:
+                    self.stats['cached'] += 1
+                return cached['article']
+
+        article = None
+        try:
+            response = self.client.post("/consult/getArticle", json={"id": article_id})
+            if response.status_code == 200:
+                if self.snapshots is not None:
+                    self.snapshots.put('legifrance', f"{self.client.base_url}/consult/getArticle?id={article_id}",
+                                       response.content, meta)
+                result = response.json()
+                article = result.get('article')
+                if not article or not article.get('texte'):
+                    logger.warning(f"Article {article_id} sans contenu")
+                    article = None
+                elif self.article_cache is not None:
+                    self.article_cache.store_article(article_id, result)
+            else:
+                logger.error(f"Erreur récupération de l'article {article_id} : {response.status_code}")
+        except Exception as e:
+            logger.error(f"Erreur récupération de l'article {article_id} : {str(e)}")
+        with self._lock:
+            self.stats['fetched' if article else 'failed'] += 1
+        return article
+
+
+def extract_hits(result):
+    """Articles en vigueur d'une page de résultats (pagination par article)"""
+    for item in result.get('results', []):
+        titles = item.get('titles') or [{}]
+        for section in item.get('sections', []):
+            for extract in section.get('extracts', []):
+                if not extract.get('id') or extract.get('etat', 'VIGUEUR') != 'VIGUEUR':
+                    continue
+                yield {
+                    'id': extract['id'],
+                    'num': extract.get('num'),
+                    'dateDebut': extract.get('dateDebut'),
+                    'text_title': titles[0].get('title')
+                }
+
+
+def article_title(article):
+    """« Code général des impôts - Article 787 B »"""
+    parts = [part for part in (article.get('text_title'),
+                               f"Article {article['num']}" if article.get('num') else None) if part]
+    return ' - '.join(parts) or article['id']
+
+
+def article_url(article):
+    return ARTICLE_URLS[article['fond']].format(id=article['id'])
@@ -0,0 +1,384 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Bornes par défaut des histogrammes de durée (secondes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _round(value):
+    return round(value, 6) if value is not None else None
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    """Compteur monotone, éventuellement décliné par étiquettes"""
+
+    kind = 'counter'
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def total(self):
+        with self._lock:
+            return sum(self._values.values())
+
+    def snapshot(self):
+        with self._lock:
+            return [{'labels': dict(key), 'value': value} for key, value in sorted(self._values.items())]
+
+    def prometheus_lines(self):
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                yield f"{self.name}{_format_labels(key)} {value}"
+
+
+class Histogram:
+    """Distribution d'observations (durées, tailles) par seaux cumulés"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0, 'max': 0.0
+                }
+            series['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+            series['count'] += 1
+            series['max'] = max(series['max'], value)
+
+    def merge(self, counts, total, count, peak, **labels):
+        """Ajoute les observations d'une autre exécution (même découpage en seaux)"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, {
+                'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0, 'max': 0.0
+            })
+            series['counts'] = [a + b for a, b in zip(series['counts'], counts)]
+            series['sum'] += total
+            series['count'] += count
+            series['max'] = max(series['max'], peak)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe la durée du bloc ``with``"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def quantile(self, q, **labels):
+        """Estimation d'un quantile : borne supérieure du seau qui le contient"""
+        with self._lock:
+            series = self._series.get(_label_key(labels))
+            if not series or not series['count']:
+                return None
+            rank = q * series['count']
+            seen = 0
+            for bound, count in zip(self.buckets, series['counts']):
+                seen += count
+                if seen >= rank:
+                    return min(bound, series['max'])
+            return series['max']
+
+    def snapshot(self):
+        with self._lock:
+            items = sorted(self._series.items())
+        result = []
+        for key, series in items:
+            labels = dict(key)
+            result.append({
+                'labels': labels,
+                'count': series['count'],
+                'sum': round(series['sum'], 6),
+                'max': round(series['max'], 6),
+                'p50': _round(self.quantile(0.5, **labels)),
+                'p95': _round(self.quantile(0.95, **labels)),
+                'counts': list(series['counts'])
+            })
+        return result
+
+    def prometheus_lines(self):
+        with self._lock:
+            items = sorted((key, dict(series, counts=list(series['counts'])))
+                           for key, series in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series['counts']):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {series['count']}"
+            yield f"{self.name}_sum{_format_labels(key)} {series['sum']}"
+            yield f"{self.name}_count{_format_labels(key)} {series['count']}"
+
+
+class Gauge:
+    """Valeur instantanée (profondeur de file...) et maximum atteint pendant l'exécution"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            _, peak = self._values.get(key, (0, value))
+            self._values[key] = (value, max(peak, value))
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(labels), (0, 0))[0]
+
+    def merge(self, value, peak, **labels):
+        """Combine avec la jauge d'une autre exécution : plus grandes valeurs retenues"""
+        key = _label_key(labels)
+        with self._lock:
+            current, current_peak = self._values.get(key, (value, peak))
+            self._values[key] = (max(current, value), max(current_peak, peak))
+
+    def max(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(labels), (0, 0))[1]
+
+    def snapshot(self):
+        with self._lock:
+            return [{'labels': dict(key), 'value': value, 'max': peak}
+                    for key, (value, peak) in sorted(self._values.items())]
+
+    def prometheus_lines(self):
+        with self._lock:
+            for key, (value, _) in sorted(self._values.items()):
+                yield f"{self.name}{_format_labels(key)} {value}"
+
+
+class MetricsRegistry:
+    """Registre des compteurs, histogrammes et jauges d'une exécution de collecte.
+
+    Chaque étape (récupération, analyse, classification, écriture Supabase)
+    alimente le registre partagé ; ``write`` produit en fin d'exécution un
+    résumé JSON et un fichier au format texte Prometheus.
+    """
+
+    def __init__(self):
+        self.started_at = datetime.now()
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, description=''):
+        return self._get(Counter, name, description)
+
+    def histogram(self, name, description='', buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, description, buckets)
+
+    def gauge(self, name, description=''):
+        return self._get(Gauge, name, description)
+
+    def _get(self, cls, name, description, *args):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, description, *args)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Métrique {name} déjà déclarée comme {metric.kind}")
+            return metric
+
+    def reset(self):
+        with self._lock:
+            self._metrics = {}
+            self.started_at = datetime.now()
+
+    def to_dict(self):
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        return {
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+            'metrics': {
+                name: dict(
+                    {'type': metric.kind, 'description': metric.description, 'series': metric.snapshot()},
+                    **({'buckets': list(metric.buckets)} if metric.kind == 'histogram' else {})
+                )
+                for name, metric in metrics
+            }
+        }
+
+    def merge(self, document):
+        """Ajoute un résumé JSON (``to_dict``) d'une autre exécution, par exemple d'un
+        autre fragment : compteurs et histogrammes additionnés, jauges au maximum"""
+        started_at = datetime.fromisoformat(document['started_at'])
+        with self._lock:
+            self.started_at = min(self.started_at, started_at)
+        for name, entry in document['metrics'].items():
+            for series in entry['series']:
+                labels = series['labels']
+                if entry['type'] == 'counter':
+                    self.counter(name, entry['description']).inc(series['value'], **labels)
+                elif entry['type'] == 'gauge':
+                    self.gauge(name, entry['description']).merge(series['value'], series['max'], **labels)
+                elif 'counts' in series:
+                    histogram = self.histogram(name, entry['description'], entry['buckets'])
+                    histogram.merge(series['counts'], series['sum'], series['count'], series['max'], **labels)
+
+    def to_prometheus(self):
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        for name, metric in metrics:
+            if metric.description:
+                lines.append(f"# HELP {name} {metric.description}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.prometheus_lines())
+        return '\n'.join(lines) + '\n'
+
+    def write(self, directory=None, name='collector'):
+        """Écrit ``<name>.json`` et ``<name>.prom`` ; retourne les deux chemins"""
+        directory = directory or os.environ.get('COLLECTOR_METRICS_DIR', 'metrics')
+        os.makedirs(directory, exist_ok=True)
+        json_path = os.path.join(directory, f"{name}.json")
+        prom_path = os.path.join(directory, f"{name}.prom")
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=1)
+        with open(prom_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        logger.info(f"Métriques écrites dans {json_path} et {prom_path}")
+        return json_path, prom_path
+
+
+_shared_registry = None
+_shared_lock = threading.Lock()
+
+
+def get_metrics():
+    """Registre partagé par tous les composants d'un même processus"""
+    global _shared_registry
+    with _shared_lock:
+        if _shared_registry is None:
+            _shared_registry = MetricsRegistry()
+        return _shared_registry
+
+
+# --- Métriques communes ----------------------------------------------------
+
+def fetch_latency():
+    return get_metrics().histogram('collector_fetch_seconds', "Durée des requêtes HTTP par service")
+
+
+def fetch_bytes():
+    return get_metrics().counter('collector_fetch_bytes_total', "Octets téléchargés par service")
+
+
+def fetch_requests():
+    return get_metrics().counter('collector_fetch_requests_total', "Requêtes HTTP par service et statut")
+
+
+def parse_time():
+    return get_metrics().histogram('collector_parse_seconds', "Durée d'analyse HTML/RSS par source")
+
+
+def llm_calls():
+    return get_metrics().counter('collector_llm_calls_total', "Appels au modèle par modèle et issue")
+
+
+def llm_latency():
+    return get_metrics().histogram('collector_llm_seconds', "Durée des appels au modèle")
+
+
+def classifications():
+    return get_metrics().counter('collector_classifications_total', "Classifications par origine (cache, mots-clés, LLM)")
+
+
+def llm_tokens():
+    return get_metrics().counter('collector_llm_tokens_total', "Jetons consommés par modèle et type")
+
+
+def supabase_round_trips():
+    return get_metrics().counter('collector_supabase_round_trips_total', "Allers-retours Supabase par opération")
+
+
+def duplicates_skipped():
+    return get_metrics().counter('collector_duplicates_skipped_total', "Éléments ignorés car déjà connus, par motif")
+
+
+def source_duration():
+    return get_metrics().histogram('collector_source_seconds', "Durée de collecte par source")
+
+
+def source_runs():
+    return get_metrics().counter('collector_source_runs_total', "Exécutions de source par état")
+
+
+def embeddings():
+    return get_metrics().counter('collector_embeddings_total', "Vecteurs de passages par origine (cache, API)")
+
+
+def chunks_written():
+    return get_metrics().counter('collector_chunks_written_total', "Paragraphes écrits par le stockage différentiel")
+
+
+def documents_saved():
+    return get_metrics().counter('collector_documents_total', "Documents transmis à l'écriture par type de document")
+
+
+def queue_depth():
+    return get_metrics().gauge('collector_queue_depth', "Éléments en attente dans la file d'entrée d'une étape de pipeline")
+
+
+def stage_items():
+    return get_metrics().counter('collector_stage_items_total', "Éléments traités par étape de pipeline et issue")
+
+
+def stage_latency():
+    return get_metrics().histogram('collector_stage_seconds', "Durée de traitement d'un élément (ou lot) par étape")
+
+
+def article_cache():
+    return get_metrics().counter('collector_article_cache_total', "Consultations du cache d'articles Légifrance par type et issue")
@@ -0,0 +1,200 @@
+import hashlib
+import logging
+import os
+import random
+import re
+import sqlite3
+import struct
+import threading
+import time
+
+import metrics
+from classifier import normalize_text
+from http_cache import cache_dir
+
+logger = logging.getLogger(__name__)
+
+# Nombre de permutations (longueur de la signature) et découpage en bandes :
+# 16 bandes de 8 valeurs rendent candidates les paires de similarité ≳ 0,7
+NUM_PERM = 128
+BANDS = 16
+SHINGLE_SIZE = 4
+DEFAULT_THRESHOLD = 0.8
+
+# Premier de Mersenne 2^61 - 1 : hachage universel (a·x + b) mod p
+_PRIME = (1 << 61) - 1
+_WORD_RE = re.compile(r'\w+')
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Empreintes des suites de ``size`` mots du texte normalisé (casse, accents, espaces)"""
+    words = _WORD_RE.findall(normalize_text(text))
+    if len(words) <= size:
+        grams = [' '.join(words)]
+    else:
+        grams = [' '.join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    return {
+        int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=8).digest(), 'little')
+        for gram in grams
+    }
+
+
+class MinHasher:
+    """Signatures MinHash : la proportion de valeurs égales entre deux signatures
+    estime la similarité de Jaccard des ensembles de n-grammes"""
+
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._perms = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+
+    def signature(self, text):
+        hashes = shingles(text)
+        return tuple(min([(a * h + b) % _PRIME for h in hashes]) for a, b in self._perms)
+
+    @staticmethod
+    def similarity(first, second):
+        return sum(x == y for x, y in zip(first, second)) / len(first)
+
+
+class NearDuplicateIndex:
+    """Index LSH persistant des éléments de flux, pour écarter les quasi-doublons.
+
+    Chaque élément reçoit une signature MinHash, découpée en bandes ; deux
+    éléments qui partagent une bande sont candidats, puis comparés sur la
+    signature complète (``threshold``). Les éléments proches forment une
+    grappe, représentée par le premier élément vu : seul le représentant est
+    classé et enregistré, les autres sont écartés dès la lecture du flux.
+
+    Une grappe dont le représentant n'a jamais été écrit (échec, interruption)
+    ne fait pas écarter ses variantes lors d'une exécution suivante : la
+    première variante rencontrée devient le nouveau représentant.
+    """
+
+    def __init__(self, path=None, threshold=DEFAULT_THRESHOLD, num_perm=NUM_PERM, bands=BANDS):
+        if num_perm % bands:
+            raise ValueError(f"{num_perm} permutations non divisibles en {bands} bandes")
+        self.path = path or os.path.join(cache_dir(), 'near_duplicates.sqlite3')
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm)
+        self.stats = {'checked': 0, 'duplicates': 0, 'clusters': 0}
+        # Grappes créées par cette exécution, pas encore écrites
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS clusters (
+                key TEXT PRIMARY KEY,
+                theme TEXT,
+                stored INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS members (
+                key TEXT PRIMARY KEY,
+                cluster TEXT NOT NULL,
+                signature BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS bands (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (band, bucket, key)
+            );
+        """)
+        self._conn.commit()
+
+    def _buckets(self, signature):
+        for band in range(self.bands):
+            rows = signature[band * self.rows:(band + 1) * self.rows]
+            digest = hashlib.blake2b(struct.pack(f'<{self.rows}Q', *rows), digest_size=8).digest()
+            yield band, int.from_bytes(digest, 'little', signed=True)
+
+    def _candidates(self, buckets):
+        clause = ' OR '.join('(b.band = ? AND b.bucket = ?)' for _ in buckets)
+        params = [value for bucket in buckets for value in bucket]
+        return self._conn.execute(
+            "SELECT DISTINCT m.key, m.cluster, m.signature, c.stored FROM bands AS b "
+            "JOIN members AS m ON m.key = b.key JOIN clusters AS c ON c.key = m.cluster "
+            f"WHERE {clause}",
+            params
+        ).fetchall()
+
+    def check(self, key, text):
+        """Enregistre l'élément ``key`` ; retourne le représentant de sa grappe s'il
+        s'agit d'un quasi-doublon d'un élément écrit ou en cours d'écriture, sinon None"""
+        signature = self.hasher.signature(text)
+        buckets = list(self._buckets(signature))
+        with self._lock:
+            self.stats['checked'] += 1
+            best, best_score = None, self.threshold
+            for other, cluster, blob, stored in self._candidates(buckets):
+                if other == key:
+                    continue
+                score = self.hasher.similarity(signature, struct.unpack(f'<{len(signature)}Q', blob))
+                if score >= best_score and (stored or cluster in self._pending):
+                    best, best_score = cluster, score
+
+            cluster = best if best is not None and best != key else key
+            if cluster == key:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO clusters (key, created_at) VALUES (?, ?)", (key, time.time())
+                )
+                self._pending.add(key)
+                self.stats['clusters'] += 1
+            self._conn.execute(
+                "INSERT OR REPLACE INTO members (key, cluster, signature) VALUES (?, ?, ?)",
+                (key, cluster, struct.pack(f'<{len(signature)}Q', *signature))
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO bands (band, bucket, key) VALUES (?, ?, ?)",
+                [(band, bucket, key) for band, bucket in buckets]
+            )
+            # Validé avec le représentant (``stored``) : une grappe jamais écrite
+            # n'a pas à survivre à une interruption
+
+        if cluster == key:
+            return None
+        self.stats['duplicates'] += 1
+        metrics.duplicates_skipped().inc(reason='near_duplicate')
+        return cluster
+
+    def is_stored(self, key):
+        """Vrai si le représentant ``key`` est déjà écrit (ici ou par une exécution précédente)"""
+        with self._lock:
+            row = self._conn.execute("SELECT stored FROM clusters WHERE key = ?", (key,)).fetchone()
+        return bool(row and row[0])
+
+    def stored(self, key, theme=None):
+        """Le représentant ``key`` est écrit : ses variantes seront écartées"""
+        with self._lock:
+            self._conn.execute("UPDATE clusters SET stored = 1, theme = ? WHERE key = ?", (theme, key))
+            self._conn.commit()
+            self._pending.discard(key)
+
+    def merge(self, path):
+        """Intègre l'index d'une autre exécution (par exemple d'un autre fragment)"""
+        with self._lock:
+            self._conn.commit()
+            self._conn.execute("ATTACH DATABASE ? AS other", (path,))
+            try:
+                self._conn.execute("""
+                    INSERT INTO clusters (key, theme, stored, created_at)
+                    SELECT key, theme, stored, created_at FROM other.clusters WHERE true
+                    ON CONFLICT (key) DO UPDATE SET
+                        stored = MAX(stored, excluded.stored),
+                        theme = COALESCE(theme, excluded.theme)
+                """)
+                self._conn.execute("INSERT OR IGNORE INTO members SELECT * FROM other.members")
+                self._conn.execute("INSERT OR IGNORE INTO bands SELECT * FROM other.bands")
+                self._conn.commit()
+            finally:
+                self._conn.execute("DETACH DATABASE other")
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+        logger.info(f"Quasi-doublons : {self.stats['duplicates']} écartés sur "
+                    f"{self.stats['checked']} éléments ({self.stats['clusters']} nouvelles grappes)")
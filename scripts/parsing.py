@@ -0,0 +1,261 @@
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+from bs4.dammit import UnicodeDammit
+from lxml import etree, html as lxml_html
+
+from watermarks import parse_pub_date
+
+# Sélecteurs du contenu principal, par ordre de priorité
+CONTENT_SELECTORS = ['div.article_content', 'div.corps_texte', 'div#main-content']
+
+# Équivalents XPath des sélecteurs CSS ci-dessus
+_CONTENT_XPATHS = [
+    "//div[contains(concat(' ', normalize-space(@class), ' '), ' article_content ')]",
+    "//div[contains(concat(' ', normalize-space(@class), ' '), ' corps_texte ')]",
+    "//div[@id='main-content']"
+]
+
+# Métadonnées portant la date de publication d'une page BOFIP
+DATE_META_NAMES = ['DC.date.modified', 'dcterms.modified', 'DC.date', 'date']
+
+# Éléments dont le texte est ignoré par BeautifulSoup.get_text()
+_SKIPPED_TAGS = {'script', 'style', 'template'}
+
+# Éléments de bloc : chacun ouvre et ferme un paragraphe
+BLOCK_TAGS = {
+    'address', 'article', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'figcaption', 'footer',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'ol', 'p', 'pre', 'section',
+    'table', 'td', 'th', 'tr', 'ul'
+}
+
+_XML_DECLARATION = re.compile(r'^\s*<\?xml[^>]*\?>', re.I)
+
+# Erreurs de libxml2 après lesquelles son arbre peut regrouper le texte autrement
+# que html.parser (balises mal imbriquées) : on se rabat alors sur BeautifulSoup
+_TREE_REPAIR_ERRORS = ('Unexpected end tag', 'Opening and ending tag mismatch')
+
+
+@dataclass
+class FeedItem:
+    """Élément d'un flux RSS, indépendant du parseur utilisé"""
+    title: str = ''
+    description: str = ''
+    link: str = ''
+    guid: str = None
+    pub_date: str = None
+
+
+@dataclass
+class ExtractedPage:
+    title: str
+    content: str
+    stamp: str = None
+    # Texte du contenu principal découpé par éléments de bloc
+    paragraphs: list = None
+
+
+# --- Extraction HTML ------------------------------------------------------
+
+def extract_content(soup):
+    """Extrait le contenu d'une page déjà analysée par BeautifulSoup"""
+    return _content_element(soup).get_text(strip=True)
+
+
+def _content_element(soup):
+    for selector in CONTENT_SELECTORS:
+        element = soup.select_one(selector)
+        if element:
+            return element
+    return soup
+
+
+def extract_page(content, fast=False):
+    """Extrait titre, contenu et date de publication d'une page HTML brute.
+
+    Le mode ``fast`` s'appuie sur le parseur C de lxml et ne parcourt que le
+    sous-arbre du contenu ; le texte produit est identique à celui de
+    BeautifulSoup avec ``html.parser``. Les pages aux balises mal imbriquées,
+    que les deux parseurs réparent différemment, passent par BeautifulSoup.
+    """
+    if fast:
+        page = _extract_page_lxml(content)
+        if page is not None:
+            return page
+    soup = BeautifulSoup(content, 'html.parser')
+    h1 = soup.find('h1')
+    element = _content_element(soup)
+    return ExtractedPage(
+        title=h1.text.strip() if h1 else None,
+        content=element.get_text(strip=True),
+        stamp=_soup_stamp(soup),
+        paragraphs=_soup_paragraphs(element)
+    )
+
+
+def extract_pages(contents, fast=False, workers=0):
+    """Extrait plusieurs pages, éventuellement sur un pool de processus"""
+    contents = list(contents)
+    if workers and len(contents) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(extract_page, contents, [fast] * len(contents)))
+    return [extract_page(content, fast) for content in contents]
+
+
+def _soup_stamp(soup):
+    for name in DATE_META_NAMES:
+        meta = soup.find('meta', attrs={'name': name})
+        if meta and meta.get('content'):
+            return parse_pub_date(meta['content'])
+    return None
+
+
+def _extract_page_lxml(content):
+    # Même détection d'encodage que BeautifulSoup pour un texte identique
+    markup = UnicodeDammit(content, is_html=True).unicode_markup
+    parser = lxml_html.HTMLParser()
+    document = lxml_html.document_fromstring(
+        _XML_DECLARATION.sub('', markup, count=1) or '<html/>',
+        parser=parser
+    )
+    if any(error.message.startswith(_TREE_REPAIR_ERRORS) for error in parser.error_log):
+        return None
+
+    h1 = document.find('.//h1')
+    title = ''.join(_strings(h1)).strip() if h1 is not None else None
+
+    element = document
+    for xpath in _CONTENT_XPATHS:
+        matches = document.xpath(xpath)
+        if matches:
+            element = matches[0]
+            break
+    text = ''.join(s for s in (s.strip() for s in _strings(element)) if s)
+
+    stamp = None
+    for name in DATE_META_NAMES:
+        metas = document.xpath('//meta[@name=$name]/@content', name=name)
+        if metas and metas[0]:
+            stamp = parse_pub_date(metas[0])
+            break
+
+    return ExtractedPage(title=title, content=text, stamp=stamp, paragraphs=_paragraphs(element))
+
+
+def _strings(element):
+    """Chaînes de texte d'un sous-arbre lxml, dans l'ordre du document"""
+    if not isinstance(element.tag, str) or element.tag in _SKIPPED_TAGS:
+        return
+    if element.text:
+        yield element.text
+    for child in element:
+        yield from _strings(child)
+        if child.tail:
+            yield child.tail
+
+
+def _paragraphs(element):
+    """Paragraphes d'un sous-arbre lxml : texte regroupé par élément de bloc"""
+    paragraphs, current = [], []
+
+    def flush():
+        text = ' '.join(current)
+        if text:
+            paragraphs.append(text)
+        current.clear()
+
+    def walk(node):
+        if not isinstance(node.tag, str) or node.tag in _SKIPPED_TAGS:
+            return
+        block = node.tag in BLOCK_TAGS
+        if block:
+            flush()
+        if node.text and node.text.strip():
+            current.append(node.text.strip())
+        for child in node:
+            walk(child)
+            if child.tail and child.tail.strip():
+                current.append(child.tail.strip())
+        if block:
+            flush()
+
+    walk(element)
+    flush()
+    return paragraphs
+
+
+def _soup_paragraphs(element):
+    """Équivalent de ``_paragraphs`` pour un sous-arbre BeautifulSoup"""
+    paragraphs, current = [], []
+
+    def flush():
+        text = ' '.join(current)
+        if text:
+            paragraphs.append(text)
+        current.clear()
+
+    def walk(node):
+        if node.name in _SKIPPED_TAGS:
+            return
+        block = node.name in BLOCK_TAGS
+        if block:
+            flush()
+        for child in node.children:
+            if isinstance(child, Tag):
+                walk(child)
+            elif type(child) in (NavigableString, CData) and child.strip():
+                current.append(child.strip())
+        if block:
+            flush()
+
+    walk(element)
+    flush()
+    return paragraphs
+
+
+# --- Flux RSS -------------------------------------------------------------
+
+def parse_feed(content, streaming=False):
+    """Liste des éléments d'un flux RSS"""
+    if streaming:
+        return list(iter_feed_items(content))
+    soup = BeautifulSoup(content, 'xml')
+    return [
+        FeedItem(
+            title=item.title.text if item.title else '',
+            description=item.description.text if item.description else '',
+            link=item.link.text if item.link else '',
+            guid=item.guid.text.strip() if item.guid and item.guid.text else None,
+            pub_date=item.pubDate.text if item.pubDate else None
+        )
+        for item in soup.find_all('item')
+    ]
+
+
+def iter_feed_items(content):
+    """Lecture en flux des éléments RSS, mémoire libérée au fil de l'eau"""
+    fields = {'title': 'title', 'description': 'description', 'link': 'link',
+              'guid': 'guid', 'pubDate': 'pub_date'}
+    for _, element in etree.iterparse(BytesIO(content), events=('end',), recover=True,
+                                      resolve_entities=False):
+        if _local_name(element.tag) != 'item':
+            continue
+        values = {}
+        for child in element:
+            field = fields.get(_local_name(child.tag))
+            if field and field not in values:
+                values[field] = ''.join(child.itertext())
+        if values.get('guid') is not None:
+            values['guid'] = values['guid'].strip() or None
+        yield FeedItem(**values)
+
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else ''
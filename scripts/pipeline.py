@@ -0,0 +1,193 @@
+import logging
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+
+import metrics
+from scheduler import bind_token, check_cancelled, current_token
+
+logger = logging.getLogger(__name__)
+
+# Capacité par défaut de la file d'entrée de chaque étape
+DEFAULT_QUEUE_SIZE = 32
+
+_STOP = object()
+
+
+@dataclass
+class Stage:
+    """Étape d'un pipeline.
+
+    ``fn`` reçoit un élément et retourne l'élément transmis à l'étape
+    suivante, ou None pour l'écarter ; avec ``fan_out``, elle retourne un
+    itérable d'éléments. Avec ``batch_size``, elle reçoit une liste (jusqu'à
+    ``batch_size`` éléments déjà en attente) et retourne une liste de même
+    longueur.
+    """
+    name: str
+    fn: object
+    workers: int = 1
+    batch_size: int = None
+    fan_out: bool = False
+    queue_size: int = None
+
+
+class Pipeline:
+    """Étapes reliées par des files bornées, chacune servie par ses propres threads.
+
+    Une étape lente remplit sa file d'entrée ; l'étape précédente se bloque
+    alors sur ``put`` au lieu d'accumuler des éléments (contre-pression) : la
+    mémoire reste bornée par la somme des capacités des files. La profondeur
+    de chaque file est publiée dans la jauge ``collector_queue_depth`` (valeur
+    et maximum atteint) : l'étape goulot est celle dont la file reste pleine.
+
+    Une erreur sur un élément est journalisée et n'arrête pas le pipeline ;
+    une annulation de la source (``SourceCancelled``) l'arrête et est relancée
+    par ``run`` une fois les threads terminés.
+    """
+
+    def __init__(self, name, stages, queue_size=DEFAULT_QUEUE_SIZE):
+        self.name = name
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stats = {stage.name: {'in': 0, 'out': 0, 'errors': 0} for stage in stages}
+        self._queues = []
+        self._abort = None
+        self._lock = threading.Lock()
+
+    def run(self, items):
+        """Fait passer ``items`` dans toutes les étapes ; retourne les statistiques"""
+        token = current_token()
+        self._abort = None
+        self._queues = [queue.Queue(maxsize=stage.queue_size or self.queue_size) for stage in self.stages]
+        threads = []
+        for index, stage in enumerate(self.stages):
+            threads.append([
+                threading.Thread(target=self._work, args=(token, index), daemon=True,
+                                 name=f"{self.name}-{stage.name}-{n}")
+                for n in range(max(1, stage.workers))
+            ])
+            for thread in threads[-1]:
+                thread.start()
+
+        started = time.monotonic()
+        try:
+            for item in items:
+                if self._abort is not None:
+                    break
+                check_cancelled()
+                self._put(0, item)
+        except BaseException as e:
+            self._set_abort(e)
+        finally:
+            # Arrêt étape par étape : une étape ne s'arrête qu'une fois la précédente vidée
+            for index, stage_threads in enumerate(threads):
+                for _ in stage_threads:
+                    self._queues[index].put(_STOP)
+                for thread in stage_threads:
+                    thread.join()
+                self._observe_depth(index)
+
+        logger.info(f"Pipeline {self.name} terminé en {time.monotonic() - started:.1f}s : "
+                    + ', '.join(f"{name} {stats['in']}→{stats['out']}"
+                                + (f" ({stats['errors']} erreurs)" if stats['errors'] else '')
+                                for name, stats in self.stats.items()))
+        if self._abort is not None:
+            raise self._abort
+        return self.stats
+
+    def depths(self):
+        """Profondeur actuelle de la file d'entrée de chaque étape"""
+        return {stage.name: q.qsize() for stage, q in zip(self.stages, self._queues)}
+
+    # --- Threads d'étape --------------------------------------------------
+
+    def _work(self, token, index):
+        bind_token(token)
+        stage = self.stages[index]
+        stopped = False
+        while not stopped:
+            item = self._queues[index].get()
+            if item is _STOP:
+                break
+            batch = [item]
+            while stage.batch_size and len(batch) < stage.batch_size:
+                try:
+                    item = self._queues[index].get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopped = True
+                    break
+                batch.append(item)
+            self._observe_depth(index)
+            if self._abort is not None:
+                # Après une annulation, les éléments restants sont écartés
+                continue
+            self._process(index, stage, batch)
+        bind_token(None)
+
+    def _process(self, index, stage, batch):
+        with self._lock:
+            self.stats[stage.name]['in'] += len(batch)
+        started = time.perf_counter()
+        try:
+            check_cancelled()
+            if stage.batch_size:
+                results = stage.fn(batch)
+            else:
+                result = stage.fn(batch[0])
+                results = list(result or ()) if stage.fan_out else [result]
+        except Exception as e:
+            logger.error(f"Erreur étape {stage.name} ({self.name}) : {str(e)}")
+            with self._lock:
+                self.stats[stage.name]['errors'] += len(batch)
+            metrics.stage_items().inc(len(batch), pipeline=self.name, stage=stage.name, outcome='error')
+            return
+        except BaseException as e:
+            self._set_abort(e)
+            return
+        finally:
+            metrics.stage_latency().observe(time.perf_counter() - started,
+                                            pipeline=self.name, stage=stage.name)
+
+        results = [result for result in results if result is not None]
+        with self._lock:
+            self.stats[stage.name]['out'] += len(results)
+        metrics.stage_items().inc(len(results), pipeline=self.name, stage=stage.name, outcome='out')
+        if index + 1 < len(self.stages):
+            for result in results:
+                self._put(index + 1, result)
+
+    # --- Files --------------------------------------------------------------
+
+    def _put(self, index, item):
+        """Ajout bloquant tant que la file est pleine (contre-pression), sauf après annulation"""
+        while True:
+            try:
+                self._queues[index].put(item, timeout=0.1)
+                break
+            except queue.Full:
+                if self._abort is not None:
+                    return
+        self._observe_depth(index)
+
+    def _observe_depth(self, index):
+        metrics.queue_depth().set(self._queues[index].qsize(),
+                                  pipeline=self.name, stage=self.stages[index].name)
+
+    def _set_abort(self, error):
+        with self._lock:
+            if self._abort is None:
+                self._abort = error
+
+
+def workers_from_env(defaults):
+    """COLLECTOR_STAGE_WORKERS="fetch=8,classify=2" surcharge le nombre de threads par étape"""
+    workers = dict(defaults)
+    for item in filter(None, os.environ.get('COLLECTOR_STAGE_WORKERS', '').split(',')):
+        name, _, count = item.partition('=')
+        workers[name.strip()] = int(count)
+    return workers
@@ -0,0 +1,136 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from rate_limiter import get_rate_limiter
+
+OAUTH_URL = "https://oauth.piste.gouv.fr/api/oauth/token"
+LEGIFRANCE_BASE_URL = "https://api.piste.gouv.fr/dila/legifrance/lf-engine-app"
+
+
+class PisteClient:
+    """Client partagé pour les API PISTE (Légifrance).
+
+    Une seule ``requests.Session`` garde les connexions ouvertes (pool
+    keep-alive). Le jeton OAuth est mis en cache et renouvelé avant son
+    expiration ; une réponse 401 provoque un renouvellement puis un nouvel
+    essai de la requête. Le débit est réglé par le ``RateLimiter`` partagé.
+    """
+
+    def __init__(self, client_id=None, client_secret=None, base_url=LEGIFRANCE_BASE_URL,
+                 oauth_url=OAUTH_URL, pool_size=10, refresh_margin=60, timeout=30, limiter=None):
+        self.client_id = client_id or os.environ.get('LEGIFRANCE_CLIENT_ID')
+        self.client_secret = client_secret or os.environ.get('LEGIFRANCE_CLIENT_SECRET')
+        self.base_url = base_url.rstrip('/')
+        self.oauth_url = oauth_url
+        self.refresh_margin = refresh_margin
+        self.timeout = timeout
+        self.limiter = limiter or get_rate_limiter()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.token = None
+        self.token_expires_at = 0
+        self._token_lock = threading.Lock()
+
+    def authenticate(self):
+        """Obtient un jeton ; retourne False en cas d'échec"""
+        try:
+            self.get_token()
+            return True
+        except requests.RequestException:
+            return False
+
+    def get_token(self, force=False):
+        """Jeton OAuth courant, renouvelé s'il expire dans moins de ``refresh_margin`` s"""
+        with self._token_lock:
+            if not force and self.token and time.time() < self.token_expires_at - self.refresh_margin:
+                return self.token
+
+            data = {
+                'grant_type': 'client_credentials',
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+                'scope': 'openid'
+            }
+            logging.info("Tentative d'obtention du token OAuth...")
+            response = self._send('POST', self.oauth_url, data=data, timeout=self.timeout)
+            if response.status_code != 200:
+                logging.error(f"Erreur d'authentification: {response.text}")
+                raise requests.HTTPError(
+                    f"Échec de l'authentification PISTE ({response.status_code})",
+                    response=response
+                )
+
+            payload = response.json()
+            self.token = payload['access_token']
+            self.token_expires_at = time.time() + int(payload.get('expires_in', 3600))
+            logging.info("Token OAuth obtenu avec succès")
+            return self.token
+
+    def get_headers(self):
+        return {
+            'Authorization': f'Bearer {self.get_token()}',
+            'accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+
+    def request(self, method, path, **kwargs):
+        """Requête authentifiée ; renouvelle le jeton et réessaie une fois sur 401"""
+        url = path if path.startswith('http') else f"{self.base_url}{path}"
+        kwargs.setdefault('timeout', self.timeout)
+
+        response = self._send(method, url, headers=self.get_headers(), **kwargs)
+        if response.status_code == 401:
+            logging.warning("Token refusé (401), renouvellement...")
+            self.get_token(force=True)
+            response = self._send(method, url, headers=self.get_headers(), **kwargs)
+        return response
+
+    def _send(self, method, url, **kwargs):
+        """Envoie une requête sous le contrôle du limiteur de débit"""
+        attempt = 0
+        while True:
+            self.limiter.acquire(url)
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException:
+                latency = time.monotonic() - started
+                self._observe(url, 0, latency, 0)
+                delay = self.limiter.record(url, 0, latency, attempt=attempt)
+                if delay is None:
+                    raise
+            else:
+                latency = time.monotonic() - started
+                self._observe(url, response.status_code, latency, len(response.content))
+                delay = self.limiter.record(url, response.status_code, latency,
+                                            response.headers, attempt)
+                if delay is None:
+                    return response
+            time.sleep(delay)
+            attempt += 1
+
+    def _observe(self, url, status, latency, size):
+        service = self.limiter.bucket(url).name
+        metrics.fetch_latency().observe(latency, service=service)
+        metrics.fetch_requests().inc(service=service, status=status)
+        if size:
+            metrics.fetch_bytes().inc(size, service=service)
+
+    def post(self, path, json=None, **kwargs):
+        return self.request('POST', path, json=json, **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from http_cache import get_header
+
+logger = logging.getLogger(__name__)
+
+# Budget initial par service : (requêtes par seconde, rafale)
+DEFAULT_BUDGETS = {
+    'piste': (5.0, 10),
+    'legifrance': (1.0, 2),
+    'bofip': (2.0, 4),
+    'parliament': (2.0, 4),
+    'mistral': (1.0, 2),
+    'default': (2.0, 4)
+}
+
+HOST_BUDGETS = {
+    'api.piste.gouv.fr': 'piste',
+    'oauth.piste.gouv.fr': 'piste',
+    'www.legifrance.gouv.fr': 'legifrance',
+    'bofip.impots.gouv.fr': 'bofip',
+    'questions.assemblee-nationale.fr': 'parliament',
+    'www.senat.fr': 'parliament',
+    'api.mistral.ai': 'mistral'
+}
+
+# Statuts qui signalent une surcharge et justifient un nouvel essai
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+def parse_retry_after(value):
+    """Convertit un en-tête Retry-After (secondes ou date HTTP) en secondes"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Attente exponentielle avec gigue complète"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class TokenBucket:
+    """Seau à jetons dont le débit s'adapte à la latence et aux erreurs.
+
+    Le débit augmente de façon additive tant que les réponses restent rapides
+    et diminue de façon multiplicative sur latence excessive, erreur ou 429.
+    """
+
+    def __init__(self, name, rate, capacity, latency_target=2.0):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.min_rate = rate / 10
+        self.max_rate = rate * 4
+        self.step = rate / 10
+        self.latency_target = latency_target
+        self.latency = None
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Réserve un jeton ; retourne le temps d'attente avant de l'utiliser"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def on_success(self, latency):
+        with self._lock:
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            if self.latency > self.latency_target:
+                self.rate = max(self.min_rate, self.rate * 0.9)
+            else:
+                self.rate = min(self.max_rate, self.rate + self.step)
+
+    def on_error(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * 0.75)
+
+    def on_throttle(self, retry_after=None):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * 0.5)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+
+class RateLimiter:
+    """Ordonnanceur à seaux de jetons, un budget par service distant"""
+
+    def __init__(self, budgets=None, max_retries=4):
+        self.budgets = dict(DEFAULT_BUDGETS)
+        self.budgets.update(budgets or {})
+        self.max_retries = max_retries
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, key):
+        """Seau associé à un nom de budget ou à une URL"""
+        name = key if key in self.budgets else HOST_BUDGETS.get(urlsplit(key).netloc, 'default')
+        with self._lock:
+            if name not in self._buckets:
+                rate, capacity = self.budgets[name]
+                self._buckets[name] = TokenBucket(name, rate, capacity)
+            return self._buckets[name]
+
+    def acquire(self, key):
+        wait = self.bucket(key).reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, key):
+        wait = self.bucket(key).reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def record(self, key, status, latency, headers=None, attempt=0):
+        """Met à jour le débit ; retourne l'attente avant un nouvel essai, ou None"""
+        bucket = self.bucket(key)
+        if status in RETRY_STATUSES:
+            retry_after = parse_retry_after(get_header(headers or {}, 'Retry-After'))
+            bucket.on_throttle(retry_after)
+            if attempt >= self.max_retries:
+                return None
+            delay = retry_after if retry_after is not None else backoff_delay(attempt)
+            logger.warning(f"{bucket.name} : statut {status}, nouvel essai dans {delay:.1f}s")
+            return delay
+        if status is None or status == 0 or status >= 500:
+            bucket.on_error()
+            if attempt >= self.max_retries:
+                return None
+            return backoff_delay(attempt)
+        bucket.on_success(latency)
+        return None
+
+    def rates(self):
+        with self._lock:
+            return {name: round(bucket.rate, 3) for name, bucket in self._buckets.items()}
+
+
+def _budgets_from_env():
+    """COLLECTOR_RATE_LIMITS="piste=5,bofip=2" surcharge les débits initiaux"""
+    budgets = {}
+    for item in filter(None, os.environ.get('COLLECTOR_RATE_LIMITS', '').split(',')):
+        name, _, rate = item.partition('=')
+        rate = float(rate)
+        budgets[name.strip()] = (rate, max(1, int(rate * 2)))
+    return budgets
+
+
+_shared_limiter = None
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Ordonnanceur partagé par tous les clients d'un même processus"""
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter(_budgets_from_env())
+        return _shared_limiter
@@ -0,0 +1,195 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from dataclasses import asdict, dataclass
+from datetime import datetime
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Budget de temps par défaut d'une source (secondes)
+DEFAULT_BUDGET = 1800
+
+# Délai laissé à une source annulée pour atteindre un point d'annulation
+CANCEL_GRACE = 60
+
+_current = threading.local()
+
+
+class SourceCancelled(BaseException):
+    """Levée dans une source dont le budget est épuisé ou qui a été annulée.
+
+    Comme ``asyncio.CancelledError``, elle dérive de ``BaseException`` pour
+    traverser les ``except Exception`` des collecteurs.
+    """
+
+
+class CancelToken:
+    """Annulation coopérative d'une source : échéance et drapeau d'arrêt"""
+
+    def __init__(self, source, budget=None):
+        self.source = source
+        self.deadline = time.monotonic() + budget if budget else None
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self._event.set()
+        return self._event.is_set()
+
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+
+def current_token():
+    """Jeton de la source exécutée par le thread courant (None hors ordonnanceur)"""
+    return getattr(_current, 'token', None)
+
+
+def bind_token(token):
+    """Rattache le thread courant à une source : ses ``check_cancelled`` suivent son jeton.
+
+    Utilisé par les threads auxiliaires d'une source (étapes de pipeline).
+    """
+    _current.token = token
+
+
+def check_cancelled():
+    """Point d'annulation : lève ``SourceCancelled`` si la source courante doit s'arrêter.
+
+    À appeler entre deux étapes d'une collecte ; sans source en cours
+    (appel direct hors ordonnanceur), ne fait rien.
+    """
+    token = current_token()
+    if token is not None and token.cancelled:
+        raise SourceCancelled(f"Source {token.source} interrompue")
+
+
+@dataclass
+class SourceResult:
+    source: str
+    status: str = 'pending'
+    duration: float = 0.0
+    error: str = None
+
+
+class SourceScheduler:
+    """Exécute les sources de collecte en parallèle, chacune isolée des autres.
+
+    Chaque source tourne dans son propre thread avec un budget de temps ;
+    à l'échéance, son jeton est annulé et elle s'arrête au prochain appel
+    de ``check_cancelled`` ; une source encore bloquée ``grace`` secondes
+    plus tard est abandonnée. Une erreur dans une source n'interrompt pas
+    les autres ; ``run`` retourne un rapport avec l'état de chaque source
+    (``ok``, ``error``, ``timeout``).
+
+    Le thread d'une source abandonnée continue jusqu'à son prochain point
+    d'annulation : ``join`` l'attend, à appeler avant de fermer les
+    ressources qu'il partage (écriture, caches, sessions HTTP).
+    """
+
+    def __init__(self, budgets=None, default_budget=DEFAULT_BUDGET, max_workers=None,
+                 grace=CANCEL_GRACE):
+        self.budgets = dict(budgets or {})
+        self.default_budget = default_budget
+        self.max_workers = max_workers
+        self.grace = grace
+        self._abandoned = {}
+
+    def run(self, sources):
+        """Exécute ``sources`` (liste de (nom, fonction)) ; retourne le rapport"""
+        started_at = datetime.now()
+        started = time.monotonic()
+        results = {name: SourceResult(name) for name, _ in sources}
+        tokens = {}
+
+        pool = ThreadPoolExecutor(max_workers=self.max_workers or len(sources) or 1,
+                                  thread_name_prefix='source')
+        futures = {}
+        for name, collect in sources:
+            tokens[name] = CancelToken(name, self.budgets.get(name, self.default_budget))
+            futures[name] = pool.submit(self._run_source, tokens[name], collect, results[name])
+
+        abandoned = False
+        for name, future in futures.items():
+            token = tokens[name]
+            try:
+                future.result(timeout=token.remaining())
+            except FutureTimeoutError:
+                token.cancel()
+                logger.warning(f"Budget de la source {name} épuisé, annulation demandée")
+                try:
+                    future.result(timeout=self.grace)
+                except FutureTimeoutError:
+                    logger.error(f"Source {name} bloquée, abandonnée")
+                    results[name].status = 'timeout'
+                    results[name].error = "Source abandonnée après annulation"
+                    self._abandoned[name] = future
+                    abandoned = True
+        pool.shutdown(wait=not abandoned, cancel_futures=True)
+
+        report = {
+            'started_at': started_at.isoformat(timespec='seconds'),
+            'duration': round(time.monotonic() - started, 3),
+            'sources': [asdict(results[name]) for name, _ in sources]
+        }
+        for result in results.values():
+            logger.info(f"Source {result.source} : {result.status} en {result.duration:.1f}s"
+                        + (f" ({result.error})" if result.error else ''))
+        return report
+
+    def join(self):
+        """Attend la fin des sources abandonnées par ``run``"""
+        pending = [name for name, future in self._abandoned.items() if not future.done()]
+        if pending:
+            logger.warning(f"Attente de la fin des sources abandonnées : {', '.join(pending)}")
+        wait(list(self._abandoned.values()))
+        self._abandoned = {}
+
+    def _run_source(self, token, collect, result):
+        _current.token = token
+        started = time.monotonic()
+        try:
+            collect()
+            result.status = 'timeout' if token.cancelled else 'ok'
+        except SourceCancelled as e:
+            result.status = 'timeout'
+            result.error = str(e)
+        except Exception as e:
+            logger.error(f"Erreur source {result.source} : {str(e)}")
+            result.status = 'error'
+            result.error = str(e)
+        finally:
+            _current.token = None
+            result.duration = round(time.monotonic() - started, 3)
+            metrics.source_duration().observe(result.duration, source=result.source)
+            metrics.source_runs().inc(source=result.source, status=result.status)
+
+
+def budgets_from_env():
+    """COLLECTOR_SOURCE_BUDGETS="bofip=600,parliament=300" fixe le budget (s) par source"""
+    budgets = {}
+    for item in filter(None, os.environ.get('COLLECTOR_SOURCE_BUDGETS', '').split(',')):
+        name, _, seconds = item.partition('=')
+        budgets[name.strip()] = float(seconds)
+    return budgets
+
+
+def write_report(report, directory=None):
+    """Écrit le rapport d'exécution à côté des métriques"""
+    directory = directory or os.environ.get('COLLECTOR_METRICS_DIR', 'metrics')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, 'run_report.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    return path
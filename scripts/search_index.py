@@ -0,0 +1,529 @@
+import argparse
+import heapq
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import unicodedata
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+
+from article_plan import LATIN_SUFFIXES, canonical_article
+from http_cache import cache_dir
+
+logger = logging.getLogger(__name__)
+
+# --- Analyse du texte -------------------------------------------------------
+
+FRENCH_STOPWORDS = set("""
+a au aux avec ce ces cet cette dans de des du elle en et eux il ils je la le les leur leurs lui
+ma mais me meme mes moi mon ne nos notre nous on ou par pas pour qu que qui sa se ses son sur ta
+te tes toi ton tu un une vos votre vous c d j l m n s t y ete etre est sont a ont avait sous
+ainsi dont si sans entre lorsque tout tous toute toutes autre autres cas selon
+article articles alinea alineas
+""".split())
+
+# Abréviations courantes des textes juridiques
+ABBREVIATIONS = {
+    'art': 'article', 'arts': 'articles', 'al': 'alinea', 'cgi': 'cgi', 'bofip': 'bofip',
+    'ann': 'annexe', 'jo': 'jo'
+}
+
+_ELISION = re.compile(r"\b(?:[cdjlmnst]|qu|jusqu|lorsqu|puisqu|quoiqu)'", re.I)
+
+# Références d'articles : « 787 B », « 150-0 A bis », « L. 123-4 », « R* 196-1 »
+_SUFFIX = r'(?:' + '|'.join(sorted(LATIN_SUFFIXES, key=len, reverse=True)) + r')'
+_ARTICLE_PATTERN = (
+    r'(?<![\w.])(?:([LRDA])\s*(?:\.\s*\*?|\*)\s*)?'
+    r'(\d+(?:\s*-\s*\d+)*)'
+    r'((?:\s+(?:{letters}|' + _SUFFIX + r'))*)(?![\w-])'
+)
+_ARTICLE_REF = re.compile(_ARTICLE_PATTERN.format(letters='[A-Z]{1,2}'))
+# En minuscules, seule une lettre isolée est un suffixe (« 787 b du cgi », mais « 10 à 12 »)
+_ARTICLE_REF_QUERY = re.compile(_ARTICLE_PATTERN.format(letters=r'[a-z](?!\s+\d)'), re.I)
+
+_WORD = re.compile(r'[a-z0-9]+(?:-[a-z0-9]+)*')
+
+
+def strip_accents(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in text if not unicodedata.combining(c)).replace('’', "'")
+
+
+def article_token(prefix, number, suffixes):
+    """Jeton unique d'une référence d'article : « 150-0 A bis » -> « 150-0abis »"""
+    number = re.sub(r'\s+', '', number)
+    try:
+        canonical = canonical_article(f"{number} {suffixes}".strip())
+    except ValueError:
+        canonical = number
+    return ((prefix or '') + canonical.replace(' ', '')).lower()
+
+
+def stem(word):
+    """Racinisation minimale : pluriels réguliers"""
+    if len(word) > 4 and word.endswith(('s', 'x')) and not word[-2].isdigit():
+        return word[:-1]
+    return word
+
+
+def tokenize(text, query=False):
+    """Jetons d'un texte juridique français.
+
+    Les références d'articles deviennent un seul jeton (« 787 B » -> « 787b »),
+    les accents et les élisions sont supprimés, « art. » est ramené à
+    « article » puis écarté comme mot vide. Dans une requête, les suffixes
+    d'articles sont reconnus en minuscules (« 787 b »).
+    """
+    text = _ELISION.sub(' ', strip_accents(text))
+    tokens = []
+    pattern = _ARTICLE_REF_QUERY if query else _ARTICLE_REF
+    position = 0
+    for match in pattern.finditer(text):
+        tokens.extend(_word_tokens(text[position:match.start()]))
+        prefix, number, suffixes = match.groups()
+        tokens.append(article_token(prefix.upper() if prefix else None, number, suffixes or ''))
+        position = match.end()
+    tokens.extend(_word_tokens(text[position:]))
+    return tokens
+
+
+def _word_tokens(text):
+    tokens = []
+    for word in _WORD.findall(text.lower()):
+        word = ABBREVIATIONS.get(word, word)
+        if word in FRENCH_STOPWORDS or len(word) < 2:
+            continue
+        tokens.append(stem(word))
+    return tokens
+
+
+# --- Segments mappés en mémoire ---------------------------------------------
+
+_MAGIC = b'BM25SEG1'
+_SECTIONS = [
+    ('term_offsets', 'I'), ('term_blob', 'B'), ('posting_offsets', 'I'), ('post_docs', 'I'),
+    ('post_tfs', 'H'), ('doc_ids', 'q'), ('doc_lengths', 'I'), ('doc_themes', 'H'),
+    ('doc_categories', 'H'), ('stored_offsets', 'Q'), ('stored_blob', 'B')
+]
+
+
+@dataclass
+class SearchHit:
+    doc_id: int
+    score: float
+    title: str = None
+    url: str = None
+    theme: str = None
+    category: str = None
+
+
+def write_segment(path, documents):
+    """Écrit un segment immuable ; ``documents`` : liste de dicts avec ``terms`` (Counter)"""
+    labels = sorted({doc.get('theme') or '' for doc in documents}
+                    | {doc.get('category') or '' for doc in documents})
+    label_codes = {label: code for code, label in enumerate(labels)}
+
+    postings = {}
+    for local, doc in enumerate(documents):
+        for term, tf in doc['terms'].items():
+            postings.setdefault(term.encode(), []).append((local, min(tf, 0xFFFF)))
+    terms = sorted(postings)
+
+    sections = {name: array(code) for name, code in _SECTIONS}
+    sections['term_offsets'].append(0)
+    sections['posting_offsets'].append(0)
+    blob = bytearray()
+    for term in terms:
+        blob += term
+        sections['term_offsets'].append(len(blob))
+        for local, tf in postings[term]:
+            sections['post_docs'].append(local)
+            sections['post_tfs'].append(tf)
+        sections['posting_offsets'].append(len(sections['post_docs']))
+    sections['term_blob'] = array('B', bytes(blob))
+
+    stored = bytearray()
+    sections['stored_offsets'].append(0)
+    for doc in documents:
+        sections['doc_ids'].append(doc['doc_id'])
+        sections['doc_lengths'].append(doc['length'])
+        sections['doc_themes'].append(label_codes[doc.get('theme') or ''])
+        sections['doc_categories'].append(label_codes[doc.get('category') or ''])
+        stored += json.dumps({'title': doc.get('title'), 'url': doc.get('url')},
+                             ensure_ascii=False).encode()
+        sections['stored_offsets'].append(len(stored))
+    sections['stored_blob'] = array('B', bytes(stored))
+
+    # En-tête JSON puis sections alignées sur 8 octets
+    layout, offset = {}, 0
+    for name, _ in _SECTIONS:
+        size = len(sections[name]) * sections[name].itemsize
+        layout[name] = [offset, size]
+        offset += size + (-size % 8)
+    header = json.dumps({'documents': len(documents), 'terms': len(terms), 'labels': labels,
+                         'layout': layout}).encode()
+    header += b' ' * (-(len(_MAGIC) + 4 + len(header)) % 8)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_MAGIC + struct.pack('<I', len(header)) + header)
+        for name, _ in _SECTIONS:
+            data = sections[name].tobytes()
+            f.write(data + b'\0' * (-len(data) % 8))
+    os.replace(tmp_path, path)
+
+
+class Segment:
+    """Lecture d'un segment par mmap : aucune donnée n'est chargée à l'ouverture"""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"Segment d'index invalide : {path}")
+        header_size = struct.unpack_from('<I', self._mmap, len(_MAGIC))[0]
+        start = len(_MAGIC) + 4
+        header = json.loads(bytes(self._mmap[start:start + header_size]))
+        base = start + header_size
+        self.documents = header['documents']
+        self.term_count = header['terms']
+        self.labels = header['labels']
+        self._views = {}
+        view = memoryview(self._mmap)
+        for name, code in _SECTIONS:
+            offset, size = header['layout'][name]
+            self._views[name] = view[base + offset:base + offset + size].cast(code)
+            setattr(self, name, self._views[name])
+        view.release()
+
+    def term_index(self, term):
+        """Rang du terme dans le lexique trié (recherche dichotomique), ou None"""
+        key = term.encode()
+        offsets, blob = self._views['term_offsets'], self._views['term_blob']
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            current = blob[offsets[middle]:offsets[middle + 1]].tobytes()
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def postings(self, term):
+        """(numéros locaux, fréquences) du terme, sous forme de vues mémoire"""
+        index = self.term_index(term)
+        if index is None:
+            return None, None
+        start, end = self.posting_offsets[index], self.posting_offsets[index + 1]
+        return self.post_docs[start:end], self.post_tfs[start:end]
+
+    def terms(self):
+        offsets, blob = self._views['term_offsets'], self._views['term_blob']
+        for index in range(self.term_count):
+            yield index, blob[offsets[index]:offsets[index + 1]].tobytes().decode()
+
+    def stored(self, local):
+        offsets = self._views['stored_offsets']
+        return json.loads(self._views['stored_blob'][offsets[local]:offsets[local + 1]].tobytes())
+
+    def label(self, code):
+        return self.labels[code] or None
+
+    def close(self):
+        for name, view in self._views.items():
+            delattr(self, name)
+            view.release()
+        self._views = {}
+        self._mmap.close()
+        self._file.close()
+
+
+# --- Index ------------------------------------------------------------------
+
+class SearchIndex:
+    """Index inversé BM25 des documents collectés, mis à jour de façon incrémentale.
+
+    Les documents ajoutés sont mis en tampon puis écrits par ``commit`` dans
+    un nouveau segment immuable, lu par mmap. Un document réindexé (même
+    ``doc_id``) masque sa version précédente ; au-delà de ``max_segments``
+    segments, ils sont fusionnés. Le manifeste (liste des segments, documents
+    supprimés) est remplacé de façon atomique à chaque ``commit``.
+    """
+
+    TITLE_BOOST = 2
+
+    def __init__(self, path=None, k1=1.2, b=0.75, max_segments=8):
+        self.path = path or os.path.join(cache_dir(), 'search_index')
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max_segments
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._buffer = {}
+        self._manifest = self._load_manifest()
+        self._segments = {
+            name: Segment(os.path.join(self.path, name)) for name in self._manifest['segments']
+        }
+
+    # --- Écriture ---------------------------------------------------------
+
+    def add(self, doc_id, title, content, theme=None, category=None, url=None):
+        """Indexe (ou réindexe) un document ; visible après ``commit``"""
+        terms = Counter(tokenize(content))
+        for term in tokenize(title or ''):
+            terms[term] += self.TITLE_BOOST
+        with self._lock:
+            self._buffer[int(doc_id)] = {
+                'doc_id': int(doc_id), 'title': title, 'url': url, 'theme': theme,
+                'category': category, 'terms': terms, 'length': sum(terms.values())
+            }
+
+    def add_documents(self, documents):
+        """Indexe des enregistrements issus de ``DocumentWriter`` puis valide"""
+        for doc in documents:
+            self.add(doc['id'], doc['title'], doc['content'], doc.get('theme'),
+                     doc.get('doc_type'), doc.get('source_url'))
+        self.commit()
+
+    def delete(self, doc_id):
+        with self._lock:
+            self._buffer.pop(int(doc_id), None)
+            self._tombstone(int(doc_id))
+
+    def commit(self):
+        """Écrit les documents en tampon dans un nouveau segment"""
+        with self._lock:
+            if not self._buffer:
+                self._save_manifest()
+                return
+            documents = list(self._buffer.values())
+            self._buffer = {}
+            for doc in documents:
+                self._tombstone(doc['doc_id'])
+
+            name = self._next_segment_name()
+            write_segment(os.path.join(self.path, name), documents)
+            self._segments[name] = Segment(os.path.join(self.path, name))
+            self._manifest['segments'].append(name)
+            for local, doc in enumerate(documents):
+                self._manifest['live'][str(doc['doc_id'])] = [name, local]
+                self._manifest['total_length'] += doc['length']
+            if len(self._manifest['segments']) > self.max_segments:
+                self._merge()
+            else:
+                self._save_manifest()
+
+    def optimize(self):
+        """Fusionne tous les segments en un seul, sans les documents supprimés"""
+        with self._lock:
+            self.commit()
+            if len(self._manifest['segments']) > 1 or self._manifest['deleted']:
+                self._merge()
+
+    def _tombstone(self, doc_id):
+        location = self._manifest['live'].pop(str(doc_id), None)
+        if location is None:
+            return
+        name, local = location
+        self._manifest['deleted'].setdefault(name, []).append(local)
+        self._manifest['total_length'] -= self._segments[name].doc_lengths[local]
+
+    def _merge(self):
+        names = list(self._manifest['segments'])
+        documents, remap = [], {}
+        for name in names:
+            segment = self._segments[name]
+            deleted = set(self._manifest['deleted'].get(name, []))
+            for local in range(segment.documents):
+                if local in deleted:
+                    continue
+                remap[(name, local)] = len(documents)
+                stored = segment.stored(local)
+                documents.append({
+                    'doc_id': segment.doc_ids[local], 'title': stored['title'], 'url': stored['url'],
+                    'theme': segment.label(segment.doc_themes[local]),
+                    'category': segment.label(segment.doc_categories[local]),
+                    'terms': Counter(), 'length': segment.doc_lengths[local]
+                })
+            for index, term in segment.terms():
+                start, end = segment.posting_offsets[index], segment.posting_offsets[index + 1]
+                for position in range(start, end):
+                    target = remap.get((name, segment.post_docs[position]))
+                    if target is not None:
+                        documents[target]['terms'][term] = segment.post_tfs[position]
+
+        merged = self._next_segment_name()
+        write_segment(os.path.join(self.path, merged), documents)
+        self._segments[merged] = Segment(os.path.join(self.path, merged))
+        self._manifest.update({
+            'segments': [merged],
+            'deleted': {},
+            'live': {str(doc['doc_id']): [merged, local] for local, doc in enumerate(documents)},
+            'total_length': sum(doc['length'] for doc in documents)
+        })
+        self._save_manifest()
+        for name in names:
+            self._segments.pop(name).close()
+            os.remove(os.path.join(self.path, name))
+        logger.info(f"Index fusionné : {len(names)} segments, {len(documents)} documents")
+
+    def _next_segment_name(self):
+        self._manifest['generation'] += 1
+        return f"segment-{self._manifest['generation']:06d}.bm25"
+
+    # --- Manifeste --------------------------------------------------------
+
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.path, 'manifest.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'generation': 0, 'segments': [], 'deleted': {}, 'live': {},
+                    'total_length': 0, 'last_synced_id': 0}
+
+    def _save_manifest(self):
+        path = os.path.join(self.path, 'manifest.json')
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(self._manifest, f)
+        os.replace(f"{path}.tmp", path)
+
+    # --- Recherche --------------------------------------------------------
+
+    def __len__(self):
+        return len(self._manifest['live'])
+
+    def search(self, query, limit=10, theme=None, category=None):
+        """Documents les plus pertinents pour ``query`` (BM25), filtrés par thème et catégorie"""
+        terms = list(dict.fromkeys(tokenize(query, query=True)))
+        with self._lock:
+            total = len(self._manifest['live'])
+            if not terms or not total:
+                return []
+            average_length = self._manifest['total_length'] / total
+            segments = [(self._segments[name], set(self._manifest['deleted'].get(name, [])))
+                        for name in self._manifest['segments']]
+
+            scores = {}
+            for term in terms:
+                found = [(segment, deleted, *segment.postings(term)) for segment, deleted in segments]
+                df = sum(len(docs) for _, _, docs, _ in found if docs is not None)
+                if not df:
+                    continue
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                for segment, deleted, docs, tfs in found:
+                    if docs is None:
+                        continue
+                    theme_code = _label_code(segment, theme)
+                    category_code = _label_code(segment, category)
+                    if theme_code is False or category_code is False:
+                        continue
+                    lengths = segment.doc_lengths
+                    for local, tf in zip(docs, tfs):
+                        if local in deleted:
+                            continue
+                        if theme_code is not None and segment.doc_themes[local] != theme_code:
+                            continue
+                        if category_code is not None and segment.doc_categories[local] != category_code:
+                            continue
+                        norm = self.k1 * (1 - self.b + self.b * lengths[local] / average_length)
+                        key = (segment, local)
+                        scores[key] = scores.get(key, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+            hits = []
+            for (segment, local), score in heapq.nlargest(limit, scores.items(), key=lambda item: item[1]):
+                stored = segment.stored(local)
+                hits.append(SearchHit(
+                    doc_id=segment.doc_ids[local], score=round(score, 4),
+                    title=stored['title'], url=stored['url'],
+                    theme=segment.label(segment.doc_themes[local]),
+                    category=segment.label(segment.doc_categories[local])
+                ))
+            return hits
+
+    def close(self):
+        with self._lock:
+            for segment in self._segments.values():
+                segment.close()
+            self._segments = {}
+
+
+def _label_code(segment, label):
+    """Code du libellé dans le segment ; None sans filtre, False si absent du segment"""
+    if label is None:
+        return None
+    try:
+        return segment.labels.index(label)
+    except ValueError:
+        return False
+
+
+# --- Synchronisation depuis Supabase ----------------------------------------
+
+def sync_from_supabase(index, supabase, page_size=500):
+    """Indexe les documents ajoutés dans Supabase depuis la dernière synchronisation"""
+    themes = {row['id']: row['name'] for row in
+              supabase.table('fiscal_themes').select('id, name').execute().data}
+    categories = {row['id']: row['name'] for row in
+                  supabase.table('document_categories').select('id, name').execute().data}
+    last_id = index._manifest.get('last_synced_id', 0)
+    added = 0
+    while True:
+        rows = supabase.table('documents') \
+            .select('id, title, content, theme_id, category_id, source_url') \
+            .gt('id', last_id) \
+            .order('id') \
+            .limit(page_size) \
+            .execute().data
+        if not rows:
+            break
+        for row in rows:
+            index.add(row['id'], row['title'], row['content'], themes.get(row['theme_id']),
+                      categories.get(row['category_id']), row['source_url'])
+            last_id = max(last_id, row['id'])
+        added += len(rows)
+        index._manifest['last_synced_id'] = last_id
+        index.commit()
+    logger.info(f"Synchronisation de l'index : {added} documents ajoutés")
+    return added
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Index de recherche BM25 des documents collectés")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('sync', help="Indexe les nouveaux documents de Supabase")
+    subparsers.add_parser('optimize', help="Fusionne les segments de l'index")
+    search_parser = subparsers.add_parser('search', help="Recherche dans l'index")
+    search_parser.add_argument('query')
+    search_parser.add_argument('--theme')
+    search_parser.add_argument('--category')
+    search_parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    index = SearchIndex()
+    if args.command == 'sync':
+        from supabase import create_client
+        sync_from_supabase(index, create_client(os.environ.get("SUPABASE_URL"),
+                                                os.environ.get("SUPABASE_KEY")))
+    elif args.command == 'optimize':
+        index.optimize()
+    else:
+        started = time.perf_counter()
+        hits = index.search(args.query, limit=args.limit, theme=args.theme, category=args.category)
+        elapsed = (time.perf_counter() - started) * 1000
+        for hit in hits:
+            print(f"{hit.score:8.3f}  [{hit.theme or '-'}] {hit.title}  {hit.url or ''}")
+        print(f"{len(hits)} résultats en {elapsed:.1f} ms ({len(index)} documents indexés)")
+    index.close()
@@ -0,0 +1,219 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import metrics
+from near_duplicates import NearDuplicateIndex
+from scheduler import write_report
+from watermarks import WatermarkStore
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Shard:
+    """Fragment ``index`` sur ``count`` d'une collecte répartie.
+
+    Chaque unité de travail (URL BOFIP, flux parlementaire, requête
+    thématique Légifrance, article du plan CGI, journée de jurisprudence)
+    appartient à un seul fragment, choisi par une empreinte stable de sa
+    clé : d'une exécution à l'autre, une unité revient au même fragment tant
+    que ``count`` ne change pas.
+    """
+    index: int = 0
+    count: int = 1
+
+    def __post_init__(self):
+        if self.count < 1 or not 0 <= self.index < self.count:
+            raise ValueError(f"Fragment invalide : {self.index}/{self.count}")
+
+    @classmethod
+    def parse(cls, spec):
+        """« 2/4 » : fragment 2 (à partir de 0) sur 4"""
+        index, _, count = str(spec).partition('/')
+        try:
+            return cls(int(index), int(count or 1))
+        except ValueError:
+            raise ValueError(f"Fragment invalide : {spec!r} (attendu : i/N)")
+
+    def owns(self, key):
+        if self.count == 1:
+            return True
+        return shard_of(key, self.count) == self.index
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+
+def shard_of(key, count):
+    """Fragment d'une clé : SHA-256, indépendant du processus (contrairement à ``hash``)"""
+    digest = hashlib.sha256(str(key).encode()).digest()
+    return int.from_bytes(digest[:8], 'big') % count
+
+
+def shard_from_env():
+    """COLLECTOR_SHARD="i/N" ; collecte non répartie par défaut"""
+    spec = os.environ.get('COLLECTOR_SHARD')
+    return Shard.parse(spec) if spec else Shard()
+
+
+# --- Fusion des résultats ----------------------------------------------------
+
+def merge_reports(reports):
+    """Rapport d'exécution commun : état des sources par fragment, écritures additionnées"""
+    merged = {
+        'started_at': min((report['started_at'] for report in reports), default=None),
+        'duration': max((report.get('duration', 0) for report in reports), default=0),
+        'shards': len(reports),
+        'sources': [],
+        'writer': {}
+    }
+    for report in reports:
+        for source in report.get('sources', []):
+            merged['sources'].append(dict(source, shard=report.get('shard')))
+        for name, value in report.get('writer', {}).items():
+            if isinstance(value, (int, float)):
+                merged['writer'][name] = merged['writer'].get(name, 0) + value
+    return merged
+
+
+def merge(metrics_dirs, output, cache_dirs=(), cache_output=None, name='collector'):
+    """Fusionne les métriques, rapports et états de dédoublonnage des fragments.
+
+    ``metrics_dirs`` : répertoires contenant ``<name>.json`` et éventuellement
+    ``run_report.json``. Avec ``cache_dirs`` et ``cache_output``, les marques
+    de collecte et les index de quasi-doublons sont réunis dans un cache
+    commun, utilisable par une collecte non répartie.
+    """
+    registry = metrics.MetricsRegistry()
+    reports = []
+    for directory in metrics_dirs:
+        try:
+            with open(os.path.join(directory, f"{name}.json"), encoding='utf-8') as f:
+                registry.merge(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.error(f"Métriques du fragment {directory} illisibles : {str(e)}")
+            continue
+        try:
+            with open(os.path.join(directory, 'run_report.json'), encoding='utf-8') as f:
+                reports.append(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+    registry.write(output, name=name)
+    if reports:
+        write_report(merge_reports(reports), output)
+    logger.info(f"{len(metrics_dirs)} fragments fusionnés dans {output}")
+
+    if cache_dirs and cache_output:
+        merge_caches(cache_dirs, cache_output)
+
+
+def merge_caches(cache_dirs, output):
+    """Marques de collecte et index de quasi-doublons communs à tous les fragments"""
+    os.makedirs(output, exist_ok=True)
+    watermarks = WatermarkStore(os.path.join(output, 'watermarks.json'))
+    near_duplicates = NearDuplicateIndex(os.path.join(output, 'near_duplicates.sqlite3'))
+    try:
+        for directory in cache_dirs:
+            if os.path.exists(os.path.join(directory, 'watermarks.json')):
+                watermarks.merge(WatermarkStore(os.path.join(directory, 'watermarks.json')))
+            if os.path.exists(os.path.join(directory, 'near_duplicates.sqlite3')):
+                near_duplicates.merge(os.path.join(directory, 'near_duplicates.sqlite3'))
+        watermarks.save()
+    finally:
+        near_duplicates.close()
+
+
+def seed_cache(shared_dir, cache):
+    """Intègre l'index de quasi-doublons commun (issu d'une fusion) dans le cache d'un
+    fragment, avant sa collecte : les grappes écrites par les autres fragments sont
+    reconnues. Les marques de collecte restent propres à chaque fragment."""
+    shared = os.path.join(shared_dir, 'near_duplicates.sqlite3')
+    if not os.path.exists(shared):
+        logger.info(f"Pas d'index de quasi-doublons commun dans {shared_dir}")
+        return
+    os.makedirs(cache, exist_ok=True)
+    near_duplicates = NearDuplicateIndex(os.path.join(cache, 'near_duplicates.sqlite3'))
+    try:
+        near_duplicates.merge(shared)
+    finally:
+        near_duplicates.close()
+
+
+# --- Exécution locale ----------------------------------------------------------
+
+def run_shard(shard, directory, full=False, shared=None):
+    """Collecte d'un fragment dans un processus de travail, avec son propre cache"""
+    if shared:
+        seed_cache(shared, os.path.join(directory, 'cache'))
+    os.environ['COLLECTOR_SHARD'] = str(shard)
+    os.environ['COLLECTOR_CACHE_DIR'] = os.path.join(directory, 'cache')
+    os.environ['COLLECTOR_METRICS_DIR'] = os.path.join(directory, 'metrics')
+    # Un processus du pool peut exécuter plusieurs fragments à la suite
+    metrics.get_metrics().reset()
+
+    # Import tardif : la fusion n'a pas besoin des clients Supabase et OpenAI
+    from collector import LegalDataCollector
+    return LegalDataCollector(full=full).collect_all()
+
+
+def run_local(count, workdir='shards', full=False):
+    """Exécute les ``count`` fragments sur un pool de processus puis fusionne leurs résultats"""
+    directories = [os.path.join(workdir, f"shard-{index}") for index in range(count)]
+    # Cache commun de l'exécution précédente : quasi-doublons vus par tous les fragments
+    shared = os.path.join(workdir, 'cache')
+    with ProcessPoolExecutor(max_workers=count) as pool:
+        futures = [
+            pool.submit(run_shard, Shard(index, count), directory, full, shared)
+            for index, directory in enumerate(directories)
+        ]
+        for index, future in enumerate(futures):
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Fragment {index}/{count} en échec : {str(e)}")
+
+    merge(
+        [os.path.join(directory, 'metrics') for directory in directories],
+        os.path.join(workdir, 'metrics'),
+        cache_dirs=[os.path.join(directory, 'cache') for directory in directories],
+        cache_output=os.path.join(workdir, 'cache')
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Collecte répartie en fragments")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="Exécute tous les fragments localement (pool de processus)")
+    run.add_argument('--shards', type=int, default=os.cpu_count() or 1)
+    run.add_argument('--workdir', default='shards')
+    run.add_argument('--full', action='store_true',
+                     help="Ignore les marques de collecte et force une collecte complète")
+
+    merge_command = commands.add_parser('merge', help="Fusionne les résultats de fragments exécutés séparément")
+    merge_command.add_argument('metrics_dirs', nargs='+', help="Répertoires de métriques des fragments")
+    merge_command.add_argument('--output', default='metrics')
+    merge_command.add_argument('--caches', nargs='*', default=(), help="Caches des fragments à réunir")
+    merge_command.add_argument('--cache-output', help="Cache commun produit à partir de --caches")
+
+    seed = commands.add_parser('seed', help="Intègre l'index de quasi-doublons commun dans le cache d'un fragment")
+    seed.add_argument('shared', help="Cache commun produit par merge --cache-output")
+    seed.add_argument('--cache', default='.cache', help="Cache du fragment")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run_local(args.shards, args.workdir, args.full)
+    elif args.command == 'seed':
+        seed_cache(args.shared, args.cache)
+    else:
+        merge(args.metrics_dirs, args.output, args.caches, args.cache_output)
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import zstandard
+
+from http_cache import cache_dir
+
+logger = logging.getLogger(__name__)
+
+# Niveau de compression zstd : bon compromis pour du HTML et du JSON
+COMPRESSION_LEVEL = 10
+
+
+def object_path(root, content_hash):
+    """Chemin du corps compressé : objects/ab/cdef…zst"""
+    return os.path.join(root, 'objects', content_hash[:2], f"{content_hash[2:]}.zst")
+
+
+def load_snapshot(root, content_hash):
+    """Corps brut d'un instantané ; utilisable depuis un processus de travail"""
+    with open(object_path(root, content_hash), 'rb') as f:
+        return zstandard.ZstdDecompressor().decompress(f.read())
+
+
+class SnapshotStore:
+    """Réponses brutes (HTML, RSS, JSON) conservées pour réextraction sans téléchargement.
+
+    Chaque corps est compressé avec zstd et stocké une seule fois sous son
+    empreinte SHA-256 ; un index SQLite relie chaque récupération (URL,
+    date, type de source, métadonnées de collecte) à son corps. Une page
+    inchangée d'une exécution à l'autre n'ajoute qu'une ligne d'index.
+
+    À la fermeture, les récupérations de plus de ``max_age`` secondes sont
+    oubliées, sauf la dernière de chaque URL (celle que rejoue
+    ``--reprocess``) ; puis les corps les moins récemment récupérés sont
+    évincés tant que leur taille totale dépasse ``max_bytes``.
+    """
+
+    def __init__(self, path=None, level=COMPRESSION_LEVEL, max_bytes=500 * 1024 * 1024,
+                 max_age=30 * 24 * 3600):
+        self.path = path or os.path.join(cache_dir(), 'snapshots')
+        self.level = level
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.stats = {'stored': 0, 'deduplicated': 0, 'raw_bytes': 0, 'compressed_bytes': 0,
+                      'evicted': 0}
+        os.makedirs(os.path.join(self.path, 'objects'), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(self.path, 'index.sqlite3'), check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                url TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                content_hash TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                meta TEXT
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS snapshots_url_idx ON snapshots (kind, url, fetched_at)"
+        )
+        self._conn.commit()
+
+    def put(self, kind, url, content, meta=None):
+        """Enregistre une réponse ; retourne l'empreinte de son corps"""
+        if isinstance(content, str):
+            content = content.encode()
+        content_hash = hashlib.sha256(content).hexdigest()
+        path = object_path(self.path, content_hash)
+        compressed = None
+        if not os.path.exists(path):
+            compressed = zstandard.ZstdCompressor(level=self.level).compress(content)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(compressed)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            if compressed is None:
+                self.stats['deduplicated'] += 1
+            else:
+                self.stats['stored'] += 1
+                self.stats['raw_bytes'] += len(content)
+                self.stats['compressed_bytes'] += len(compressed)
+            self._conn.execute(
+                "INSERT INTO snapshots (kind, url, fetched_at, content_hash, size, meta) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, url, time.time(), content_hash, len(content),
+                 json.dumps(meta, ensure_ascii=False) if meta is not None else None)
+            )
+            self._conn.commit()
+        return content_hash
+
+    def get(self, content_hash):
+        return load_snapshot(self.path, content_hash)
+
+    def latest(self, kinds=None):
+        """Dernière récupération de chaque URL, éventuellement limitée à certains types"""
+        query = """
+            SELECT kind, url, fetched_at, content_hash, meta FROM snapshots AS s
+            WHERE fetched_at = (
+                SELECT MAX(fetched_at) FROM snapshots WHERE kind = s.kind AND url = s.url
+            )
+        """
+        params = []
+        if kinds:
+            query += f" AND kind IN ({','.join('?' * len(kinds))})"
+            params = list(kinds)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY kind, url", params).fetchall()
+        return [
+            {'kind': kind, 'url': url, 'fetched_at': fetched_at, 'content_hash': content_hash,
+             'meta': json.loads(meta) if meta else {}}
+            for kind, url, fetched_at, content_hash, meta in rows
+        ]
+
+    def history(self, url):
+        """Toutes les récupérations d'une URL, de la plus récente à la plus ancienne"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT fetched_at, content_hash, size FROM snapshots WHERE url = ? "
+                "ORDER BY fetched_at DESC",
+                (url,)
+            ).fetchall()
+        return [{'fetched_at': fetched_at, 'content_hash': content_hash, 'size': size}
+                for fetched_at, content_hash, size in rows]
+
+    def prune(self):
+        """Applique la durée de rétention et la taille maximale ; retourne le nombre de corps supprimés"""
+        with self._lock:
+            self._conn.execute(
+                """
+                DELETE FROM snapshots WHERE fetched_at < ? AND fetched_at < (
+                    SELECT MAX(fetched_at) FROM snapshots AS latest
+                    WHERE latest.kind = snapshots.kind AND latest.url = snapshots.url
+                )
+                """,
+                (time.time() - self.max_age,)
+            )
+            # Corps encore référencés, du moins récemment récupéré au plus récent
+            referenced = self._conn.execute(
+                "SELECT content_hash FROM snapshots GROUP BY content_hash ORDER BY MAX(fetched_at) ASC"
+            ).fetchall()
+            referenced = [content_hash for content_hash, in referenced]
+            known = set(referenced)
+
+            removed = 0
+            sizes = {}
+            objects = os.path.join(self.path, 'objects')
+            for prefix in os.listdir(objects):
+                for name in os.listdir(os.path.join(objects, prefix)):
+                    if not name.endswith('.zst'):
+                        continue
+                    content_hash = prefix + name[:-len('.zst')]
+                    path = object_path(self.path, content_hash)
+                    if content_hash in known:
+                        sizes[content_hash] = os.path.getsize(path)
+                    else:
+                        os.remove(path)
+                        removed += 1
+
+            total = sum(sizes.values())
+            for content_hash in referenced:
+                if total <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM snapshots WHERE content_hash = ?", (content_hash,))
+                if content_hash in sizes:
+                    os.remove(object_path(self.path, content_hash))
+                    total -= sizes[content_hash]
+                    removed += 1
+            self._conn.commit()
+            self.stats['evicted'] += removed
+        return removed
+
+    def close(self):
+        try:
+            self.prune()
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f"Erreur lors de l'élagage des instantanés : {str(e)}")
+        with self._lock:
+            self._conn.close()
+        if self.stats['stored']:
+            ratio = self.stats['compressed_bytes'] / max(1, self.stats['raw_bytes'])
+            logger.info(f"Instantanés : {self.stats['stored']} nouveaux corps "
+                        f"(compression {ratio:.0%}), {self.stats['deduplicated']} déjà connus, "
+                        f"{self.stats['evicted']} évincés")
@@ -0,0 +1,331 @@
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+import metrics
+from chunks import chunk_document, chunks_hash, diff_chunks, split_paragraphs
+
+logger = logging.getLogger(__name__)
+
+
+def document_hash(content):
+    """Empreinte SHA-256 utilisée pour dédoublonner les documents"""
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class DocumentWriter:
+    """Écriture groupée des documents dans Supabase.
+
+    Les identifiants de ``fiscal_themes`` et ``document_categories`` sont
+    chargés une seule fois par exécution. Les documents sont mis en tampon ;
+    chaque lot est dédoublonné par une unique requête ``in`` sur
+    ``document_hash`` puis inséré (ou upserté) par paquets.
+
+    Avec ``versioning=True``, chaque document est découpé en paragraphes
+    normalisés et empreints (``document_chunks``). Quand une ``source_url``
+    déjà connue change, la ligne ``documents`` existante est mise à jour au
+    lieu d'être dupliquée ; seuls les paragraphes nouveaux sont écrits, avec
+    une ligne ``document_versions`` qui liste les empreintes de la version.
+
+    ``on_written`` est appelé après chaque écriture avec la liste des
+    documents insérés ou mis à jour (voir ``_written_record``), une fois le
+    verrou du tampon relâché pour ne pas bloquer les autres producteurs. Le rappel
+    ``committed`` passé à ``add`` n'est appelé qu'une fois le lot du
+    document écrit sans erreur ; un document écarté faute de thème ou de
+    catégorie connus ne l'appelle jamais, pour être repris ensuite.
+    """
+
+    def __init__(self, supabase, batch_size=50, upsert=False, versioning=False, on_written=None):
+        self.supabase = supabase
+        self.batch_size = batch_size
+        self.upsert = upsert
+        self.versioning = versioning
+        self.on_written = on_written
+        self.round_trips = 0
+        self.inserted = 0
+        self.updated = 0
+        self.duplicates = 0
+
+        self._themes = None
+        self._categories = None
+        self._theme_names = {}
+        self._category_names = {}
+        self._buffer = []
+        self._buffered_hashes = set()
+        self._chunks = {}
+        self._committed = []
+        self._written = []
+        self._lock = threading.RLock()
+
+    def load_references(self):
+        """Charge les tables de référence (thèmes et catégories)"""
+        themes = self.supabase.table('fiscal_themes').select('id, name').execute()
+        categories = self.supabase.table('document_categories').select('id, name').execute()
+        self.round_trips += 2
+        metrics.supabase_round_trips().inc(2, operation='select')
+        self._themes = {row['name']: row['id'] for row in themes.data}
+        self._categories = {row['name']: row['id'] for row in categories.data}
+        self._theme_names = {theme_id: name for name, theme_id in self._themes.items()}
+        self._category_names = {category_id: name for name, category_id in self._categories.items()}
+        logger.info(
+            f"Références chargées : {len(self._themes)} thèmes, "
+            f"{len(self._categories)} catégories"
+        )
+
+    def add(self, title, content, source_url, theme, doc_type, paragraphs=None, committed=None):
+        """Met un document en tampon ; vide le tampon quand le lot est plein.
+
+        ``paragraphs`` (mode versionné) : découpage du contenu fourni par
+        l'extraction ; à défaut, le contenu est découpé sur les sauts de ligne.
+        """
+        with self._lock:
+            if self._themes is None:
+                self.load_references()
+
+            doc_hash = document_hash(content)
+            if doc_hash in self._buffered_hashes:
+                # Même contenu déjà dans le lot : l'unité est validée avec lui
+                self.duplicates += 1
+                metrics.duplicates_skipped().inc(reason='same_run')
+                if committed:
+                    self._committed.append(committed)
+                return
+
+            theme_id = self._themes.get(theme)
+            category_id = self._categories.get(doc_type)
+            if theme_id is None or category_id is None:
+                logger.warning(f"Thème ou catégorie inconnu ({theme} / {doc_type}) : {title[:100]}")
+                return
+            if committed:
+                self._committed.append(committed)
+
+            self._buffer.append({
+                'title': title,
+                'content': content,
+                'theme_id': theme_id,
+                'category_id': category_id,
+                'publication_date': datetime.now().date().isoformat(),
+                'source_url': source_url,
+                'document_hash': doc_hash
+            })
+            self._buffered_hashes.add(doc_hash)
+            if self.versioning or self.on_written:
+                self._chunks[doc_hash] = chunk_document(
+                    paragraphs if paragraphs is not None else split_paragraphs(content)
+                )
+
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Écrit les documents en tampon qui ne sont pas déjà en base ; faux en cas d'échec"""
+        with self._lock:
+            committed, self._committed = self._committed, []
+            written = self._write_buffer()
+            records, self._written = self._written, []
+        # Étapes suivantes et rappels hors du verrou : add() n'attend pas les vecteurs
+        if records and self.on_written:
+            self.on_written(records)
+        if written:
+            for callback in committed:
+                callback()
+        return written
+
+    def _write_buffer(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+            chunks, self._chunks = self._chunks, {}
+            self._buffered_hashes = set()
+            if not batch:
+                return True
+
+            try:
+                if self.versioning:
+                    batch = self._update_known_sources(batch, chunks)
+                    if not batch:
+                        return True
+                    for doc in batch:
+                        doc['current_version'] = 1
+
+                hashes = [doc['document_hash'] for doc in batch]
+                existing = self.supabase.table('documents') \
+                    .select('document_hash') \
+                    .in_('document_hash', hashes) \
+                    .execute()
+                self.round_trips += 1
+                metrics.supabase_round_trips().inc(operation='select')
+                known = {row['document_hash'] for row in existing.data}
+
+                new_documents = [doc for doc in batch if doc['document_hash'] not in known]
+                self.duplicates += len(batch) - len(new_documents)
+                metrics.duplicates_skipped().inc(len(batch) - len(new_documents), reason='document_hash')
+
+                for start in range(0, len(new_documents), self.batch_size):
+                    chunk = new_documents[start:start + self.batch_size]
+                    table = self.supabase.table('documents')
+                    if self.upsert:
+                        response = table.upsert(chunk, on_conflict='document_hash').execute()
+                    else:
+                        response = table.insert(chunk).execute()
+                    self.round_trips += 1
+                    metrics.supabase_round_trips().inc(operation='upsert' if self.upsert else 'insert')
+                    self.inserted += len(chunk)
+                    for doc in chunk:
+                        logger.info(f"Document ajouté : {doc['title'][:100]}...")
+                    if self.versioning:
+                        self._write_versions([
+                            (row['id'], 1, [], chunks.get(row['document_hash'], []))
+                            for row in response.data
+                        ])
+                    if self.on_written:
+                        self._written.extend(self._written_record(row, chunks) for row in response.data)
+
+            except Exception as e:
+                logger.error(f"Erreur sauvegarde groupée : {str(e)}")
+                return False
+            return True
+
+    # --- Stockage différentiel ---------------------------------------------
+
+    def _update_known_sources(self, batch, chunks):
+        """Met à jour les documents dont la ``source_url`` est déjà en base.
+
+        Un nouveau contenu déjà présent sur une autre ligne (page republiée
+        sous une autre URL, sources qui convergent) est traité comme un
+        doublon : la mise à jour enfreindrait l'unicité de ``document_hash``.
+        Retourne les documents restants, à insérer comme nouveaux documents.
+        """
+        urls = list({doc['source_url'] for doc in batch if doc['source_url']})
+        if not urls:
+            return batch
+        existing = self.supabase.table('documents') \
+            .select('id, source_url, document_hash, current_version') \
+            .in_('source_url', urls) \
+            .execute()
+        self.round_trips += 1
+        metrics.supabase_round_trips().inc(operation='select')
+        known = {}
+        for row in existing.data:
+            if row['source_url'] not in known or row['id'] > known[row['source_url']]['id']:
+                known[row['source_url']] = row
+        if not known:
+            return batch
+
+        versions = self.supabase.table('document_versions') \
+            .select('document_id, version, chunk_hashes') \
+            .in_('document_id', [row['id'] for row in known.values()]) \
+            .execute()
+        self.round_trips += 1
+        metrics.supabase_round_trips().inc(operation='select')
+        latest = {}
+        for row in versions.data:
+            if row['document_id'] not in latest or row['version'] > latest[row['document_id']]['version']:
+                latest[row['document_id']] = row
+
+        # Lignes portant déjà le nouveau contenu
+        taken = self.supabase.table('documents') \
+            .select('id, document_hash') \
+            .in_('document_hash', [doc['document_hash'] for doc in batch if doc['source_url'] in known]) \
+            .execute()
+        self.round_trips += 1
+        metrics.supabase_round_trips().inc(operation='select')
+        owners = {row['document_hash']: row['id'] for row in taken.data}
+
+        remaining, updates, new_versions = [], [], []
+        for doc in batch:
+            row = known.get(doc['source_url'])
+            if row is None:
+                remaining.append(doc)
+                continue
+            owner = owners.get(doc['document_hash'])
+            if owner is not None and owner != row['id']:
+                self.duplicates += 1
+                metrics.duplicates_skipped().inc(reason='document_hash')
+                continue
+            doc_chunks = chunks.get(doc['document_hash'], [])
+            previous = latest.get(row['id'])
+            if previous is None:
+                # Document antérieur au stockage différentiel : première version
+                unchanged = row['document_hash'] == doc['document_hash']
+                previous_hashes, version = [], 1
+            else:
+                previous_hashes, version = previous['chunk_hashes'] or [], previous['version'] + 1
+                unchanged = chunks_hash(previous_hashes) == chunks_hash([c.hash for c in doc_chunks])
+            if unchanged:
+                self.duplicates += 1
+                metrics.duplicates_skipped().inc(reason='unchanged_chunks')
+                continue
+            updates.append({**doc, 'id': row['id'], 'current_version': version})
+            new_versions.append((row['id'], version, previous_hashes, doc_chunks))
+
+        if updates:
+            self.supabase.table('documents').upsert(updates, on_conflict='id').execute()
+            self.round_trips += 1
+            metrics.supabase_round_trips().inc(operation='upsert')
+            self.updated += len(updates)
+            for doc in updates:
+                logger.info(f"Document mis à jour (version {doc['current_version']}) : {doc['title'][:100]}...")
+            self._write_versions(new_versions)
+            if self.on_written:
+                self._written.extend(self._written_record(doc, chunks) for doc in updates)
+        return remaining
+
+    def _written_record(self, row, chunks):
+        """Document écrit, transmis aux étapes suivantes (vecteurs, index de recherche)"""
+        return {
+            'id': row['id'],
+            'title': row['title'],
+            'content': row['content'],
+            'source_url': row['source_url'],
+            'theme': self._theme_names.get(row['theme_id']),
+            'doc_type': self._category_names.get(row['category_id']),
+            'chunks': chunks.get(row['document_hash'])
+        }
+
+    def _write_versions(self, entries):
+        """Écrit les paragraphes nouveaux et la ligne de version de chaque document.
+
+        ``entries`` : liste de (id du document, version, empreintes de la
+        version précédente, paragraphes de la nouvelle version).
+        """
+        chunk_rows, version_rows = [], []
+        for document_id, version, previous_hashes, doc_chunks in entries:
+            added, removed = diff_chunks(previous_hashes, doc_chunks)
+            chunk_rows.extend(
+                {'document_id': document_id, 'chunk_hash': chunk.hash,
+                 'content': chunk.content, 'version': version}
+                for chunk in added
+            )
+            hashes = [chunk.hash for chunk in doc_chunks]
+            version_rows.append({
+                'document_id': document_id,
+                'version': version,
+                'chunk_hashes': hashes,
+                'content_hash': chunks_hash(hashes),
+                'added_chunks': len(added),
+                'removed_chunks': len(removed)
+            })
+
+        for start in range(0, len(chunk_rows), self.batch_size * 20):
+            # Un paragraphe réapparu après suppression est déjà stocké
+            self.supabase.table('document_chunks') \
+                .upsert(chunk_rows[start:start + self.batch_size * 20],
+                        on_conflict='document_id,chunk_hash', ignore_duplicates=True) \
+                .execute()
+            self.round_trips += 1
+            metrics.supabase_round_trips().inc(operation='upsert')
+        if version_rows:
+            self.supabase.table('document_versions').insert(version_rows).execute()
+            self.round_trips += 1
+            metrics.supabase_round_trips().inc(operation='insert')
+        metrics.chunks_written().inc(len(chunk_rows))
+
+    def stats(self):
+        return {
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'duplicates': self.duplicates,
+            'round_trips': self.round_trips
+        }
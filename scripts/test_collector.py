@@ -1,7 +1,15 @@
-import os
+import argparse
 import logging
-import requests
-from datetime import datetime
+import os
+
+import metrics
+from article_cache import ArticleCache, version_date
+from article_index import fetch_cgi_toc, iter_toc_articles
+from article_plan import canonical_article, compile_plan
+from journal import ProgressJournal
+from piste_client import PisteClient
+from sharding import Shard, shard_from_env
+from watermarks import WatermarkStore
 
 logging.basicConfig(
     level=logging.INFO,
@@ -9,49 +17,54 @@ logging.basicConfig(
 )
 
 class CGICollector:
-    def __init__(self):
-        self.token = None
-        self.base_url = "https://api.piste.gouv.fr/dila/legifrance/lf-engine-app"
-        self.oauth_url = "https://oauth.piste.gouv.fr/api/oauth/token"
-        self.client_id = os.environ.get('LEGIFRANCE_CLIENT_ID')
-        self.client_secret = os.environ.get('LEGIFRANCE_CLIENT_SECRET')
+    MODES = ('toc', 'search', 'single')
+
+    def __init__(self, mode='toc', page_size=100, full=False, client=None, shard=None):
+        self.client = client or PisteClient()
+        self.mode = mode
+        self.page_size = page_size
+        self.full = full
+        # Collecte répartie : seuls les articles du plan qui reviennent à ce fragment
+        self.shard = shard or shard_from_env()
+        # Articles et recherches par numéro déjà obtenus, resservis tant que leur version est en vigueur
+        self.article_cache = ArticleCache(
+            max_bytes=int(os.environ.get("COLLECTOR_ARTICLE_CACHE_MAX_MB", "50")) * 1024 * 1024,
+            max_age=float(os.environ.get("COLLECTOR_ARTICLE_CACHE_DAYS", "7")) * 24 * 3600
+        )
+        # Date de version déjà traitée par article ; full=True force la collecte complète
+        self.watermarks = WatermarkStore(full=full)
         
-        # Définition des articles à collecter
+        # Définition des articles à collecter (bornes incluses)
         self.article_ranges = [
-            ["787 B"],
-            ["787 C"],
-            range(750, 809),  # 750 ter à 808
-            range(14, 34),    # 14 à 33 quinquies
-            range(150, 151),  # 150 A bis à 150 VH
-            range(79, 91),    # 79 à 90
-            range(14, 156)    # 14 à 155 B
+            "787 B",
+            "787 C",
+            ("750 ter", "808"),
+            ("14", "33 quinquies"),
+            ("150 A bis", "150 VH"),
+            ("79", "90"),
+            ("14", "155 B")
         ]
+        self.article_plan = compile_plan(self.article_ranges)
 
-    def get_oauth_token(self):
-        data = {
-            'grant_type': 'client_credentials',
-            'client_id': self.client_id,
-            'client_secret': self.client_secret,
-            'scope': 'openid'
-        }
-        logging.info("Tentative d'obtention du token OAuth...")
-        response = requests.post(self.oauth_url, data=data)
-        if response.status_code == 200:
-            self.token = response.json()['access_token']
-            logging.info("Token OAuth obtenu avec succès")
-            return True
-        logging.error(f"Erreur d'authentification: {response.text}")
-        return False
-
-    def get_headers(self):
-        return {
-            'Authorization': f'Bearer {self.token}',
-            'accept': 'application/json',
-            'Content-Type': 'application/json'
-        }
+        # Journal d'avancement : une collecte interrompue reprend après la dernière
+        # unité validée (sommaire, page de recherche ou article) au lieu de repartir de 787 B
+        self.journal = ProgressJournal(
+            f"cgi_{mode}",
+            run={'mode': mode, 'page_size': page_size, 'full': full, 'plan': self.article_ranges,
+                 'shard': str(self.shard)}
+        )
+        # Unités en échec : le journal est alors conservé pour l'exécution suivante
+        self.failed_units = 0
 
     def search_cgi_article(self, article_num):
         """Recherche un article spécifique dans le CGI"""
+        version = version_date()
+        if not self.full:
+            cached = self.article_cache.get_search(article_num, version)
+            if cached is not None:
+                logging.info(f"Article {article_num} servi depuis le cache")
+                return cached
+
         logging.info(f"Recherche de l'article {article_num} dans le CGI...")
         
         search_payload = {
@@ -76,7 +89,7 @@ class CGICollector:
                     },
                     {
                         "facette": "DATE_VERSION",
-                        "singleDate": int(datetime.now().timestamp() * 1000)
+                        "singleDate": version
                     }
                 ],
                 "pageNumber": 1,
@@ -88,15 +101,12 @@ class CGICollector:
             "fond": "CODE_DATE"
         }
 
-        response = requests.post(
-            f"{self.base_url}/consult/code",
-            headers=self.get_headers(),
-            json=search_payload
-        )
+        response = self.client.post("/consult/code", json=search_payload)
 
         if response.status_code == 200:
             logging.info(f"Article {article_num} trouvé")
             result = response.json()
+            self.article_cache.store_search(article_num, result)
             return result
         else:
             logging.error(f"Erreur lors de la recherche de l'article {article_num}: {response.text}")
@@ -108,11 +118,7 @@ class CGICollector:
             "textId": article_id
         }
 
-        response = requests.post(
-            f"{self.base_url}/consult/getArticle",
-            headers=self.get_headers(),
-            json=payload
-        )
+        response = self.client.post("/consult/getArticle", json=payload)
 
         if response.status_code == 200:
             logging.info(f"Contenu récupéré pour l'article {article_id}")
@@ -121,35 +127,167 @@ class CGICollector:
             logging.error(f"Erreur lors de la récupération du contenu de l'article {article_id}: {response.text}")
             return None
 
-    def collect(self):
-        """Collecte tous les articles spécifiés"""
-        if not self.get_oauth_token():
+    def resolve_from_toc(self):
+        """Résout tout le plan en un seul appel au sommaire du code"""
+        if self.journal.done('toc'):
+            return self.journal.result('toc')
+        toc = fetch_cgi_toc(self.client)
+        if toc is None:
+            self.failed_units += 1
+            return []
+
+        resolved = {}
+        for article in iter_toc_articles(toc):
+            self._add_if_planned(resolved, article)
+        self.journal.commit('toc', list(resolved.values()))
+        return list(resolved.values())
+
+    def resolve_from_search(self):
+        """Résout le plan par recherches paginées sur tout le CGI"""
+        resolved = {}
+        page = 1
+        while True:
+            # Page déjà lue avant l'interruption : articles repris du journal
+            unit = f"search:{page}"
+            if self.journal.done(unit):
+                entry = self.journal.result(unit)
+                for article in entry['articles']:
+                    self._add_if_planned(resolved, article)
+                if entry['last']:
+                    break
+                page += 1
+                continue
+
+            payload = {
+                "recherche": {
+                    "filtres": [
+                        {"facette": "NOM_CODE", "valeurs": ["Code général des impôts"]},
+                        {"facette": "DATE_VERSION", "singleDate": version_date()}
+                    ],
+                    "pageNumber": page,
+                    "pageSize": self.page_size,
+                    "operateur": "ET",
+                    "sort": "PERTINENCE",
+                    "typePagination": "ARTICLE"
+                },
+                "fond": "CODE_DATE"
+            }
+            response = self.client.post("/search", json=payload)
+            if response.status_code != 200:
+                logging.error(f"Erreur lors de la recherche paginée (page {page}): {response.text}")
+                self.failed_units += 1
+                break
+
+            result = response.json()
+            articles = [article for article in self._extract_articles(result)
+                        if self.article_plan.contains(article['num'])]
+            for article in articles:
+                self._add_if_planned(resolved, article)
+
+            last = page * self.page_size >= result.get('totalResultNumber', 0) or not result.get('results')
+            self.journal.commit(unit, {'articles': articles, 'last': bool(last)})
+            if last:
+                break
+            page += 1
+        return list(resolved.values())
+
+    def _extract_articles(self, result):
+        """Extrait les références d'articles d'une réponse de recherche"""
+        for item in result.get('results', []):
+            for section in item.get('sections', []):
+                for extract in section.get('extracts', []):
+                    if extract.get('num'):
+                        yield extract
+
+    def _add_if_planned(self, resolved, article):
+        num = article.get('num')
+        if not num or not self.article_plan.contains(num):
+            return
+        if not self.shard.owns(canonical_article(num)):
+            return
+        if article.get('etat', 'VIGUEUR') != 'VIGUEUR':
             return
+        resolved.setdefault(canonical_article(num), {
+            'num': canonical_article(num),
+            'id': article.get('id'),
+            'etat': article.get('etat'),
+            'dateDebut': article.get('dateDebut')
+        })
 
-        collected_articles = []
-        
-        # Traitement de chaque plage d'articles
-        for article_range in self.article_ranges:
-            if isinstance(article_range, list):
-                # Pour les articles spécifiques comme "787 B"
-                for article in article_range:
+    def skip_known_versions(self, articles):
+        """Écarte les articles dont la version en vigueur a déjà été traitée"""
+        return [
+            article for article in articles
+            if self.watermarks.is_new(f"legifrance:cgi:{article['num']}", article.get('dateDebut'))
+        ]
+
+    def commit_article(self, article):
+        """Article traité par l'appelant : sa version ne sera plus collectée.
+
+        La marque n'est posée qu'à ce moment (et enregistrée par ``close``) :
+        un article sélectionné mais perdu avant son traitement est repris.
+        Les réponses du mode single n'ont pas de marque.
+        """
+        if self.mode != 'single':
+            self.watermarks.mark(f"legifrance:cgi:{article['num']}", article.get('dateDebut'))
+
+    def collect(self):
+        """Collecte tous les articles du plan"""
+        if not self.client.authenticate():
+            return []
+
+        if self.mode == 'toc':
+            collected_articles = self.resolve_from_toc()
+        elif self.mode == 'search':
+            collected_articles = self.resolve_from_search()
+        else:
+            # Un appel par numéro, sur le plan dédoublonné
+            collected_articles = []
+            for article in filter(self.shard.owns, self.article_plan.identifiers()):
+                unit = f"article:{article}"
+                if self.journal.done(unit):
+                    result = self.journal.result(unit)
+                else:
                     logging.info(f"Traitement de l'article {article}")
                     result = self.search_cgi_article(article)
                     if result:
-                        collected_articles.append(result)
-            else:
-                # Pour les plages numériques
-                for article_num in article_range:
-                    logging.info(f"Traitement de l'article {article_num}")
-                    result = self.search_cgi_article(article_num)
-                    if result:
-                        collected_articles.append(result)
+                        self.journal.commit(unit, result)
+                    else:
+                        self.failed_units += 1
+                if result:
+                    collected_articles.append(result)
 
+        if self.mode != 'single':
+            collected_articles = self.skip_known_versions(collected_articles)
+
+        if self.failed_units:
+            logging.warning(f"{self.failed_units} unités en échec, journal conservé pour la reprise")
+            self.journal.close()
+        else:
+            self.journal.complete()
         logging.info(f"Nombre total d'articles collectés: {len(collected_articles)}")
         return collected_articles
 
+    def close(self):
+        self.watermarks.save()
+        logging.info(f"Cache des articles : {self.article_cache.stats()}")
+        self.article_cache.close()
+        self.client.close()
+
 if __name__ == "__main__":
-    collector = CGICollector()
+    parser = argparse.ArgumentParser(description="Collecte des articles du CGI")
+    parser.add_argument('--mode', choices=CGICollector.MODES, default='toc',
+                        help="toc : sommaire du code ; search : recherches paginées ; single : un appel par article")
+    parser.add_argument('--full', action='store_true',
+                        help="Ignore les marques de collecte et force une collecte complète")
+    parser.add_argument('--shard', type=Shard.parse, metavar='I/N',
+                        help="Ne traite que le fragment I (à partir de 0) sur N du plan")
+    args = parser.parse_args()
+
+    collector = CGICollector(mode=args.mode, full=args.full, shard=args.shard)
     articles = collector.collect()
     for article in articles:
         logging.info(f"Article trouvé: {article}")
+        collector.commit_article(article)
+    collector.close()
+    metrics.get_metrics().write(name='cgi_collector')
@@ -1,22 +1,22 @@
-import os
+import argparse
 import logging
 import requests
 from bs4 import BeautifulSoup
 from datetime import datetime
 import time
 
+from article_index import ArticleIndex
+from piste_client import PisteClient
+from rate_limiter import get_rate_limiter
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
 class HybridCollector:
-    def __init__(self):
-        self.token = None
-        self.base_url = "https://api.piste.gouv.fr/dila/legifrance/lf-engine-app"
-        self.oauth_url = "https://oauth.piste.gouv.fr/api/oauth/token"
-        self.client_id = os.environ.get('LEGIFRANCE_CLIENT_ID')
-        self.client_secret = os.environ.get('LEGIFRANCE_CLIENT_SECRET')
+    def __init__(self, client=None):
+        self.client = client or PisteClient()
         
         # URLs pour le scraping
         self.legifrance_web = "https://www.legifrance.gouv.fr"
@@ -26,31 +26,26 @@ class HybridCollector:
         self.scraping_headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
+        self.scraping_session = requests.Session()
+        self.scraping_session.headers.update(self.scraping_headers)
+        self.limiter = get_rate_limiter()
 
-    def get_oauth_token(self):
-        """Obtention du token OAuth"""
-        data = {
-            'grant_type': 'client_credentials',
-            'client_id': self.client_id,
-            'client_secret': self.client_secret,
-            'scope': 'openid'
-        }
-        logging.info("Tentative d'obtention du token OAuth...")
-        response = requests.post(self.oauth_url, data=data)
-        if response.status_code == 200:
-            self.token = response.json()['access_token']
-            logging.info("Token OAuth obtenu avec succès")
-            return True
-        logging.error(f"Erreur d'authentification: {response.text}")
-        return False
-
-    def get_headers(self):
-        return {
-            'Authorization': f'Bearer {self.token}',
-            'Content-Type': 'application/json'
-        }
+        # Index local numéro d'article -> LEGIARTI, consulté avant tout scraping
+        self.index = ArticleIndex()
 
     def find_article_id(self, article_num):
+        """Recherche l'identifiant LEGIARTI d'un article : index local, puis scraping"""
+        article_id = self.index.lookup(article_num)
+        if article_id:
+            logging.info(f"ID LEGIARTI trouvé dans l'index: {article_id}")
+            return article_id
+
+        article_id = self.scrape_article_id(article_num)
+        if article_id:
+            self.index.store(article_num, article_id)
+        return article_id
+
+    def scrape_article_id(self, article_num):
         """Recherche l'identifiant LEGIARTI d'un article via web scraping"""
         logging.info(f"Recherche de l'ID pour l'article {article_num}...")
         
@@ -66,7 +61,17 @@ class HybridCollector:
         }
         
         try:
-            response = requests.get(search_url, params=params, headers=self.scraping_headers)
+            attempt = 0
+            while True:
+                self.limiter.acquire(search_url)
+                started = time.monotonic()
+                response = self.scraping_session.get(search_url, params=params)
+                delay = self.limiter.record(search_url, response.status_code,
+                                            time.monotonic() - started, response.headers, attempt)
+                if delay is None:
+                    break
+                time.sleep(delay)
+                attempt += 1
             logging.info(f"Status code scraping: {response.status_code}")
             if response.status_code == 200:
                 soup = BeautifulSoup(response.text, 'html.parser')
@@ -89,18 +94,12 @@ class HybridCollector:
 
     def get_article_content(self, article_id):
         """Récupère le contenu d'un article via l'API avec son ID LEGIARTI"""
-        url = f"{self.base_url}/consult/getArticle"
-        
         payload = {
             "id": article_id
         }
 
         logging.info(f"Récupération du contenu via API pour {article_id}...")
-        response = requests.post(
-            url,
-            headers=self.get_headers(),
-            json=payload
-        )
+        response = self.client.post("/consult/getArticle", json=payload)
 
         if response.status_code == 200:
             result = response.json()
@@ -118,23 +117,24 @@ class HybridCollector:
 
     def test_collection(self):
         """Test de récupération hybride"""
-        if not self.get_oauth_token():
+        if not self.client.authenticate():
             return
 
         articles_to_test = ["787 B", "810", "787 C"]
         for article_num in articles_to_test:
             logging.info(f"\nTest pour l'article {article_num}")
             
-            # Étape 1 : Recherche de l'ID via scraping
+            # Étape 1 : Recherche de l'ID (index local, scraping en cas d'absence)
             article_id = self.find_article_id(article_num)
             if not article_id:
                 logging.error(f"Impossible de trouver l'ID pour l'article {article_num}")
                 continue
             
-            # Étape 2 : Récupération du contenu via API
-            time.sleep(1)  # Pause pour éviter de surcharger les serveurs
+            # Étape 2 : Récupération du contenu via API (débit réglé par le limiteur)
             content = self.get_article_content(article_id)
             if content:
+                # Mise à jour de la période de validité de la version indexée
+                self.index.store(article_num, article_id, content.get('dateDebut'), content.get('dateFin'))
                 logging.info(f"Article {article_num} :")
                 logging.info(f"ID: {content.get('id')}")
                 logging.info(f"Type: {content.get('type')}")
@@ -143,5 +143,12 @@ class HybridCollector:
                 logging.error(f"Échec de la récupération du contenu pour l'article {article_num}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test de récupération hybride")
+    parser.add_argument('--rebuild-index', action='store_true',
+                        help="Reconstruit l'index des identifiants LEGIARTI avant le test")
+    args = parser.parse_args()
+
     collector = HybridCollector()
+    if args.rebuild_index and collector.client.authenticate():
+        collector.index.rebuild(collector.client)
     collector.test_collection()
@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+# Les modules de scripts/ s'importent par leur nom, comme depuis les scripts eux-mêmes
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Caches SQLite et marques de collecte dans un répertoire temporaire"""
+    monkeypatch.setenv('COLLECTOR_CACHE_DIR', str(tmp_path / 'cache'))
+    return tmp_path / 'cache'
@@ -0,0 +1,107 @@
+from datetime import date
+
+import pytest
+
+import article_cache
+from article_cache import ArticleCache, version_date
+
+DAY = 24 * 3600 * 1000
+JAN_2024 = version_date(date(2024, 1, 1))
+JUN_2024 = version_date(date(2024, 6, 1))
+JAN_2025 = version_date(date(2025, 1, 1))
+
+
+class Clock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(article_cache.time, 'time', clock.time)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    cache = ArticleCache(str(tmp_path / 'articles.sqlite3'), max_age=3600)
+    yield cache
+    cache.close()
+
+
+def search_result(article_id, date_debut, date_fin):
+    return {'results': [{'sections': [{'extracts': [
+        {'id': article_id, 'num': '787 B', 'dateDebut': date_debut, 'dateFin': date_fin}
+    ]}]}]}
+
+
+def test_version_date_is_utc_midnight():
+    assert version_date(date(2024, 1, 1)) == 1704067200000
+    assert JUN_2024 - version_date(date(2024, 5, 31)) == DAY
+
+
+def test_closed_version_served_until_its_end_without_revalidation(cache, clock):
+    cache.store_search('787 b', search_result('LEGIARTI1', JAN_2024, JAN_2025))
+    clock.now += 365 * 24 * 3600
+    assert cache.get_search('787 B', JUN_2024)['results'][0]['sections'][0]['extracts'][0]['id'] == 'LEGIARTI1'
+    assert cache.get_search('787 B', JAN_2025 - 1) is not None
+    # Date demandée hors de la période de validité : nouvelle recherche
+    assert cache.get_search('787 B', JAN_2025) is None
+    assert cache.get_search('787 B', JAN_2024 - 1) is None
+    assert cache.revalidations == 2
+
+
+def test_open_version_revalidated_after_max_age(cache, clock):
+    cache.store_search('787 B', search_result('LEGIARTI2', JAN_2024, 32472144000000))
+    assert cache.get_search('787 B', JUN_2024) is not None
+    clock.now += 3600
+    assert cache.get_search('787 B', JUN_2024) is not None
+    clock.now += 1
+    assert cache.get_search('787 B', JUN_2024) is None
+    # Une nouvelle réponse repart pour max_age
+    cache.store_search('787 B', search_result('LEGIARTI2', JAN_2024, None))
+    assert cache.get_search('787 B', JUN_2024) is not None
+
+
+def test_search_without_extract_is_not_cached(cache):
+    cache.store_search('787 B', {'results': []})
+    assert cache.get_search('787 B', JUN_2024) is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_article_content_never_expires(cache, clock):
+    response = {'article': {'id': 'LEGIARTI1', 'texte': 'Texte', 'dateDebut': JAN_2024, 'dateFin': JAN_2025}}
+    assert cache.get_article('LEGIARTI1') is None
+    cache.store_article('LEGIARTI1', response)
+    clock.now += 10 * 365 * 24 * 3600
+    assert cache.get_article('LEGIARTI1') == response
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = ArticleCache(str(tmp_path / 'articles.sqlite3'), max_bytes=250)
+    for n in range(3):
+        cache.store_article(f"A{n}", {'article': {'texte': 'x' * 50}})
+        clock.now += 1
+    cache.get_article('A0')
+    clock.now += 1
+    cache.store_article('A3', {'article': {'texte': 'x' * 50}})
+    assert cache.get_article('A1') is None
+    assert cache.get_article('A0') is not None
+    assert cache.stats()['bytes'] <= 250
+    assert cache.evictions >= 1
+    cache.close()
+
+
+def test_entries_survive_reopen(tmp_path, clock):
+    path = str(tmp_path / 'articles.sqlite3')
+    cache = ArticleCache(path)
+    cache.store_search('150-0 a', search_result('LEGIARTI3', JAN_2024, JAN_2025))
+    cache.close()
+    reopened = ArticleCache(path)
+    assert reopened.get_search('150-0 A', JUN_2024) is not None
+    reopened.close()
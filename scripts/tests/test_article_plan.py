@@ -0,0 +1,81 @@
+import pytest
+
+from article_plan import article_sort_key, canonical_article, compile_plan
+
+
+@pytest.mark.parametrize('raw, expected', [
+    ('150 a  BIS', '150 A bis'),
+    (' 787 b ', '787 B'),
+    ('150-0 a', '150-0 A'),
+    ('0750 TER', '750 ter'),
+    (885, '885'),
+])
+def test_canonical_article(raw, expected):
+    assert canonical_article(raw) == expected
+
+
+def test_canonical_article_rejects_invalid_number():
+    with pytest.raises(ValueError):
+        canonical_article('article premier')
+
+
+def test_sort_key_follows_code_order():
+    ordered = ['150', '150-0 A', '150-0 B', '150 A', '150 A bis', '150 A ter', '150 A quinquies',
+               '150 A decies', '150 B', '151']
+    assert sorted(reversed(ordered), key=article_sort_key) == ordered
+
+
+def test_latin_suffixes_sort_by_rank_not_alphabetically():
+    assert article_sort_key('757 bis') < article_sort_key('757 ter') < article_sort_key('757 quater')
+    assert article_sort_key('757 novodecies') < article_sort_key('757 vicies')
+
+
+def test_interval_with_suffixed_bounds():
+    plan = compile_plan([('750 ter', '752')])
+    assert plan.contains('750 ter')
+    assert plan.contains('750 quater')
+    assert not plan.contains('750 bis')
+    assert not plan.contains('750')
+    assert plan.contains('751 A')
+    assert plan.contains('752')
+    assert not plan.contains('752 bis')
+    assert plan.identifiers() == ['750 ter', '751', '752']
+
+
+def test_overlapping_intervals_are_merged_and_keep_their_bounds():
+    plan = compile_plan([('750 ter', '752'), ('751 bis', '753'), range(800, 802)])
+    assert len(plan.intervals) == 2
+    assert plan.contains('752 bis')
+    # Borne absorbée par la fusion, toujours demandée
+    assert '751 bis' in plan.identifiers()
+    assert plan.identifiers() == ['750 ter', '751', '751 bis', '752', '753', '800', '801']
+
+
+def test_explicit_singles():
+    plan = compile_plan(['787 B', '885 a', ('780', '781')])
+    assert plan.contains('787 b')
+    assert not plan.contains('787 C')
+    assert not plan.contains('787')
+    assert plan.identifiers() == ['780', '781', '787 B', '885 A']
+
+
+def test_single_inside_interval_is_listed_once():
+    plan = compile_plan([('780', '782'), '781', '781 bis'])
+    assert plan.identifiers() == ['780', '781', '781 bis', '782']
+    assert len(plan) == 4
+
+
+def test_sub_numbered_interval_excludes_bare_base():
+    plan = compile_plan([('150-0 A', '150 B')])
+    assert plan.contains('150-0 D')
+    assert plan.contains('150 A bis')
+    assert not plan.contains('150')
+    assert not plan.contains('150 C')
+    assert plan.identifiers() == ['150-0 A', '150 B']
+
+
+def test_invalid_specs():
+    with pytest.raises(ValueError):
+        compile_plan([('752', '750')])
+    assert compile_plan([range(0)]).identifiers() == []
+    assert not compile_plan(['787 B']).contains('inconnu')
@@ -0,0 +1,104 @@
+import pytest
+
+from near_duplicates import DEFAULT_THRESHOLD, MinHasher, NearDuplicateIndex, shingles
+
+QUESTION = ("M. le député interroge le ministre sur l'application du pacte Dutreil aux holdings "
+            "animatrices lors d'une transmission d'entreprise familiale et sur les conditions de "
+            "l'engagement collectif de conservation des titres pendant deux ans")
+# Même question posée au Sénat : Jaccard 0,84
+SENAT = QUESTION.replace('député', 'sénateur')
+# Reformulation : Jaccard 0,70
+REWORDED = QUESTION.replace('deux ans', 'quatre ans').replace('familiale', 'agricole')
+UNRELATED = ("Mme la sénatrice attire l'attention sur le montant de l'abattement applicable aux "
+             "donations consenties aux petits-enfants")
+
+
+def jaccard(first, second):
+    first, second = shingles(first), shingles(second)
+    return len(first & second) / len(first | second)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / 'near_duplicates.sqlite3'))
+    yield index
+    index.close()
+
+
+def test_shingles_ignore_case_accents_and_spacing():
+    assert shingles('Réponse  du MINISTRE publiée') == shingles('reponse du ministre publiee')
+    assert len(shingles('trois mots seulement')) == 1
+
+
+def test_minhash_estimates_jaccard():
+    hasher = MinHasher()
+    for text in (SENAT, REWORDED, UNRELATED):
+        estimate = hasher.similarity(hasher.signature(QUESTION), hasher.signature(text))
+        assert abs(estimate - jaccard(QUESTION, text)) < 0.1
+
+
+def test_default_threshold(index):
+    assert index.threshold == DEFAULT_THRESHOLD
+    assert index.check('an-1', QUESTION) is None
+    assert index.check('senat-1', SENAT) == 'an-1'
+    assert index.check('an-2', REWORDED) is None
+    assert index.check('senat-2', UNRELATED) is None
+    assert index.stats == {'checked': 4, 'duplicates': 1, 'clusters': 3}
+
+
+def test_lower_threshold_catches_rewording(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / 'near_duplicates.sqlite3'), threshold=0.6)
+    assert index.check('an-1', QUESTION) is None
+    assert index.check('an-2', REWORDED) == 'an-1'
+    assert index.check('senat-2', UNRELATED) is None
+    index.close()
+
+
+def test_higher_threshold_keeps_both(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / 'near_duplicates.sqlite3'), threshold=0.95)
+    assert index.check('an-1', QUESTION) is None
+    assert index.check('senat-1', SENAT) is None
+    index.close()
+
+
+def test_rechecking_representative_is_not_a_duplicate(index):
+    assert index.check('an-1', QUESTION) is None
+    assert index.check('an-1', QUESTION) is None
+
+
+def test_unwritten_cluster_does_not_survive_the_run(tmp_path):
+    path = str(tmp_path / 'near_duplicates.sqlite3')
+    first = NearDuplicateIndex(path)
+    assert first.check('an-1', QUESTION) is None
+    first.close()
+
+    # Représentant jamais écrit : la variante devient le nouveau représentant
+    second = NearDuplicateIndex(path)
+    assert not second.is_stored('an-1')
+    assert second.check('senat-1', SENAT) is None
+    second.stored('senat-1', 'Pacte Dutreil')
+    second.close()
+
+    third = NearDuplicateIndex(path)
+    assert third.is_stored('senat-1')
+    assert third.check('an-3', QUESTION) == 'senat-1'
+    third.close()
+
+
+def test_merge_shares_stored_clusters(tmp_path):
+    other = NearDuplicateIndex(str(tmp_path / 'other.sqlite3'))
+    other.check('an-1', QUESTION)
+    other.stored('an-1', 'Pacte Dutreil')
+    other.close()
+
+    index = NearDuplicateIndex(str(tmp_path / 'near_duplicates.sqlite3'))
+    assert not index.is_stored('an-1')
+    index.merge(str(tmp_path / 'other.sqlite3'))
+    assert index.is_stored('an-1')
+    assert index.check('senat-1', SENAT) == 'an-1'
+    index.close()
+
+
+def test_invalid_banding(tmp_path):
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(str(tmp_path / 'near_duplicates.sqlite3'), num_perm=100, bands=16)
@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+import parsing
+from parsing import FeedItem, extract_page, iter_feed_items, parse_feed
+from watermarks import parse_pub_date
+
+FIXTURES = os.path.join(os.path.dirname(__file__), '..', '..', 'benchmarks', 'fixtures')
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        return f.read()
+
+
+PAGES = {
+    'bofip': fixture('bofip_page.html').replace(b'{doc_id}', b'BOI-ENR-DMTG-10-20'),
+    'selecteur': '''<html><head><meta name="DC.date.modified" content="2024-03-05">
+        <script>var x = "<p>ignoré</p>";</script><style>p { color: red }</style></head>
+        <body><h1> Titre  de la page </h1><div id="menu"><p>Menu</p></div>
+        <div class="bloc corps_texte"><p>Premier <b>paragraphe</b> du texte.</p>
+        <ul><li>Point un</li><li>Point <i>deux</i></li></ul>
+        <table><tr><td>Cellule</td><td>1 000 €</td></tr></table>
+        Texte final<br>après saut</div></body></html>'''.encode(),
+    'sans_selecteur': '<html><body><p>Texte seul</p><p>Second</p></body></html>'.encode(),
+    'latin1': '<html><head><meta charset="iso-8859-1"></head><body><h1>Réduction</h1>'
+              '<div class="article_content"><p>Plus-value à taux réduit</p></div></body></html>'
+              .encode('iso-8859-1'),
+    'declaration_xml': '<?xml version="1.0" encoding="utf-8"?><html><body>'
+                       '<div id="main-content"><p>Contenu après déclaration</p></div></body></html>'.encode(),
+    'date_rfc822': '<html><head><meta name="date" content="Tue, 02 Oct 2024 10:00:00 +0200"></head>'
+                   '<body><div class="article_content">Texte</div></body></html>'.encode(),
+}
+
+# Balises mal imbriquées : libxml2 et html.parser les réparent différemment
+MALFORMED = (
+    '<html><body><h1>Titre</h1><div class="article_content"><p>Un <b>gras <i>mêlé</b> texte</i>'
+    '</p></span><p>Suite</div><p>hors contenu</p></body></html>'
+).encode()
+
+
+@pytest.mark.parametrize('name', sorted(PAGES))
+def test_lxml_matches_beautifulsoup(name):
+    assert parsing._extract_page_lxml(PAGES[name]) is not None
+    assert extract_page(PAGES[name], fast=True) == extract_page(PAGES[name], fast=False)
+
+
+def test_extracted_fields():
+    page = extract_page(PAGES['selecteur'], fast=True)
+    assert page.title == 'Titre  de la page'
+    assert 'Menu' not in page.content
+    assert 'ignoré' not in page.content
+    assert page.stamp == parse_pub_date('2024-03-05')
+    assert page.paragraphs == ['Premier paragraphe du texte.', 'Point un', 'Point deux', 'Cellule',
+                               '1 000 €', 'Texte final', 'après saut']
+
+
+def test_malformed_markup_falls_back_to_beautifulsoup():
+    assert parsing._extract_page_lxml(MALFORMED) is None
+    assert extract_page(MALFORMED, fast=True) == extract_page(MALFORMED, fast=False)
+
+
+def test_extract_pages_matches_sequential_extraction():
+    contents = [PAGES['bofip'], MALFORMED, PAGES['latin1']]
+    assert parsing.extract_pages(contents, fast=True) == [extract_page(c) for c in contents]
+
+
+FEED = '''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:dc="http://purl.org/dc/elements/1.1/">
+  <channel>
+    <title>Flux</title>
+    <item>
+      <title>Question &amp; réponse</title>
+      <link>https://example.test/1</link>
+      <guid isPermaLink="false">  q-1  </guid>
+      <pubDate>Tue, 02 Oct 2024 10:00:00 +0200</pubDate>
+      <description><![CDATA[Réponse <b>publiée</b> au JO]]></description>
+    </item>
+    <item>
+      <title>Sans guid</title>
+      <link>https://example.test/2</link>
+      <dc:creator>Sénat</dc:creator>
+    </item>
+  </channel>
+</rss>'''.encode()
+
+
+@pytest.mark.parametrize('content', [FEED, fixture('questions.rss').replace(b'{source}', b'senat')])
+def test_streaming_feed_matches_beautifulsoup(content):
+    assert list(iter_feed_items(content)) == parse_feed(content)
+    assert parse_feed(content, streaming=True) == parse_feed(content)
+
+
+def test_feed_items():
+    assert parse_feed(FEED, streaming=True) == [
+        FeedItem(title='Question & réponse', description='Réponse <b>publiée</b> au JO',
+                 link='https://example.test/1', guid='q-1', pub_date='Tue, 02 Oct 2024 10:00:00 +0200'),
+        FeedItem(title='Sans guid', link='https://example.test/2'),
+    ]
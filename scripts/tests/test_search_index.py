@@ -0,0 +1,131 @@
+import math
+from collections import Counter
+
+import pytest
+
+from search_index import SearchIndex, tokenize
+
+DOCUMENTS = [
+    (1, 'Pacte Dutreil', "L'exonération partielle de l'article 787 B du CGI s'applique aux transmissions "
+                         "de titres sous engagement collectif de conservation.", 'Pacte Dutreil'),
+    (2, 'Donations', "L'abattement de l'article 779 s'applique aux donations en ligne directe ; "
+                     "le pacte Dutreil peut s'y ajouter.", 'DMTG'),
+    (3, 'Location meublée', "Le loueur en meublé professionnel relève de l'article 151 septies.",
+        'Location meublée'),
+    (4, 'Plus-values', "L'article 150-0 B ter prévoit un report d'imposition des plus-values d'apport.",
+        'Plus-values'),
+]
+
+
+def build(path, documents=DOCUMENTS, **kwargs):
+    index = SearchIndex(str(path), **kwargs)
+    for doc_id, title, content, theme in documents:
+        index.add(doc_id, title, content, theme=theme, category='Instruction fiscale')
+    index.commit()
+    return index
+
+
+def reference_scores(query, documents, k1=1.2, b=0.75):
+    """BM25 calculé directement sur les textes"""
+    bags = {}
+    for doc_id, title, content, _ in documents:
+        terms = Counter(tokenize(content))
+        for term in tokenize(title):
+            terms[term] += SearchIndex.TITLE_BOOST
+        bags[doc_id] = terms
+    average = sum(sum(terms.values()) for terms in bags.values()) / len(bags)
+    scores = {}
+    for term in dict.fromkeys(tokenize(query, query=True)):
+        df = sum(1 for terms in bags.values() if term in terms)
+        if not df:
+            continue
+        idf = math.log(1 + (len(bags) - df + 0.5) / (df + 0.5))
+        for doc_id, terms in bags.items():
+            if term in terms:
+                tf = terms[term]
+                norm = k1 * (1 - b + b * sum(terms.values()) / average)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+    return scores
+
+
+def results(index, query, **kwargs):
+    return [(hit.doc_id, hit.score) for hit in index.search(query, **kwargs)]
+
+
+def test_tokenize_legal_french():
+    assert tokenize("L'article 787 B du CGI") == ['787b', 'cgi']
+    assert tokenize("art. 150-0 B ter et l’exonération") == ['150-0bter', 'exoneration']
+    assert tokenize('article 787 b', query=True) == ['787b']
+    assert tokenize('Les donations') == ['donation']
+
+
+@pytest.mark.parametrize('query', ['pacte Dutreil', 'article 787 b', 'donations abattement', 'article 150-0 B ter'])
+def test_bm25_scores_match_reference(tmp_path, query):
+    index = build(tmp_path / 'index')
+    expected = reference_scores(query, DOCUMENTS)
+    ranked = sorted(expected.items(), key=lambda item: -item[1])
+    assert results(index, query) == [(doc_id, round(score, 4)) for doc_id, score in ranked]
+
+
+def test_article_reference_ranks_its_document_first(tmp_path):
+    index = build(tmp_path / 'index')
+    assert index.search('article 787 B')[0].doc_id == 1
+    assert index.search('151 septies')[0].doc_id == 3
+    assert index.search('inconnu') == []
+
+
+def test_filters_and_stored_fields(tmp_path):
+    index = build(tmp_path / 'index')
+    assert [hit.doc_id for hit in index.search('pacte Dutreil', theme='DMTG')] == [2]
+    assert index.search('pacte Dutreil', theme='Absent') == []
+    assert index.search('pacte Dutreil', category='Réponse ministérielle') == []
+    hit = index.search('meublé')[0]
+    assert (hit.title, hit.theme, hit.category) == ('Location meublée', 'Location meublée', 'Instruction fiscale')
+
+
+def test_reindex_masks_previous_version(tmp_path):
+    index = build(tmp_path / 'index')
+    index.add(3, 'Location meublée', "Le loueur en meublé non professionnel.", theme='Location meublée')
+    index.commit()
+    assert len(index) == 4
+    assert index.search('151 septies') == []
+    assert [hit.doc_id for hit in index.search('meublé')] == [3]
+    index.delete(2)
+    index.commit()
+    assert len(index) == 3
+    assert [hit.doc_id for hit in index.search('pacte Dutreil')] == [1]
+
+
+def test_merge_keeps_results(tmp_path):
+    single = build(tmp_path / 'single')
+    expected = {query: results(single, query) for query in ('pacte Dutreil', 'article 787 b', 'plus-values')}
+
+    merged = SearchIndex(str(tmp_path / 'merged'), max_segments=2)
+    for doc_id, title, content, theme in DOCUMENTS:
+        merged.add(doc_id, title, content, theme=theme, category='Instruction fiscale')
+        merged.commit()
+    assert len(merged._manifest['segments']) <= 2
+    for query, hits in expected.items():
+        assert results(merged, query) == hits
+
+    merged.add(4, 'Plus-values', 'Texte remplacé.', theme='Plus-values')
+    merged.optimize()
+    assert len(merged._manifest['segments']) == 1
+    assert merged._manifest['deleted'] == {}
+    assert merged.search('report imposition') == []
+
+
+def test_reopen_from_disk(tmp_path):
+    index = build(tmp_path / 'index')
+    index.delete(1)
+    index.commit()
+    expected = results(index, 'pacte Dutreil article 779')
+    index.close()
+
+    reopened = SearchIndex(str(tmp_path / 'index'))
+    assert len(reopened) == 3
+    assert results(reopened, 'pacte Dutreil article 779') == expected
+    reopened.add(5, 'Nouveau', 'Pacte Dutreil et holding animatrice.')
+    reopened.commit()
+    assert 5 in [hit.doc_id for hit in reopened.search('holding animatrice')]
+    reopened.close()
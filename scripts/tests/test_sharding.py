@@ -0,0 +1,75 @@
+import os
+import subprocess
+import sys
+from collections import Counter
+
+import pytest
+
+from sharding import Shard, merge_reports, shard_of
+
+KEYS = ['https://www.senat.fr/rss/questions.rss', 'pacte Dutreil', 'judilibre:2024-10-02', '787 B']
+
+
+@pytest.mark.parametrize('key, count, expected', [
+    ('https://www.senat.fr/rss/questions.rss', 2, 0),
+    ('https://www.senat.fr/rss/questions.rss', 7, 6),
+    ('pacte Dutreil', 2, 1),
+    ('judilibre:2024-10-02', 4, 1),
+    ('787 B', 4, 2),
+])
+def test_shard_of_is_pinned(key, count, expected):
+    """Valeurs figées : une modification de l'empreinte redistribuerait toutes les unités"""
+    assert shard_of(key, count) == expected
+
+
+def test_shard_of_does_not_depend_on_hash_seed():
+    script = ('from sharding import shard_of; '
+              f'print([shard_of(key, 5) for key in {KEYS!r}])')
+    outputs = set()
+    for seed in ('1', '2'):
+        env = dict(os.environ, PYTHONHASHSEED=seed)
+        outputs.add(subprocess.run(
+            [sys.executable, '-c', script], env=env, capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout)
+    assert outputs == {f"{[shard_of(key, 5) for key in KEYS]}\n"}
+
+
+def test_shard_of_spreads_keys_evenly():
+    counts = Counter(shard_of(f"https://bofip.impots.gouv.fr/bofip/{n}-PGP", 4) for n in range(4000))
+    assert set(counts) == {0, 1, 2, 3}
+    assert all(800 <= count <= 1200 for count in counts.values())
+
+
+def test_each_key_has_exactly_one_owner():
+    shards = [Shard(index, 3) for index in range(3)]
+    for key in KEYS + list(range(100)):
+        assert sum(shard.owns(key) for shard in shards) == 1
+
+
+def test_single_shard_owns_everything():
+    assert all(Shard().owns(key) for key in KEYS)
+
+
+def test_parse():
+    assert Shard.parse('2/4') == Shard(2, 4)
+    assert Shard.parse('0') == Shard(0, 1)
+    assert str(Shard(1, 2)) == '1/2'
+    for spec in ('4/4', '-1/2', 'a/b', '1/0'):
+        with pytest.raises(ValueError):
+            Shard.parse(spec)
+
+
+def test_merge_reports():
+    merged = merge_reports([
+        {'started_at': '2024-10-02T10:00:01', 'duration': 30, 'shard': '0/2',
+         'sources': [{'source': 'bofip', 'status': 'ok'}], 'writer': {'inserted': 3, 'mode': 'batch'}},
+        {'started_at': '2024-10-02T10:00:00', 'duration': 45, 'shard': '1/2',
+         'sources': [{'source': 'bofip', 'status': 'error'}], 'writer': {'inserted': 4}},
+    ])
+    assert merged['started_at'] == '2024-10-02T10:00:00'
+    assert merged['duration'] == 45
+    assert merged['shards'] == 2
+    assert merged['sources'] == [{'source': 'bofip', 'status': 'ok', 'shard': '0/2'},
+                                 {'source': 'bofip', 'status': 'error', 'shard': '1/2'}]
+    assert merged['writer'] == {'inserted': 7}
@@ -0,0 +1,114 @@
+import time
+
+import pytest
+
+from watermarks import WatermarkStore, parse_pub_date
+
+
+@pytest.fixture
+def paris(monkeypatch):
+    monkeypatch.setenv('TZ', 'Europe/Paris')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_parse_pub_date_converts_offsets_to_local_time(paris):
+    assert parse_pub_date('Tue, 02 Oct 2024 10:00:00 +0200') == '2024-10-02T10:00:00'
+    assert parse_pub_date('Wed, 02 Oct 2024 08:00:00 GMT') == '2024-10-02T10:00:00'
+    assert parse_pub_date('2024-10-02T08:00:00Z') == '2024-10-02T10:00:00'
+    assert parse_pub_date('2024-10-02T03:00:00-05:00') == '2024-10-02T10:00:00'
+    # Heure d'hiver
+    assert parse_pub_date('2024-12-02T08:00:00+00:00') == '2024-12-02T09:00:00'
+
+
+def test_parse_pub_date_orders_across_timezones(paris):
+    earlier = parse_pub_date('Tue, 02 Oct 2024 10:00:00 +0200')
+    later = parse_pub_date('Tue, 02 Oct 2024 09:30:00 +0000')
+    assert earlier < later
+
+
+def test_parse_pub_date_keeps_naive_dates_and_rejects_garbage():
+    assert parse_pub_date('2024-03-05') == '2024-03-05T00:00:00'
+    assert parse_pub_date(' 2024-03-05T12:30:00 ') == '2024-03-05T12:30:00'
+    assert parse_pub_date('hier') is None
+    assert parse_pub_date('') is None
+    assert parse_pub_date(None) is None
+
+
+def test_seen_rss_by_guid_and_publication_date(paris):
+    store = WatermarkStore()
+    assert not store.seen_rss('senat', 'q-1', 'Tue, 02 Oct 2024 10:00:00 +0200')
+
+    store.mark_rss('senat', 'q-1')
+    assert store.seen_rss('senat', 'q-1', None)
+    assert not store.seen_rss('senat', 'q-2', 'Tue, 01 Oct 2024 10:00:00 +0200')
+    assert not store.seen_rss('assemblee', 'q-1', None)
+
+    store.mark_rss('senat', None, 'Tue, 02 Oct 2024 10:00:00 +0200')
+    assert store.seen_rss('senat', 'q-2', 'Tue, 01 Oct 2024 10:00:00 +0200')
+    # Même instant dans un autre fuseau : pas antérieur, donc pas encore vu
+    assert not store.seen_rss('senat', 'q-3', '2024-10-02T08:00:00Z')
+    assert not store.seen_rss('senat', 'q-4', None)
+    assert store.skipped == 2
+
+
+def test_seen_rss_publication_date_never_moves_back():
+    store = WatermarkStore()
+    store.mark_rss('senat', None, '2024-10-02T10:00:00')
+    store.mark_rss('senat', None, '2024-09-01T10:00:00')
+    assert store.get('rss:senat')['last_pub_date'] == '2024-10-02T10:00:00'
+
+
+def test_full_run_sees_nothing_but_keeps_marking():
+    store = WatermarkStore(full=True)
+    store.mark_rss('senat', 'q-1', '2024-10-02T10:00:00')
+    assert not store.seen_rss('senat', 'q-1', '2024-01-01')
+    assert store.get('rss:senat') == {'guids': ['q-1'], 'last_pub_date': '2024-10-02T10:00:00'}
+
+
+def test_guid_list_is_bounded(monkeypatch):
+    monkeypatch.setattr(WatermarkStore, 'MAX_GUIDS', 3)
+    store = WatermarkStore()
+    for n in range(5):
+        store.mark_rss('senat', f"q-{n}")
+    assert store.get('rss:senat')['guids'] == ['q-2', 'q-3', 'q-4']
+
+
+def test_is_new_and_mark():
+    store = WatermarkStore()
+    assert store.is_new('bofip:a', '2024-01-01')
+    store.mark('bofip:a', '2024-02-01')
+    store.mark('bofip:a', '2024-01-01')
+    assert not store.is_new('bofip:a', '2024-02-01')
+    assert store.is_new('bofip:a', '2024-03-01')
+    assert store.is_new('bofip:a', None)
+
+
+def test_merge_keeps_latest_marks_and_least_advanced_cursor(tmp_path):
+    mine = WatermarkStore(str(tmp_path / 'a.json'))
+    mine.mark('legifrance:1', '2024-01-01')
+    mine.mark_rss('senat', 'q-1', '2024-10-01T00:00:00')
+    mine.update('judilibre', day='2024-10-05', batch=2)
+
+    theirs = WatermarkStore(str(tmp_path / 'b.json'))
+    theirs.mark('legifrance:1', '2024-06-01')
+    theirs.mark('legifrance:2', '2024-02-01')
+    theirs.mark_rss('senat', 'q-2', '2024-09-01T00:00:00')
+    theirs.mark_rss('senat', 'q-1')
+    theirs.update('judilibre', day='2024-10-03', batch=7)
+
+    mine.merge(theirs)
+    assert mine.get('legifrance:1') == {'stamp': '2024-06-01'}
+    assert mine.get('legifrance:2') == {'stamp': '2024-02-01'}
+    assert mine.get('rss:senat') == {'guids': ['q-1', 'q-2'], 'last_pub_date': '2024-10-01T00:00:00'}
+    assert mine.get('judilibre') == {'day': '2024-10-03', 'batch': 7}
+
+
+def test_save_and_reload(tmp_path):
+    path = str(tmp_path / 'watermarks.json')
+    store = WatermarkStore(path)
+    store.mark_rss('senat', 'q-1', '2024-10-02T10:00:00')
+    store.save()
+    assert WatermarkStore(path).seen_rss('senat', 'q-1', None)
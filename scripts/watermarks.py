@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+import metrics
+from http_cache import cache_dir
+
+logger = logging.getLogger(__name__)
+
+
+def parse_pub_date(value):
+    """Convertit une date RSS (RFC 822) ou ISO 8601 en chaîne ISO comparable"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed.isoformat()
+
+
+class WatermarkStore:
+    """Marques de niveau haut par source, persistées entre deux exécutions.
+
+    Pour un flux RSS : dernière ``pubDate`` traitée et derniers ``guid`` vus.
+    Pour une page BOFIP : dernier tampon de publication. Pour Légifrance :
+    dernière date de version traitée. Avec ``full=True``, rien n'est considéré
+    comme déjà vu, mais les marques continuent d'être mises à jour.
+    """
+
+    MAX_GUIDS = 2000
+
+    def __init__(self, path=None, full=False):
+        self.path = path or os.path.join(cache_dir(), 'watermarks.json')
+        self.full = full
+        self.skipped = 0
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self._marks = json.load(f)
+        except (OSError, ValueError):
+            self._marks = {}
+
+    def get(self, source):
+        with self._lock:
+            return dict(self._marks.get(source, {}))
+
+    def update(self, source, **values):
+        with self._lock:
+            self._marks.setdefault(source, {}).update(values)
+
+    # --- Flux RSS ---------------------------------------------------------
+
+    def seen_rss(self, source, guid, pub_date):
+        """Vrai si l'élément a déjà été traité lors d'une exécution précédente"""
+        if self.full:
+            return False
+        mark = self.get(f"rss:{source}")
+        seen = bool(guid) and guid in mark.get('guids', [])
+        pub_date = parse_pub_date(pub_date)
+        if not seen and pub_date and mark.get('last_pub_date'):
+            seen = pub_date < mark['last_pub_date']
+        if seen:
+            self.skipped += 1
+            metrics.duplicates_skipped().inc(reason='watermark')
+        return seen
+
+    def mark_rss(self, source, guid, pub_date=None):
+        """Enregistre un élément traité ; ``pub_date`` ne doit être donnée qu'une fois
+        tous les éléments plus anciens du flux traités, car elle masque ceux-ci"""
+        pub_date = parse_pub_date(pub_date)
+        with self._lock:
+            mark = self._marks.setdefault(f"rss:{source}", {})
+            if guid:
+                guids = mark.setdefault('guids', [])
+                if guid not in guids:
+                    guids.append(guid)
+                    del guids[:-self.MAX_GUIDS]
+            if pub_date and pub_date > mark.get('last_pub_date', ''):
+                mark['last_pub_date'] = pub_date
+
+    # --- Tampons datés (BOFIP, Légifrance) --------------------------------
+
+    def is_new(self, source, stamp):
+        """Vrai si ``stamp`` est postérieur à la marque enregistrée (ou inconnu)"""
+        if self.full or stamp is None:
+            return True
+        last = self.get(source).get('stamp')
+        if last is not None and stamp <= last:
+            self.skipped += 1
+            metrics.duplicates_skipped().inc(reason='watermark')
+            return False
+        return True
+
+    def mark(self, source, stamp):
+        if stamp is None:
+            return
+        with self._lock:
+            mark = self._marks.setdefault(source, {})
+            if mark.get('stamp') is None or stamp > mark['stamp']:
+                mark['stamp'] = stamp
+
+    # --- Fragments -----------------------------------------------------------
+
+    def merge(self, other):
+        """Intègre les marques d'une autre exécution (par exemple d'un autre fragment) :
+        tampons et dates les plus récents, guid réunis, curseur le moins avancé"""
+        with other._lock:
+            marks = json.loads(json.dumps(other._marks))
+        with self._lock:
+            for source, theirs in marks.items():
+                mine = self._marks.setdefault(source, {})
+                for name in ('stamp', 'last_pub_date'):
+                    if theirs.get(name) is not None and (mine.get(name) is None or theirs[name] > mine[name]):
+                        mine[name] = theirs[name]
+                if 'guids' in theirs:
+                    guids = mine.setdefault('guids', [])
+                    known = set(guids)
+                    guids.extend(guid for guid in theirs['guids'] if guid not in known)
+                    del guids[:-self.MAX_GUIDS]
+                if 'day' in theirs and (
+                    'day' not in mine
+                    or (theirs['day'], theirs.get('batch', 0)) < (mine['day'], mine.get('batch', 0))
+                ):
+                    mine['day'], mine['batch'] = theirs['day'], theirs.get('batch', 0)
+
+    def save(self):
+        """Écrit les marques de façon atomique"""
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._marks, f, ensure_ascii=False, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        logger.info(f"Marques de collecte enregistrées ({self.skipped} éléments déjà vus ignorés)")
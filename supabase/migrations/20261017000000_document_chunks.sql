@@ -0,0 +1,28 @@
+-- Stockage différentiel des documents par paragraphes (COLLECTOR_DELTA_STORAGE=1)
+
+alter table documents add column if not exists current_version integer;
+create index if not exists documents_source_url_idx on documents (source_url);
+
+-- Paragraphes normalisés, adressés par leur empreinte au sein d'un document
+create table if not exists document_chunks (
+    id bigint generated by default as identity primary key,
+    document_id bigint not null references documents (id) on delete cascade,
+    chunk_hash text not null,
+    content text not null,
+    version integer not null,
+    created_at timestamptz not null default now(),
+    unique (document_id, chunk_hash)
+);
+
+-- Une ligne par version : empreintes ordonnées des paragraphes de la version
+create table if not exists document_versions (
+    id bigint generated by default as identity primary key,
+    document_id bigint not null references documents (id) on delete cascade,
+    version integer not null,
+    chunk_hashes jsonb not null,
+    content_hash text not null,
+    added_chunks integer not null default 0,
+    removed_chunks integer not null default 0,
+    created_at timestamptz not null default now(),
+    unique (document_id, version)
+);
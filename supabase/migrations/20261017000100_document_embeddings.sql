@@ -0,0 +1,18 @@
+-- Vecteurs des passages des documents (COLLECTOR_EMBEDDINGS=1), modèle mistral-embed
+
+create extension if not exists vector;
+
+create table if not exists document_embeddings (
+    id bigint generated by default as identity primary key,
+    document_id bigint not null references documents (id) on delete cascade,
+    chunk_hash text not null,
+    position integer not null,
+    content text not null,
+    model text not null,
+    embedding vector(1024) not null,
+    created_at timestamptz not null default now(),
+    unique (document_id, chunk_hash)
+);
+
+create index if not exists document_embeddings_embedding_idx
+    on document_embeddings using hnsw (embedding vector_cosine_ops);
@@ -0,0 +1,8 @@
+-- Catégories des articles collectés dans Légifrance : articles de codes et textes non codifiés (lois, décrets)
+insert into document_categories (name)
+select 'Article de code'
+where not exists (select 1 from document_categories where name = 'Article de code');
+
+insert into document_categories (name)
+select 'Texte législatif'
+where not exists (select 1 from document_categories where name = 'Texte législatif');
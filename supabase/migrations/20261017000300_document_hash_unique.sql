@@ -0,0 +1,25 @@
+-- Unicité de l'empreinte des documents : DocumentWriter écrit en upsert sur
+-- document_hash (COLLECTOR_UPSERT=1), ce qu'ON CONFLICT refuse sans index unique
+
+-- Aucune suppression automatique : les doublons existants (avec leurs paragraphes,
+-- versions et vecteurs) sont à fusionner à la main avant de relancer la migration
+do $$
+declare
+    duplicates text;
+begin
+    select string_agg(format('%s : documents %s', document_hash, ids), E'\n')
+    into duplicates
+    from (
+        select document_hash, string_agg(id::text, ', ' order by id) as ids
+        from documents
+        group by document_hash
+        having count(*) > 1
+    ) as duplicated;
+
+    if duplicates is not null then
+        raise exception 'Empreintes de documents en double, index unique non créé :%', E'\n' || duplicates;
+    end if;
+end
+$$;
+
+create unique index if not exists documents_document_hash_key on documents (document_hash);
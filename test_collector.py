@@ -1,9 +1,12 @@
 import os
-import requests
+import sys
 import json
 import logging
 from datetime import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+from piste_client import PisteClient
+
 # Configuration du logging
 logging.basicConfig(
     level=logging.INFO,
@@ -15,29 +18,10 @@ def test_collect_dutreil():
     """Test de collecte des documents sur le Pacte Dutreil"""
     try:
         # 1. Obtention du token
-        logger.info("Tentative d'obtention du token OAuth...")
-        token_url = "https://oauth.piste.gouv.fr/api/oauth/token"
-        token_data = {
-            'grant_type': 'client_credentials',
-            'client_id': os.environ.get("LEGIFRANCE_CLIENT_ID"),
-            'client_secret': os.environ.get("LEGIFRANCE_CLIENT_SECRET"),
-            'scope': 'openid'
-        }
-        
-        token_response = requests.post(token_url, data=token_data)
-        logger.info(f"Réponse du serveur OAuth: {token_response.status_code}")
+        client = PisteClient()
         
-        if token_response.status_code == 200:
-            token = token_response.json()['access_token']
-            logger.info("Token OAuth obtenu avec succès")
-            
+        if client.authenticate():
             # 2. Recherche de documents
-            headers = {
-                'Authorization': f'Bearer {token}',
-                'accept': 'application/json',
-                'Content-Type': 'application/json'
-            }
-            
             # Payload pour le Pacte Dutreil
             search_payload = {
                 "recherche": {
@@ -73,12 +57,7 @@ def test_collect_dutreil():
             }
             
             logger.info("Recherche de documents sur le Pacte Dutreil...")
-            search_url = "https://api.piste.gouv.fr/dila/legifrance/lf-engine-app/search"
-            search_response = requests.post(
-                search_url,
-                headers=headers,
-                json=search_payload
-            )
+            search_response = client.post("/search", json=search_payload)
             
             logger.info(f"Statut de la recherche: {search_response.status_code}")
             
@@ -93,14 +72,14 @@ def test_collect_dutreil():
                     if titles:
                         logger.info(f"\nDocument trouvé:")
                         logger.info(f"Titre: {titles[0].get('title', 'Sans titre')}")
-                        logger.info(f"ID: {titles[0].get('id', 'Pas d\'ID')}")
+                        logger.info(f"ID: {titles[0].get('id', 'Pas d’ID')}")
                         logger.info(f"Statut: {titles[0].get('legalStatus', 'Statut inconnu')}")
                         logger.info("-" * 50)
             else:
                 logger.error(f"Erreur lors de la recherche: {search_response.text}")
         
         else:
-            logger.error(f"Erreur d'authentification: {token_response.text}")
+            logger.error("Erreur d'authentification")
             
     except Exception as e:
         logger.error(f"Erreur lors du test: {str(e)}")